@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''In-process probing using PyAV (libav* bindings)
+
+Produces the same dictionary layout as `ffprobe -print_format json
+-show_format -show_streams -show_chapters` without spawning a process.
+'''
+
+__all__ = [
+        'HAVE_AV',
+        'HAVE_AV_CHAPTERS',
+        'probe_dict',
+        ]
+
+from fractions import Fraction
+import os
+
+import logging
+log = logging.getLogger(__name__)
+
+HAVE_AV = False
+HAVE_AV_CHAPTERS = False
+try:
+    import av
+    HAVE_AV = True
+    HAVE_AV_CHAPTERS = hasattr(av.container.InputContainer, 'chapters')
+except ImportError:
+    pass
+
+AV_TIME_BASE = 1000000
+
+# libavformat/avformat.h AV_DISPOSITION_*
+_disposition_bits = (
+    ('default', 0x0001),
+    ('dub', 0x0002),
+    ('original', 0x0004),
+    ('comment', 0x0008),
+    ('lyrics', 0x0010),
+    ('karaoke', 0x0020),
+    ('forced', 0x0040),
+    ('hearing_impaired', 0x0080),
+    ('visual_impaired', 0x0100),
+    ('clean_effects', 0x0200),
+    ('attached_pic', 0x0400),
+    ('timed_thumbnails', 0x0800),
+    ('captions', 0x10000),
+    ('descriptions', 0x20000),
+    ('metadata', 0x40000),
+    ('dependent', 0x80000),
+    ('still_image', 0x100000),
+)
+
+
+def _time_str(ts, time_base):
+    if ts is None or time_base is None:
+        return None
+    return '%.6f' % (ts * time_base,)
+
+
+def _ratio_str(value, sep='/'):
+    if value is None:
+        return None
+    value = Fraction(value)
+    return f'{value.numerator}{sep}{value.denominator}'
+
+
+def _set(d, key, value):
+    # ffprobe omits unavailable (N/A) values from its json output
+    if value is not None:
+        d[key] = value
+
+
+def _disposition_dict(av_stream):
+    disposition = getattr(av_stream, 'disposition', None)
+    if disposition is None:
+        return None
+    disposition = int(disposition)
+    return {name: int(bool(disposition & bit))
+            for name, bit in _disposition_bits}
+
+
+def _stream_dict(av_stream):
+    codec_context = av_stream.codec_context
+    codec = getattr(codec_context, 'codec', None)
+    d = {}
+    d['index'] = av_stream.index
+    _set(d, 'codec_name', getattr(codec, 'name', None) or getattr(codec_context, 'name', None))
+    _set(d, 'codec_long_name', getattr(codec, 'long_name', None))
+    _set(d, 'profile', getattr(codec_context, 'profile', None))
+    d['codec_type'] = av_stream.type
+    codec_tag = getattr(codec_context, 'codec_tag', None)
+    if codec_tag:
+        d['codec_tag_string'] = codec_tag
+    time_base = av_stream.time_base
+    if av_stream.type == 'video':
+        _set(d, 'width', codec_context.width or None)
+        _set(d, 'height', codec_context.height or None)
+        _set(d, 'has_b_frames', getattr(codec_context, 'has_b_frames', None))
+        sample_aspect_ratio = getattr(av_stream, 'sample_aspect_ratio', None) \
+            or getattr(codec_context, 'sample_aspect_ratio', None)
+        _set(d, 'sample_aspect_ratio', _ratio_str(sample_aspect_ratio, ':'))
+        _set(d, 'display_aspect_ratio', _ratio_str(getattr(av_stream, 'display_aspect_ratio', None)
+                                                   or getattr(codec_context, 'display_aspect_ratio', None), ':'))
+        _set(d, 'pix_fmt', getattr(codec_context, 'pix_fmt', None))
+        _set(d, 'level', getattr(codec_context, 'level', None))
+        field_order = getattr(codec_context, 'field_order', None)
+        if field_order is not None:
+            d['field_order'] = str(getattr(field_order, 'name', field_order)).lower()
+    elif av_stream.type == 'audio':
+        _set(d, 'sample_fmt', getattr(getattr(codec_context, 'format', None), 'name', None))
+        if codec_context.sample_rate:
+            d['sample_rate'] = str(codec_context.sample_rate)
+        _set(d, 'channels', codec_context.channels or None)
+        _set(d, 'channel_layout', getattr(getattr(codec_context, 'layout', None), 'name', None))
+    elif av_stream.type == 'subtitle':
+        _set(d, 'width', getattr(codec_context, 'width', None) or None)
+        _set(d, 'height', getattr(codec_context, 'height', None) or None)
+    _set(d, 'r_frame_rate', _ratio_str(getattr(av_stream, 'guessed_rate', None) or getattr(av_stream, 'base_rate', None)))
+    _set(d, 'avg_frame_rate', _ratio_str(getattr(av_stream, 'average_rate', None)))
+    _set(d, 'time_base', _ratio_str(time_base))
+    _set(d, 'start_pts', av_stream.start_time)
+    _set(d, 'start_time', _time_str(av_stream.start_time, time_base))
+    _set(d, 'duration_ts', av_stream.duration)
+    _set(d, 'duration', _time_str(av_stream.duration, time_base))
+    bit_rate = getattr(codec_context, 'bit_rate', None)
+    if bit_rate:
+        d['bit_rate'] = str(bit_rate)
+    frames = getattr(av_stream, 'frames', None)
+    if frames:
+        d['nb_frames'] = str(frames)
+    _set(d, 'disposition', _disposition_dict(av_stream))
+    if av_stream.metadata:
+        d['tags'] = dict(av_stream.metadata)
+    return d
+
+
+def _chapter_dicts(av_file):
+    chapters = []
+    for av_chapter in av_file.chapters():
+        time_base = av_chapter['time_base']
+        d = {
+            'id': av_chapter['id'],
+            'time_base': _ratio_str(time_base),
+            'start': av_chapter['start'],
+            'start_time': _time_str(av_chapter['start'], time_base),
+            'end': av_chapter['end'],
+            'end_time': _time_str(av_chapter['end'], time_base),
+        }
+        if av_chapter.get('metadata'):
+            d['tags'] = dict(av_chapter['metadata'])
+        chapters.append(d)
+    return chapters
+
+
+def _format_dict(av_file, file_name):
+    av_format = av_file.format
+    d = {}
+    d['filename'] = os.fspath(file_name)
+    d['nb_streams'] = len(av_file.streams)
+    d['nb_programs'] = 0
+    d['format_name'] = av_format.name
+    _set(d, 'format_long_name', av_format.long_name)
+    _set(d, 'start_time', _time_str(av_file.start_time, Fraction(1, AV_TIME_BASE)))
+    _set(d, 'duration', _time_str(av_file.duration, Fraction(1, AV_TIME_BASE)))
+    try:
+        d['size'] = str(os.stat(file_name).st_size)
+    except OSError:
+        pass
+    if av_file.bit_rate:
+        d['bit_rate'] = str(av_file.bit_rate)
+    if av_file.metadata:
+        d['tags'] = dict(av_file.metadata)
+    return d
+
+
+def probe_dict(file_name, *, show_streams=True, show_format=True, show_chapters=True, show_error=True):
+    '''Return an ffprobe-shaped dictionary describing file_name.
+
+    Raises an exception if PyAV is not available or the information can't be
+    reliably reproduced, in which case the caller should fall back to
+    running ffprobe.
+    '''
+    if not HAVE_AV:
+        raise ValueError('PyAV not available')
+    if show_chapters and not HAVE_AV_CHAPTERS:
+        raise ValueError('Chapters not supported by this version of PyAV')
+    file_name = os.fspath(file_name)
+    probe = {}
+    with av.open(file_name) as av_file:
+        if show_streams:
+            probe['streams'] = [_stream_dict(av_stream)
+                                for av_stream in av_file.streams]
+        if show_chapters:
+            probe['chapters'] = _chapter_dicts(av_file)
+        if show_format:
+            probe['format'] = _format_dict(av_file, file_name)
+    return probe
@@ -9,6 +9,7 @@
 
 from pathlib import Path
 import argparse
+import concurrent.futures
 import logging
 import os
 import pexpect
@@ -19,9 +20,11 @@ import musicbrainzngs
 import urllib
 import sys
 import struct
+import threading
 
 from qip.app import app
 from qip.cdda import *
+from qip.cdmeta import MetadataLookup
 from qip.exec import *
 from qip.file import *
 from qip.mm import *
@@ -55,6 +58,8 @@ def main():
                         #default="wav",
                         #required=True,  # TODO Fix required with value from config file
                         help='output format', choices=['wav', 'm4a', 'flac'])
+    pgroup.add_bool_argument('--batch', default=False, help='batch mode: rip all cue files found in the given files and directories', neg_help='rip only the given cue files')
+    pgroup.add_argument('--jobs', '-j', type=int, default=None, help='number of parallel encoders (batch mode)')
     xgroup = pgroup.add_mutually_exclusive_group()
     xgroup.add_argument('--logging_level', default=argparse.SUPPRESS, help='set logging level')
     xgroup.add_argument('--quiet', '-q', dest='logging_level', default=argparse.SUPPRESS, action='store_const', const=logging.WARNING, help='quiet mode')
@@ -72,10 +77,15 @@ def main():
     pgroup.add_argument('--cddb-discid', dest='cddb_discid', default=None, help='specify CDDB discid')
     pgroup.add_argument('--barcode', default=None, help='specify barcode')
     pgroup.add_argument('--country', dest='country_list', default=None, nargs='*', help='specify country list')
+    pgroup.add_argument('--metadata-dir', default=None, type=Path, help='local metadata store directory (default: cache directory)')
+    pgroup.add_bool_argument('--offline', default=False, help='only use the local metadata store', neg_help='query the network when not in the local metadata store')
     # }}}
 
     def _cue_file_Path(value):
         path = Path(value)
+        if path.is_dir():
+            # Batch mode
+            return path
         if path.suffix == '.bin':
             path = path.with_suffix('.cue')
         value = os.fspath(path)
@@ -92,9 +102,28 @@ def main():
         if prog and not shutil.which(prog):
             raise Exception('%s: command not found' % (prog,))
 
-    if app.args.action == 'bincuerip':
+    if app.args.action == 'bincuerip' and app.args.batch:
+        if not app.args.cue_files:
+            raise Exception('No CUE file or directory names provided')
+        if app.args.musicbrainz_discid or app.args.cddb_discid:
+            app.parser.error('--mb-discid and --cddb-discid only apply to a single disc; Not supported with --batch')
+        if not app.args.format:
+            app.parser.error('the following argument is required: --format')
+        batch = BinCueBatch(
+            format=app.args.format,
+            jobs=app.args.jobs,
+            use_tags=app.args.use_bincuetags,
+            lookup=MetadataLookup(store_dir=app.args.metadata_dir,
+                                  offline=app.args.offline),
+            yes=app.args.yes,
+        )
+        return batch.run(getattr(cue_file, 'file_name', cue_file) for cue_file in app.args.cue_files)
+    elif app.args.action == 'bincuerip':
         if not app.args.cue_files:
             raise Exception('No CUE file names provided')
+        for cue_file in app.args.cue_files:
+            if isinstance(cue_file, Path):
+                app.parser.error(f'{cue_file} is a directory; Use --batch')
         if app.args.use_bincuetags:
             for cue_file in app.args.cue_files:
                 prep_bincuetags(cue_file)
@@ -142,8 +171,9 @@ def bincuerip(cue_file, *, format, yes=False):
     else:
         album_tags = AlbumTags()
 
+    bin_file = BinaryFile(cue_file.file_name.with_name(cue_file.files[0].name))
+    rip_tracks = []
     for track_no, track in enumerate(cue_file.tracks, start=1):
-        bin_file = BinaryFile(cue_file.file_name.with_name(track.file.name))
 
         track_out_file = SoundFile.new_by_file_name(
             '{base}-{track_no:02d}.{format}'.format(
@@ -162,12 +192,188 @@ def bincuerip(cue_file, *, format, yes=False):
             summary += ''
         summary += f'[{track.length}]'
         app.log.info('Ripping %s (%s)...', track_out_file, summary)
-        track_out_file.rip_cue_track(track,
-                                     bin_file=bin_file,
-                                     tags=track_tags,
-                                     yes=yes)
+        rip_tracks.append((track_out_file, track, track_tags))
+
+    qip.wav.rip_cue_tracks(rip_tracks,
+                           bin_file=bin_file,
+                           yes=yes)
 
     return True
 
+class BinCueBatch(object):
+    """Rip many BIN/CUE discs concurrently.
+
+    Each disc goes through the parse, tags (disc ID and metadata lookup) and
+    rip (split, encode and tag tracks) stages. Discs are processed
+    `disc_jobs` at a time; Tracks of all discs are encoded on a shared pool
+    of `jobs` workers.
+
+    The progress of each disc is saved to a state file next to its cue file
+    so an interrupted batch resumes where it left off. Discs ripped without
+    metadata are marked as such and their tags are looked up again on the
+    next run.
+    """
+
+    state_suffix = '.ripstate'
+
+    def __init__(self, *, format, jobs=None, disc_jobs=None, use_tags=True, lookup=None, yes=False):
+        self.format = format
+        self.jobs = jobs or os.cpu_count()
+        self.disc_jobs = disc_jobs or 2
+        self.use_tags = use_tags
+        self.lookup = lookup if lookup is not None else MetadataLookup()
+        self.yes = yes
+        self._lock = threading.RLock()
+        self.encoder_executor = None
+
+    @staticmethod
+    def find_cue_files(paths):
+        cue_files = []
+        for path in paths:
+            path = Path(path)
+            if path.is_dir():
+                cue_files += sorted(path.rglob('*.cue'))
+            else:
+                cue_files.append(path)
+        return cue_files
+
+    def state_file(self, cue_path):
+        return json.JsonFile(Path(cue_path).with_suffix(self.state_suffix))
+
+    def load_state(self, cue_path):
+        try:
+            return self.state_file(cue_path).read_json()
+        except FileNotFoundError:
+            return None
+
+    def save_state(self, cue_path, state):
+        state_file = self.state_file(cue_path)
+        tmp_file = json.JsonFile(state_file.file_name.with_name('.' + state_file.file_name.name + '.tmp'))
+        with self._lock:
+            tmp_file.write_json(state)
+            os.replace(tmp_file.file_name, state_file.file_name)
+
+    def run(self, paths):
+        cue_files = self.find_cue_files(paths)
+        app.log.info('Ripping %d discs...', len(cue_files))
+        failed = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs,
+                                                   thread_name_prefix='encoder') as self.encoder_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.disc_jobs,
+                                                      thread_name_prefix='disc') as disc_executor:
+            futures = {disc_executor.submit(self.process_disc, cue_path): cue_path
+                       for cue_path in cue_files}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    app.log.error('%s: %s', futures[future], e)
+                    failed += 1
+        self.encoder_executor = None
+        if failed:
+            app.log.error('%d of %d discs failed', failed, len(cue_files))
+        return not failed
+
+    def process_disc(self, cue_path):
+        state = self.load_state(cue_path)
+        resuming = state is not None
+        if state is None:
+            state = {'stage': 'parse', 'tracks_done': []}
+        elif state['stage'] == 'done':
+            if state.get('no_metadata') and self.use_tags:
+                return self.retag_disc(cue_path, state)
+            app.log.verbose('%s: Already ripped.', cue_path)
+            return True
+        try:
+            cue_file = CDDACueSheetFile(cue_path)
+            cue_file.read()
+
+            state['stage'] = 'tags'
+            album_tags = self.disc_tags(cue_file, state)
+
+            state['stage'] = 'rip'
+            self.save_state(cue_path, state)
+            self.rip_disc(cue_file, album_tags, state,
+                          yes=self.yes or resuming)
+
+            state['stage'] = 'done'
+        except Exception as e:
+            state['error'] = str(e)
+            raise
+        else:
+            state.pop('error', None)
+        finally:
+            self.save_state(cue_path, state)
+        app.log.info('%s: Done.', cue_path)
+        return True
+
+    def disc_tags(self, cue_file, state):
+        if not self.use_tags:
+            return None
+        tags_file = json.JsonFile(cue_file.file_name.with_suffix('.tags'))
+        if not tags_file.exists():
+            import qip.bin.bincuetags
+            album_tags = qip.bin.bincuetags.bincuetags(cue_file, lookup=self.lookup, interactive=False)
+            if not tags_file.exists():
+                # No metadata found; Rip with placeholder tags, look up again next run.
+                state['no_metadata'] = True
+                return album_tags
+        state.pop('no_metadata', None)
+        return AlbumTags.json_load(tags_file)
+
+    def retag_disc(self, cue_path, state):
+        cue_file = CDDACueSheetFile(cue_path)
+        cue_file.read()
+        album_tags = self.disc_tags(cue_file, state)
+        if state.get('no_metadata'):
+            app.log.verbose('%s: Already ripped; Still no metadata.', cue_path)
+            return True
+        bin_file = self.bin_file(cue_file)
+        for track_no in state['tracks_done']:
+            track_out_file = self.track_out_file(bin_file, track_no)
+            app.log.info('Tagging %s...', track_out_file)
+            track_out_file.write_tags(tags=album_tags.tracks_tags[track_no])
+        self.save_state(cue_path, state)
+        app.log.info('%s: Tagged.', cue_path)
+        return True
+
+    def bin_file(self, cue_file):
+        assert len(cue_file.files) == 1, f'{cue_file}: Expected 1 source file, got {cue_file.files!r}'
+        assert cue_file.files[0].format is CDDACueSheetFile.FileFormatEnum.BINARY
+        return BinaryFile(cue_file.file_name.with_name(cue_file.files[0].name))
+
+    def track_out_file(self, bin_file, track_no):
+        return SoundFile.new_by_file_name(
+            '{base}-{track_no:02d}.{format}'.format(
+                base=os.path.splitext(os.fspath(bin_file.file_name))[0],
+                track_no=track_no,
+                format=self.format))
+
+    def rip_disc(self, cue_file, album_tags, state, *, yes=False):
+        bin_file = self.bin_file(cue_file)
+
+        tracks_done = set(state['tracks_done'])
+        track_nos = {}
+        rip_tracks = []
+        for track_no, track in enumerate(cue_file.tracks, start=1):
+            if track_no in tracks_done:
+                continue
+            track_out_file = self.track_out_file(bin_file, track_no)
+            track_tags = album_tags.tracks_tags[track_no] if album_tags is not None else None
+            track_nos[id(track)] = track_no
+            rip_tracks.append((track_out_file, track, track_tags))
+
+        def track_done(out_file, track):
+            app.log.verbose('%s: Done.', out_file)
+            with self._lock:
+                state['tracks_done'].append(track_nos[id(track)])
+                self.save_state(cue_file.file_name, state)
+
+        qip.wav.rip_cue_tracks(rip_tracks,
+                               bin_file=bin_file,
+                               yes=yes,
+                               executor=self.encoder_executor,
+                               track_done=track_done)
+
 if __name__ == "__main__":
     main()
@@ -25,6 +25,7 @@ from qip import argparse
 from qip import json
 from qip.app import app
 from qip.cdda import *
+from qip.cdmeta import MetadataLookup
 from qip.exec import *
 from qip.file import *
 from qip.mm import *
@@ -90,6 +91,9 @@ def main():
     pgroup.add_bool_argument('--cddb', dest='use_cddb', default=False, help='use CDDB (closed!)')
     pgroup.add_bool_argument('--musicbrainz', dest='use_musicbrainz', default=True, help='use MusicBrainz')
     pgroup.add_bool_argument('--cache', dest='use_cache', default=True, help='use caching')
+    pgroup.add_argument('--metadata-dir', default=None, type=Path, help='local metadata store directory (default: cache directory)')
+    pgroup.add_argument('--import-metadata', default=None, nargs='+', type=Path, help='import FreeDB (xmcd directory) or MusicBrainz (JSON lines) dumps into the local metadata store')
+    pgroup.add_bool_argument('--offline', default=False, help='only use the local metadata store', neg_help='query the network when not in the local metadata store')
 
     pgroup.add_argument('--mb-discid', dest='musicbrainz_discid', default=None, help='specify MusicBrainz discid')
     pgroup.add_argument('--mb-releaseid', dest='musicbrainz_releaseid', default=None, help='specify MusicBrainz releaseid')
@@ -116,15 +120,19 @@ def main():
             raise Exception('%s: command not found' % (prog,))
 
     if app.args.action == 'bincuetags':
+        lookup = metadata_lookup_from_args()
+        if app.args.import_metadata:
+            if lookup.store_dir is None:
+                raise Exception('No local metadata store to import into')
+            for dump_path in app.args.import_metadata:
+                app.log.info('Importing %s...', dump_path)
+                lookup.import_dump(dump_path)
+            if not app.args.cue_files:
+                return True
         if not app.args.cue_files:
             raise Exception('No CUE file names provided')
-        if app.args.use_cache:
-            if False:
-                # Parameters are not hashable!
-                musicbrainzngs.get_releases_by_discid = functools.lru_cache(typed=True)(musicbrainzngs.get_releases_by_discid)
-                musicbrainzngs.get_release_by_id = functools.lru_cache(typed=True)(musicbrainzngs.get_release_by_id)
         for cue_file in app.args.cue_files:
-            bincuetags(cue_file)
+            bincuetags(cue_file, lookup=lookup)
     else:
         raise ValueError('Invalid action \'%s\'' % (app.args.action,))
 
@@ -346,7 +354,16 @@ def cddbinfo_to_tags(album_tags, cddb_info):
         except ValueError as e:
             app.log.error(e)
 
-def bincuetags(cue_file):
+def metadata_lookup_from_args():
+    return MetadataLookup(
+        store_dir=getattr(app.args, 'metadata_dir', None),
+        offline=getattr(app.args, 'offline', False),
+        use_cache=getattr(app.args, 'use_cache', True),
+    )
+
+def bincuetags(cue_file, *, lookup=None, interactive=True):
+    if lookup is None:
+        lookup = metadata_lookup_from_args()
     if not isinstance(cue_file, CDDACueSheetFile):
         cue_file = CDDACueSheetFile(cue_file)
 
@@ -369,101 +386,92 @@ def bincuetags(cue_file):
     if app.args.use_musicbrainz:
         app.log.info('Querying MusicBrainz...')
         set_useragent(app.prog, app.version, app.contact)
-        try:
-            d = musicbrainzngs.get_releases_by_discid(
-                    discid.id,
-                    toc=discid.toc,
-                    includes=['artists', 'recordings', 'release-groups'],
-                    )
-            #d={'disc':
-            #    {'release-list': [
-            #        {
-            #            'packaging': 'Jewel Case',
-            #            'status': 'Official',
-            #            'quality': 'normal',
-            #            'asin': 'B00000JY9M',
-            #            'release-event-list': [{'area': {'iso-3166-1-code-list': ['US'], 'id': '489ce91b-6658-3307-9877-795b68554c98', 'name': 'United States', 'sort-name': 'United States'}, 'date': '1999-08-24'}],
-            #            'cover-art-archive': {'artwork': 'true', 'front': 'true', 'count': '2', 'back': 'true'},
-            #            'id': 'd4faf895-c0c0-45ab-a912-42e99672425f',
-            #            'title': 'Christina Aguilera',
-            #            'text-representation': {'language': 'eng', 'script': 'Latn'},
-            #            'medium-count': 1,
-            #            'country': 'US',
-            #            'medium-list': [{'disc-count': 15, 'disc-list': [{'id': '.sLNEoph1JD2Qc3Av5uSK8cbif4-', 'sectors': '209340'}, {'id': '05LvXK6i04M1j3kiBXNV0TET9_U-', 'sectors': '209490'}, {'id': '4lQBj33cLOjAKN80z6BFSEkN06c-', 'sectors': '208047'}, {'id': '6wGe70fCevmsNvASQkX3Ty7jGBY-', 'sectors': '209340'}, {'id': '8B9S916VNEODK4P5weQgM_IwIJo-', 'sectors': '209230'}, {'id': '8Y8_ezk0Djx_Si.1ubqtFWOBf4E-', 'sectors': '209350'}, {'id': 'CeWbtYPyDZDogQ1AJQP.6WCx_8g-', 'sectors': '209527'}, {'id': 'HkHc8wzQEuwGXZphJ_RKGKdDc3o-', 'sectors': '208085'}, {'id': 'M9zc50eiNXPkowKNO.pa_5FyLWI-', 'sectors': '209340'}, {'id': 'V_2jT25KMi8xqA4rVlwaHaq.CfI-', 'sectors': '209340'}, {'id': 'Z_0qeqthKdo3IX53K26Ep6OGTIU-', 'sectors': '210369'}, {'id': 'gCKyAvNkxL5FK0EXr.0ckLN0FOA-', 'sectors': '208047'}, {'id': 'hO07pF1acOAleHPXZljhZhBlPLo-', 'sectors': '209200'}, {'id': 'igBGRmnohBOe.S.oOjAnrYK7yfI-', 'sectors': '208077'}, {'id': 'rif7SkN0YELLexm8umpjTYD68mI-', 'sectors': '209562'}], 'position': '1', 'track-list': [], 'track-count': 12, 'format': 'CD'}],
-            #            'barcode': '078636769028',
-            #            'date': '1999-08-24',
-            #            'release-event-count': 1
-            #            },
-            #        ...
-            #        ],
-            #    'id': 'hO07pF1acOAleHPXZljhZhBlPLo-',
-            #    'release-count': 6,
-            #    'sectors': '209200'
-            #    }
-            #}
-
-            # {
-            #     'cdstub': {
-            #         'track-list': [
-            #             {'track_or_recording_length': '313373', 'title': 'Googoola', 'length': '313373'},
-            #             {'track_or_recording_length': '297706', 'title': 'Shakseti', 'length': '297706'},
-            #             {'track_or_recording_length': '314960', 'title': 'Nali', 'length': '314960'},
-            #             {'track_or_recording_length': '348533', 'title': 'Zooma', 'length': '348533'},
-            #             {'track_or_recording_length': '292706', 'title': 'Gowgawg', 'length': '292706'},
-            #             {'track_or_recording_length': '350213', 'title': 'Heavenly Mama', 'length': '350213'},
-            #             {'track_or_recording_length': '264653', 'title': 'Rain Dance', 'length': '264653'},
-            #             {'track_or_recording_length': '312986', 'title': 'Mayo', 'length': '312986'},
-            #             {'track_or_recording_length': '227960', 'title': 'Marry Me', 'length': '227960'},
-            #             {'track_or_recording_length': '255440', 'title': 'Come Back to Africa', 'length': '255440'}
-            #         ],
-            #         'id': 'dJCchRlRoQwXEdvoH9psmbvj.Y0-',
-            #         'title': 'Afrika: Survival of the Tribal Spirit',
-            #         'artist': 'John St. John'
-            #     }
-            # }
-
-            if 'cdstub' in d:
-                app.log.debug('Found musicbrainz cdstub...')
-                mbcdstub = d['cdstub']
-                album_tags = AlbumTags()
-                mbcdstub_to_tags(album_tags, mbcdstub)
-                #print('album_tags=%r' % (album_tags,))
-                for track_no, mbtrack in enumerate(mbcdstub['track-list'], start=1):
-                    track_tags = album_tags.tracks_tags[track_no]
-                    mbtrack_to_tags(track_tags, mbtrack)
-                    #print('track_tags=%r' % (track_tags,))
-                album_tags_list.append(album_tags)
-            else:
-                if 'disc' in d and 'release-list' in d['disc']:
-                    # Sometimes, there is no 'disc', collapse...
-                    d = d['disc']
-                if 'release-list' in d:
-                    app.log.debug('Found musicbrainz release-list...')
-                    for mbrel in d['release-list']:
-                        if app.args.barcode and mbrel.get('barcode', None) != app.args.barcode:
-                            continue
-                        if app.args.country_list and mbrel.get('country', None) not in app.args.country_list:
-                            continue
-                        mbrels[mbrel['id']] = mbrel.copy()
-                else:
-                    app.log.error('musicbrainzngs.get_releases_by_discid returned %r', d)
-        except musicbrainzngs.ResponseError as e:
-            if isinstance(e.cause, urllib.HTTPError):
-                if e.cause.code == 404:
-                    # Not found
-                    pass
-                else:
-                    #print('e.cause:%r' % (vars(e.cause),))
-                    #print('e.cause.hdrs:%r' % (vars(e.cause.hdrs),))
-                    raise
+        d = lookup.get_releases_by_discid(
+                discid.id,
+                toc=discid.toc,
+                includes=['artists', 'recordings', 'release-groups'],
+                )
+        #d={'disc':
+        #    {'release-list': [
+        #        {
+        #            'packaging': 'Jewel Case',
+        #            'status': 'Official',
+        #            'quality': 'normal',
+        #            'asin': 'B00000JY9M',
+        #            'release-event-list': [{'area': {'iso-3166-1-code-list': ['US'], 'id': '489ce91b-6658-3307-9877-795b68554c98', 'name': 'United States', 'sort-name': 'United States'}, 'date': '1999-08-24'}],
+        #            'cover-art-archive': {'artwork': 'true', 'front': 'true', 'count': '2', 'back': 'true'},
+        #            'id': 'd4faf895-c0c0-45ab-a912-42e99672425f',
+        #            'title': 'Christina Aguilera',
+        #            'text-representation': {'language': 'eng', 'script': 'Latn'},
+        #            'medium-count': 1,
+        #            'country': 'US',
+        #            'medium-list': [{'disc-count': 15, 'disc-list': [{'id': '.sLNEoph1JD2Qc3Av5uSK8cbif4-', 'sectors': '209340'}, {'id': '05LvXK6i04M1j3kiBXNV0TET9_U-', 'sectors': '209490'}, {'id': '4lQBj33cLOjAKN80z6BFSEkN06c-', 'sectors': '208047'}, {'id': '6wGe70fCevmsNvASQkX3Ty7jGBY-', 'sectors': '209340'}, {'id': '8B9S916VNEODK4P5weQgM_IwIJo-', 'sectors': '209230'}, {'id': '8Y8_ezk0Djx_Si.1ubqtFWOBf4E-', 'sectors': '209350'}, {'id': 'CeWbtYPyDZDogQ1AJQP.6WCx_8g-', 'sectors': '209527'}, {'id': 'HkHc8wzQEuwGXZphJ_RKGKdDc3o-', 'sectors': '208085'}, {'id': 'M9zc50eiNXPkowKNO.pa_5FyLWI-', 'sectors': '209340'}, {'id': 'V_2jT25KMi8xqA4rVlwaHaq.CfI-', 'sectors': '209340'}, {'id': 'Z_0qeqthKdo3IX53K26Ep6OGTIU-', 'sectors': '210369'}, {'id': 'gCKyAvNkxL5FK0EXr.0ckLN0FOA-', 'sectors': '208047'}, {'id': 'hO07pF1acOAleHPXZljhZhBlPLo-', 'sectors': '209200'}, {'id': 'igBGRmnohBOe.S.oOjAnrYK7yfI-', 'sectors': '208077'}, {'id': 'rif7SkN0YELLexm8umpjTYD68mI-', 'sectors': '209562'}], 'position': '1', 'track-list': [], 'track-count': 12, 'format': 'CD'}],
+        #            'barcode': '078636769028',
+        #            'date': '1999-08-24',
+        #            'release-event-count': 1
+        #            },
+        #        ...
+        #        ],
+        #    'id': 'hO07pF1acOAleHPXZljhZhBlPLo-',
+        #    'release-count': 6,
+        #    'sectors': '209200'
+        #    }
+        #}
+
+        # {
+        #     'cdstub': {
+        #         'track-list': [
+        #             {'track_or_recording_length': '313373', 'title': 'Googoola', 'length': '313373'},
+        #             {'track_or_recording_length': '297706', 'title': 'Shakseti', 'length': '297706'},
+        #             {'track_or_recording_length': '314960', 'title': 'Nali', 'length': '314960'},
+        #             {'track_or_recording_length': '348533', 'title': 'Zooma', 'length': '348533'},
+        #             {'track_or_recording_length': '292706', 'title': 'Gowgawg', 'length': '292706'},
+        #             {'track_or_recording_length': '350213', 'title': 'Heavenly Mama', 'length': '350213'},
+        #             {'track_or_recording_length': '264653', 'title': 'Rain Dance', 'length': '264653'},
+        #             {'track_or_recording_length': '312986', 'title': 'Mayo', 'length': '312986'},
+        #             {'track_or_recording_length': '227960', 'title': 'Marry Me', 'length': '227960'},
+        #             {'track_or_recording_length': '255440', 'title': 'Come Back to Africa', 'length': '255440'}
+        #         ],
+        #         'id': 'dJCchRlRoQwXEdvoH9psmbvj.Y0-',
+        #         'title': 'Afrika: Survival of the Tribal Spirit',
+        #         'artist': 'John St. John'
+        #     }
+        # }
+
+        if d is None:
+            # Not found
+            pass
+        elif 'cdstub' in d:
+            app.log.debug('Found musicbrainz cdstub...')
+            mbcdstub = d['cdstub']
+            album_tags = AlbumTags()
+            mbcdstub_to_tags(album_tags, mbcdstub)
+            #print('album_tags=%r' % (album_tags,))
+            for track_no, mbtrack in enumerate(mbcdstub['track-list'], start=1):
+                track_tags = album_tags.tracks_tags[track_no]
+                mbtrack_to_tags(track_tags, mbtrack)
+                #print('track_tags=%r' % (track_tags,))
+            album_tags_list.append(album_tags)
+        else:
+            if 'disc' in d and 'release-list' in d['disc']:
+                # Sometimes, there is no 'disc', collapse...
+                d = d['disc']
+            if 'release-list' in d:
+                app.log.debug('Found musicbrainz release-list...')
+                for mbrel in d['release-list']:
+                    if app.args.barcode and mbrel.get('barcode', None) != app.args.barcode:
+                        continue
+                    if app.args.country_list and mbrel.get('country', None) not in app.args.country_list:
+                        continue
+                    mbrels[mbrel['id']] = mbrel.copy()
             else:
-                raise
+                app.log.error('musicbrainzngs.get_releases_by_discid returned %r', d)
 
         app.log.debug('mbrels=%r', mbrels)
 
         for mbrelid, mbrel in mbrels.items():
             app.log.debug('Parsing musicbrainz release...')
-            mbrel2 = musicbrainzngs.get_release_by_id(
+            mbrel2 = lookup.get_release_by_id(
                 mbrelid,
                 includes=["artists", "artist-credits", "recordings", "discids", "labels"],
             )
@@ -551,7 +559,6 @@ def bincuetags(cue_file):
 
     cddbinfos = []
     if app.args.use_cddb:
-        from qip.extern import CDDB
         app.log.info('Querying FreeDB...')
         toc = [int(e) for e in discid.toc.split()]
         #print('toc=%r' % (toc,))
@@ -565,10 +572,12 @@ def bincuetags(cue_file):
             + list(discid.track_offsets) \
             + [total_time]
         #print('track_info=%r' % (track_info,))
-        query_status, query_info = CDDB.query(track_info)
+        query_status, query_info = lookup.cddb_query(track_info)
         #print('query_status=%r, query_info=%r' % (query_status, query_info))
         # query_status=200, query_info={'category': 'misc', 'title': 'Christina Aguilera / Christina Aguilera', 'disc_id': '8f0ae30c'}
-        if query_status == 200: # OK
+        if query_status == 202: # No match
+            pass
+        elif query_status == 200: # OK
             cddbinfos.append(query_info)
         elif query_status in (211, 210): # Multiple
             cddbinfos.extend(query_info)
@@ -577,7 +586,7 @@ def bincuetags(cue_file):
 
         for cddb_info in cddbinfos:
             app.log.debug('Found cddb info...')
-            read_status, read_info = CDDB.read(cddb_info['category'], cddb_info['disc_id'])
+            read_status, read_info = lookup.cddb_read(cddb_info['category'], cddb_info['disc_id'])
             #print('read_status=%r, read_info=%r' % (read_status, read_info))
             # read_status=210, read_info={'TTITLE7': "Somebody's Somebody", 'TTITLE11': 'Obvious', 'TTITLE8': 'When You Put Your Hands on Me', 'DTITLE': 'Christina Aguilera / Christina Aguilera', 'DISCID': '8f0ae30c', 'TTITLE0': 'Genie in a Bottle', 'TTITLE4': 'Come On Over Baby (All I Want Is You)', 'TTITLE10': 'Love Will Find a Way', 'submitted_via': 'ExactAudioCopy v0.99pb4', 'TTITLE6': 'Love for All Seasons', 'EXTT5': '', 'revision': 8, 'TTITLE1': 'What a Girl Wants', 'EXTT7': '', 'EXTT6': '', 'EXTT8': '', 'TTITLE2': 'I Turn to You', 'PLAYORDER': '', 'EXTT1': '', 'EXTT0': '', 'TTITLE3': 'So Emotional', 'EXTT9': '', 'EXTT2': '', 'EXTD': ' YEAR: 1999 ID3G: 13', 'EXTT4': '', 'TTITLE5': 'Reflection', 'EXTT10': '', 'TTITLE9': 'Blessed', 'EXTT11': '', 'DGENRE': 'Pop', 'DYEAR': '1999', 'disc_len': 2789, 'EXTT3': ''}
             if read_status in (200, 210, 211):
@@ -611,7 +620,12 @@ def bincuetags(cue_file):
 
     tags_file = json.JsonFile(cue_file.file_name.with_suffix('.tags'))
 
-    if album_tags_list:
+    if album_tags_list and not interactive:
+        if len(album_tags_list) > 1:
+            app.log.warning('%s: %d tags candidates found; Using the first one.', cue_file, len(album_tags_list))
+        album_tags = album_tags_list[0]
+
+    elif album_tags_list:
         album_tags_sel = 0
         with app.need_user_attention():
             from prompt_toolkit.formatted_text import FormattedText
@@ -700,6 +714,11 @@ def bincuetags(cue_file):
             track_tags = album_tags.tracks_tags[track_no]
             track_tags.setdefault('title', 'Track %0*d' % (len(str(len(cue_file.tracks))), track_no))
         cleanup_album_tags(album_tags)
+        if not interactive:
+            # Placeholders are not persisted so that a later run can still
+            # find the metadata (See bincuerip --batch)
+            app.log.info('Not writing %s', tags_file)
+            return album_tags
 
     app.log.info('Writing %s...', tags_file)
     tags_file.write_json(album_tags)
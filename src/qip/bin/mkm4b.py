@@ -28,7 +28,7 @@ from qip import argparse
 from qip.app import app
 from qip.cmp import *
 from qip.exec import *
-from qip.ffmpeg import ffmpeg
+from qip.ffmpeg import ffmpeg, ffprobe
 from qip.file import *
 from qip.flac import FlacFile
 from qip.img import ImageFile
@@ -217,6 +217,7 @@ def main():
     xgroup.add_argument('--verbose', '-v', dest='logging_level', default=argparse.SUPPRESS, action='store_const', const=logging.VERBOSE, help='verbose mode')
     xgroup.add_argument('--debug', '-d', dest='logging_level', default=argparse.SUPPRESS, action='store_const', const=logging.DEBUG, help='debug mode')
     pgroup.add_argument('--jobs', '-j', type=int, nargs='?', default=1, const=Auto, help='specifies the number of jobs (threads) to run simultaneously')
+    pgroup.add_argument('--probe-backend', default='ffprobe', choices=('ffprobe', 'av'), help='media probing backend (av: in-process using PyAV, falling back to ffprobe)')
 
     pgroup = app.parser.add_argument_group('Alternate Actions')
     xgroup = pgroup.add_mutually_exclusive_group()
@@ -266,6 +267,7 @@ def main():
 
     if getattr(app.args, 'action', None) is None:
         app.args.action = 'mkm4b'
+    ffprobe.probe_backend = app.args.probe_backend
     # app.log.debug('get_sox_app_support: %r', qip.mm.get_sox_app_support())
     # app.log.debug('get_vbr_formats: %r', get_vbr_formats())
     # app.log.debug('get_mp4v2_app_support: %r', qip.mm.get_mp4v2_app_support())
@@ -356,17 +358,27 @@ def mkm4b(inputfiles, default_tags):
             m4b.ffmpeg_container_format = 'ipod'
     m4b.tags.update(default_tags)
 
-    def task_extract_info(inputfile):
+    def task_extract_info(inputfile, ffprobe_dict=None):
         if not inputfile.file_name.is_file():
             raise OSError(errno.ENOENT, f'No such file: {inputfile}')
         app.log.info('Reading %s...', inputfile)
         need_actual_duration = True  # len(inputfiles) > 1)
-        inputfile.extract_info(need_actual_duration=need_actual_duration)
+        inputfile.extract_info(need_actual_duration=need_actual_duration,
+                               ffprobe_dict=ffprobe_dict)
         #inputfile.tags.picture = None
         #app.log.debug(inputfile)
     with save_and_restore_tcattr():
-        for x in thread_executor.map(task_extract_info, inputfiles):
-            pass
+        if ffprobe.probe_backend == 'av' or ffprobe.which(assert_found=False):
+            # Probe in batch; Failures are reported again by extract_info
+            probe_results = ffprobe.probe_many(inputfiles, jobs=app.args.jobs)
+        else:
+            probe_results = (ffprobe.ProbeResult(inputfile, None, None)
+                             for inputfile in inputfiles)
+        futures = [
+            thread_executor.submit(task_extract_info, probe_result.file, probe_result.ffprobe_dict)
+            for probe_result in probe_results]
+        for future in futures:
+            future.result()
 
     app.log.debug('inputfiles = %r', inputfiles)
     orig_inputfiles = inputfiles
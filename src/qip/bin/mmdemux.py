@@ -56,6 +56,7 @@
 from decimal import Decimal
 from fractions import Fraction
 from pathlib import Path
+import array
 import collections
 import concurrent.futures
 import contextlib
@@ -64,6 +65,8 @@ import decimal
 import errno
 import functools
 import glob
+import hashlib
+import heapq
 import html
 import io
 import itertools
@@ -92,7 +95,7 @@ from qip import threading
 from qip.app import app
 from qip.ccextractor import ccextractor
 from qip.cdrom import cdrom_ready
-from qip.ddrescue import ddrescue
+from qip.ddrescue import ddrescue, DdrescueMapWatcher
 from qip.exec import SpawnedProcessError, dbg_exec_cmd, do_exec_cmd, do_popen_cmd, do_spawn_cmd, clean_cmd_output, edfile, edvar, eddiff, xdg_open, list2cmdline, clean_file_name
 from qip.ffmpeg import ffmpeg, ffprobe
 from qip.file import toPath
@@ -112,6 +115,8 @@ from qip.utils import byte_decode, Ratio, round_half_away_from_zero, dict_from_s
 from qip.eject import eject
 import qip.file
 import qip.mm
+import qip.mpeg2video
+import qip.probecache
 import qip.utils
 
 qip.file.load_all_file_types()
@@ -413,25 +418,105 @@ def sync_iter_av_frames(av_stream_frames):
 
         yield av_stream, av_frame
 
+class VideoFrameColumns(object):
+    '''Column-oriented storage of the video frame properties used for analysis.
+
+    Only the timing and field flags are kept, in compact arrays, rather than
+    complete frame objects.
+    '''
+
+    _temporal_codes = ('B2', 'B3', 'T2', 'T3')
+
+    def __init__(self):
+        self.pkt_pos = array.array('q')
+        self.pts = array.array('q')
+        self.dts = array.array('q')
+        self.pkt_duration = array.array('q')
+        self.interlaced_frame = bytearray()
+        self.repeat_pict = bytearray()
+        self.top_field_first = bytearray()
+
+    _columns = (
+        'pkt_pos',
+        'pts',
+        'dts',
+        'pkt_duration',
+        'interlaced_frame',
+        'repeat_pict',
+        'top_field_first',
+    )
+
+    def append(self, av_frame):
+        pkt_pos = av_frame.pkt_pos
+        pts = av_frame.pts
+        dts = getattr(av_frame, 'dts', None)
+        pkt_duration = av_frame.pkt_duration
+        self.pkt_pos.append(-1 if pkt_pos is None else pkt_pos)
+        self.pts.append(pts)
+        self.dts.append(pts if dts is None else dts)
+        self.pkt_duration.append(pkt_duration or 0)
+        self.interlaced_frame.append(1 if av_frame.interlaced_frame else 0)
+        self.repeat_pict.append(min(av_frame.repeat_pict or 0, 255))
+        self.top_field_first.append(1 if av_frame.top_field_first else 0)
+
+    def __len__(self):
+        return len(self.pts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            columns = self.__class__.__new__(self.__class__)
+            for column in self._columns:
+                setattr(columns, column, getattr(self, column)[index])
+            return columns
+        return types.SimpleNamespace(**{
+            column: getattr(self, column)[index]
+            for column in self._columns})
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def temporal_string(self):
+        # Same as ('T' if top_field_first else 'B') + ('3' if repeat_pict else '2') for each frame
+        temporal_codes = self._temporal_codes
+        return ''.join([
+            temporal_codes[top_field_first << 1 | (repeat_pict != 0)]
+            for top_field_first, repeat_pict in zip(self.top_field_first, self.repeat_pict)])
+
+    @staticmethod
+    def all_same(column):
+        return not column or column.count(column[0]) == len(column)
+
 def ffprobe_iter_av_frames(file, stream_index=0):
 
+    av_stream = types.SimpleNamespace(
+        index=stream_index,
+    )
+
     for ff_frame in ffprobe.iter_frames(file,
+                                        entries=(
+                                            'pkt_pos',
+                                            'pkt_dts',
+                                            'pkt_pts',
+                                            'pts',
+                                            'pkt_duration',
+                                            'duration',
+                                            'interlaced_frame',
+                                            'repeat_pict',
+                                            'top_field_first',
+                                        ),
+                                        select_streams=stream_index,
                                         # [error] Failed to set value 'nvdec' for option 'hwaccel': Option not found
                                         # TODO default_ffmpeg_args=default_ffmpeg_args,
                                         ):
-        if ff_frame.stream_index != stream_index:
-            continue
         # assert frame.media_type == 'video', f'frame media type not video: {frame.media_type}'
 
-        av_stream = types.SimpleNamespace(
-            index=ff_frame.stream_index,
-        )
-
         av_frame = types.SimpleNamespace(
             pkt_pos=ff_frame.pkt_pos,
             dts=ff_frame.pkt_dts,
-            pts=ff_frame.pkt_pts,
-            pkt_duration=ff_frame.pkt_duration,
+            # Newer ffprobe versions report pts and duration instead of pkt_pts and pkt_duration
+            pts=ff_frame.pkt_pts if ff_frame.pkt_pts is not None else ff_frame.pts,
+            pkt_duration=ff_frame.pkt_duration if ff_frame.pkt_duration is not None else ff_frame.duration,
             interlaced_frame=ff_frame.interlaced_frame,
             repeat_pict=ff_frame.repeat_pict,
             top_field_first=ff_frame.top_field_first,
@@ -452,12 +537,57 @@ def iter_av_frames(file, stream_index=0, max_analyze_duration=100 * 1000000):
                 for av_frame in av_packet.decode():
                     yield av_stream, av_frame
 
+def iter_av_packet_frames(file, stream_index=0, max_analyze_duration=100 * 1000000, reorder_depth=16):
+    '''Iterate frame timing and field flags parsed from packet headers, without decoding.
+
+    Only supports codecs listed in qip.mpeg2video.supported_codec_names.
+    Packets are demuxed in decode order; They are reordered by pts to match
+    the presentation order of decoded frames.
+    '''
+    with av.open(os.fspath(file)) as av_file:
+        ffmpeg.fflags_arguments_to_av_file(av_file, app.args.fflags)
+        av_file.max_analyze_duration = max_analyze_duration
+        for av_stream in av_file.streams:
+            if av_stream.index != stream_index:
+                continue
+            codec_name = av_stream.codec_context.name
+            if codec_name not in qip.mpeg2video.supported_codec_names:
+                raise NotImplementedError(f'Packet header parsing not supported for codec {codec_name}')
+            flags_parser = qip.mpeg2video.Mpeg2PictureFlagsParser()
+            reorder_heap = []
+            last_sort_pts = 0
+            for packet_num, av_packet in enumerate(av_file.demux(av_stream)):
+                if not av_packet.size:
+                    continue  # flush packet
+                flags = flags_parser.parse(av_packet)
+                if flags is None:
+                    continue
+                av_frame = types.SimpleNamespace(
+                    pkt_pos=av_packet.pos,
+                    dts=av_packet.dts,
+                    pts=av_packet.pts,
+                    pkt_duration=av_packet.duration,
+                    interlaced_frame=flags.interlaced_frame,
+                    repeat_pict=flags.repeat_pict,
+                    top_field_first=flags.top_field_first,
+                )
+                sort_pts = av_frame.pts if av_frame.pts is not None else av_frame.dts
+                if sort_pts is None:
+                    sort_pts = last_sort_pts
+                last_sort_pts = sort_pts
+                heapq.heappush(reorder_heap, (sort_pts, packet_num, av_frame))
+                if len(reorder_heap) > reorder_depth:
+                    yield av_stream, heapq.heappop(reorder_heap)[2]
+            while reorder_heap:
+                yield av_stream, heapq.heappop(reorder_heap)[2]
+
 try:
     import av
 except ImportError as e:
     app.log.warning(f'PyAV not found: {e}')
     app.log.warning(f'Will use slower analysis using ffprobe.')
     iter_av_frames = ffprobe_iter_av_frames
+    iter_av_packet_frames = None
 
 def analyze_field_order_and_framerate(
         *,
@@ -470,7 +600,7 @@ def analyze_field_order_and_framerate(
     input_framerate = None
     framerate = getattr(app.args, 'force_framerate', None)
 
-    video_frames = []
+    video_frames = VideoFrameColumns()
 
     if stream_dict:
         if framerate is None:
@@ -513,14 +643,21 @@ def analyze_field_order_and_framerate(
                     progress_bar = ProgressBar('iterate frames',
                                            max=float(video_analyze_duration),
                                            suffix='%(index)d/%(max)d (%(eta_td)s remaining)')
+                av_stream = None
                 try:
 
-                    video_frames = []
+                    video_frames = VideoFrameColumns()
 
-                    av_stream_frames = iter_av_frames(stream_file)
+                    if iter_av_packet_frames is not None \
+                            and app.args.video_analyze_packets \
+                            and ffprobe_stream_json.get('codec_name') in qip.mpeg2video.supported_codec_names:
+                        # Field flags are available from the bitstream headers; No need to decode
+                        av_stream_frames = iter_av_packet_frames(stream_file)
+                    else:
+                        av_stream_frames = iter_av_frames(stream_file)
                     av_stream_frames = sync_iter_av_frames(av_stream_frames)
                     for av_stream, av_frame in av_stream_frames:
-                        video_frames.append((av_stream, av_frame))
+                        video_frames.append(av_frame)
 
                         float_pts_time = float(calc_packet_time(av_frame.pts, time_base))
                         if progress_bar is not None:
@@ -544,9 +681,7 @@ def analyze_field_order_and_framerate(
             # Based on libmediainfo-18.12/Source/MediaInfo/Video/File_Mpegv.cpp
             # though getting the proper TemporalReference is more complex and may
             # be different than dts_time ordering.
-            temporal_string = ''.join([
-                ('T' if av_frame.top_field_first else 'B') + ('3' if av_frame.repeat_pict else '2')
-                for av_stream, av_frame in video_frames])
+            temporal_string = video_frames.temporal_string()
             app.log.debug('temporal_string: %r', temporal_string)
 
             if field_order is None and '3' in temporal_string:
@@ -564,7 +699,7 @@ def analyze_field_order_and_framerate(
                     found_frame_count = len(temporal_pattern) // 2
                     found_frames = video_frames[found_frame_offset:found_frame_offset + found_frame_count]
                     if app.log.isEnabledFor(logging.DEBUG):
-                        app.log.debug('found_frames: \n%s', pprint.pformat([av_stream_frame_timing_str(av_stream, av_frame) for av_stream, av_frame in found_frames]))
+                        app.log.debug('found_frames: \n%s', pprint.pformat([av_stream_frame_timing_str(av_stream, av_frame) for av_frame in found_frames]))
                     field_order = result_field_order
                     interlacement = result_interlacement
                     # framerate = FrameRate(1 / (
@@ -577,8 +712,8 @@ def analyze_field_order_and_framerate(
                     #    len(found_frames)) * time_base))
                     #framerate = framerate.round_common()
                     found_pkt_duration_times = [
-                            round_packet_time(calc_packet_time(av_frame.pkt_duration, time_base))
-                            for av_stream, av_frame in found_frames]
+                            round_packet_time(calc_packet_time(pkt_duration, time_base))
+                            for pkt_duration in found_frames.pkt_duration]
                     found_pkt_duration_times = sorted(found_pkt_duration_times)
                     if found_pkt_duration_times in (
                             sorted([Decimal('0.033000'), Decimal('0.050000')] * 4),
@@ -591,8 +726,7 @@ def analyze_field_order_and_framerate(
                     if temporal_pattern_offset <= 24:
                         # starts with pulldown
                         app.log.warning('Detected field order %s at %s (%.3f) fps based on temporal pattern near start of analysis section %r', field_order, framerate, framerate, temporal_pattern)
-                        last_av_stream, last_av_frame = video_frames[-1]
-                        last_av_frame_pkt_duration_time = round_packet_time(calc_packet_time(last_av_frame.pkt_duration, time_base))
+                        last_av_frame_pkt_duration_time = round_packet_time(calc_packet_time(video_frames.pkt_duration[-1], time_base))
                         if temporal_string.endswith('T2' * 12):
                             if last_av_frame_pkt_duration_time in (
                                         Decimal('0.033367'),
@@ -626,13 +760,11 @@ def analyze_field_order_and_framerate(
                     break
 
             if field_order is None:
-                av_stream0, av_frame0 = video_frames[0]
+                av_frame0 = video_frames[0]
                 if framerate is not None:
                     constant_framerate = True
                 else:
-                    constant_framerate = all(
-                            av_frame.pkt_duration == av_frame0.pkt_duration
-                            for av_stream, av_frame in video_frames)
+                    constant_framerate = video_frames.all_same(video_frames.pkt_duration)
                 if constant_framerate:
                     if framerate is None:
                         if False:
@@ -660,8 +792,8 @@ def analyze_field_order_and_framerate(
                         else:
                             assert len(video_frames) > 5, f'Not enough precision, only {len(video_frames)} frames analyzed. (Use --force-framerate and --force-field-order?)'
                             pts_diff = (
-                                video_frames[-2][1].pts  # Last frame may not have either dts and pts
-                                - video_frames[0][1].pts)
+                                video_frames.pts[-2]  # Last frame may not have either dts and pts
+                                - video_frames.pts[0])
                             framerate = FrameRate(1 / (time_base * pts_diff / (len(video_frames) - 2)), 1)
                             app.log.debug('framerate = 1 / (%r * %r) / (%r - 2) = %r = %r', time_base, pts_diff, len(video_frames), framerate, float(framerate))
                             try:
@@ -673,14 +805,10 @@ def analyze_field_order_and_framerate(
                             app.log.debug('framerate.round_common() = %r = %r', framerate, float(framerate))
                         app.log.debug('Constant %s (%.3f) fps found...', framerate, framerate)
 
-                    all_same_interlaced_frame = all(
-                            av_frame.interlaced_frame == av_frame0.interlaced_frame
-                            for av_stream, av_frame in video_frames)
+                    all_same_interlaced_frame = video_frames.all_same(video_frames.interlaced_frame)
                     if all_same_interlaced_frame:
                         if av_frame0.interlaced_frame:
-                            all_same_top_field_first = all(
-                                    av_frame.top_field_first == av_frame0.top_field_first
-                                    for av_stream, av_frame in video_frames)
+                            all_same_top_field_first = video_frames.all_same(video_frames.top_field_first)
                             if all_same_top_field_first:
                                 if av_frame0.top_field_first:
                                     field_order = 'tt'
@@ -710,8 +838,7 @@ def analyze_field_order_and_framerate(
                 else:
                     field_order_diags.append('Variable fps found.')
                     if app.log.isEnabledFor(logging.DEBUG):
-                        fps_stats = collections.Counter([av_frame.pkt_duration
-                                                         for av_stream, av_frame in video_frames])
+                        fps_stats = collections.Counter(video_frames.pkt_duration)
                         app.log.debug('field_order_diags: %r', field_order_diags)
                         app.log.debug('Fps stats: %s',
                                       ', '.join(
@@ -879,6 +1006,9 @@ def main():
     pgroup.add_argument('--nice', default=None, type=int, help='nice process adjustment')
     pgroup.add_bool_argument('--check-cdrom-ready', default=True, help='check CDROM readiness')
     pgroup.add_argument('--cdrom-ready-timeout', default=24, type=int, help='CDROM readiness timeout')
+    pgroup.add_bool_argument('--probe-cache', default=True, help='cache ffprobe/mediainfo results in the cache directory')
+    pgroup.add_argument('--probe-backend', default='ffprobe', choices=('ffprobe', 'av'), help='media probing backend (av: in-process using PyAV, falling back to ffprobe)')
+    pgroup.add_bool_argument('--ffmpeg-progress-pipe', default=False, help='track ffmpeg progress using its machine-readable -progress output')
 
     pgroup = app.parser.add_argument_group('Ripping Control')
     pgroup.add_argument('--device', default=Path(os.environ.get('CDROM', '/dev/cdrom')), type=_resolved_Path, help='specify alternate cdrom device')
@@ -905,6 +1035,7 @@ def main():
     pgroup.add_argument('--cropdetect-seek', type=AnyTimestamp, default=qip.utils.Timestamp(0), help='cropdetect seek / skip (seconds)')
     pgroup.add_argument('--cropdetect-limit', type=int, choices=range(0,256), default=24, help='cropdetect higher black value threshold / limit')
     pgroup.add_argument('--cropdetect-round', type=int, choices=range(0,1000), default=2, help='cropdetect width/height rouding factor')
+    pgroup.add_argument('--cropdetect-samples', type=int, default=8, help='number of sample points, spread across the whole duration, analyzed concurrently (1 to analyze a single section)')
     pgroup.add_argument('--video-language', '--vlang', type=isolang_or_None, default=isolang('und'), help='override video language (mux)')
     pgroup.add_argument('--video-rate-control-mode', default='CQ', choices=('Q', 'CQ', 'CBR', 'VBR', 'lossless'), help='rate control mode: Constant Quality (Q), Constrained Quality (CQ), Constant Bit Rate (CBR), Variable Bit Rate (VBR), lossless')
     pgroup.add_argument('--force-framerate', default=argparse.SUPPRESS, type=FrameRate, help='ignore heuristics and force framerate')
@@ -913,6 +1044,7 @@ def main():
     pgroup.add_argument('--force-field-order', default=argparse.SUPPRESS, choices=('progressive', 'tt', 'tb', 'bb', 'bt', '23pulldown', 'auto-interlaced'), help='ignore heuristics and force input field order')
     pgroup.add_argument('--video-analyze-duration', type=AnyTimestamp, default=qip.utils.Timestamp(60), help='video analysis duration (seconds)')
     pgroup.add_argument('--video-analyze-skip-frames', type=int, default=10, help='number of frames to skip from video analysis')
+    pgroup.add_bool_argument('--video-analyze-packets', default=True, help='analyze MPEG-1/2 video field order from packet headers, without decoding')
     pgroup.add_argument('--limit-duration', type=AnyTimestamp, default=argparse.SUPPRESS, help='limit conversion duration (for testing purposes)')
     pgroup.add_bool_argument('--force-still-video', default=False, help='force still image video (single frame)')
     pgroup.add_argument('--seek-video', type=AnyTimestamp, default=qip.utils.Timestamp(0), help='seek some time past the start of the video')
@@ -926,6 +1058,7 @@ def main():
     pgroup.add_argument('--subrip-matrix', default=Auto, type=_resolved_Path, help='SubRip OCR matrix file')
     pgroup.add_bool_argument('--external-subtitles', choices=(True, False, '.sup', '.sub', '.srt', '.vtt', 'forced', 'non-forced'), nargs=argparse.ZERO_OR_MORE, help='enable exporting unoptimized subtitles as external files')
     pgroup.add_bool_argument('--ocr-subtitles', choices=(True, False, 'forced', 'non-forced'), nargs=argparse.ZERO_OR_MORE, help='enable optical character recognition of graphical subtitles')
+    pgroup.add_argument('--ocr-tool', default='subtitleedit', choices=('subtitleedit', 'tesseract'), help='tool used for optical character recognition of PGS (.sup) subtitles')
 
     pgroup = app.parser.add_argument_group('Files')
     pgroup.add_argument('--output', '-o', dest='output_file', default=Auto, type=Path, help='specify the output (demuxed) file name')
@@ -996,6 +1129,11 @@ def main():
 
     app.args.ocr_subtitles = set(app.args.ocr_subtitles)
 
+    qip.probecache.probe_cache.enabled = app.args.probe_cache
+    qip.file.file_hasher.disk_cache = app.args.probe_cache
+    ffprobe.probe_backend = app.args.probe_backend
+    ffmpeg.progress_pipe = app.args.ffmpeg_progress_pipe
+
     if in_tags.type is None:
         try:
             in_tags.type = in_tags.deduce_type()
@@ -2107,7 +2245,9 @@ def action_rip_iso(rip_iso, device, in_tags):
         raise NotImplementedError(f'Unsupported ripping stage {stage}')
 
     with perfcontext(f'Extracting {iso_file}... (stage {stage})', log=True, stat=f'rip_iso.{device_type_for_stat(device)}.ddrescue'):
-        ddrescue(*ddrescue_args)
+        # ddrescue displays its own progress; Only publish statistics.
+        with DdrescueMapWatcher(map_file, stat=f'rip_iso.{device_type_for_stat(device)}.ddrescue.{device.name}'):
+            ddrescue(*ddrescue_args)
 
     map_file.load()
     map_file.compact_sblocks()
@@ -2830,31 +2970,77 @@ def chop_chapters(chaps,
                        dry_run=app.args.dry_run,
                        y=app.args.yes)
 
-def skip_duplicate_streams(streams, mux_subtitles=True):
-    for stream1_i, stream1 in enumerate(streams):
-        if stream1.skip:
+def ffmpeg_extract_streams_args(inputfile, streams, *, seek_video=None):
+    """ffmpeg arguments extracting all streams in a single demux pass; One output per stream."""
+    ffmpeg_args = [] + default_ffmpeg_args
+    if seek_video:
+        ffmpeg_args += [
+            '-ss', ffmpeg.Timestamp(seek_video),
+            ]
+    ffmpeg_args += ffmpeg.input_args(inputfile)
+    ffmpeg_args += [
+        '-start_at_zero',
+        ]
+    for stream in streams:
+        ffmpeg_args += [
+            '-map_metadata', '-1',
+            '-map_chapters', '-1',
+            '-map', '0:%d' % (stream.index,),
+            ]
+        if stream.is_still_image:
+            ffmpeg_args += [
+                '-frames:v', 1,
+                ]
+        else:
+            ffmpeg_args += [
+                '-codec', 'copy',
+                ]
+        ffmpeg_args += [
+            '-f', stream.file.ffmpeg_container_format,
+            stream.path,
+            ]
+    return ffmpeg_args
+
+def skip_duplicate_streams(streams, mux_subtitles=True, mux_attached_pic=True):
+    # Bucket candidates by (codec_type, language, size); Only streams within
+    # the same bucket can be identical.
+    buckets = collections.defaultdict(list)
+    for stream in streams:
+        if stream.skip:
             continue
-        if stream1.codec_type is CodecType.video and stream1.disposition.attached_pic and not mux_attached_pic:
+        if stream.codec_type is CodecType.video and stream.disposition.attached_pic and not mux_attached_pic:
             continue
-        if stream1.codec_type is CodecType.subtitle and not mux_subtitles:
+        if stream.codec_type is CodecType.subtitle and not mux_subtitles:
             continue
-        stream_language1 = stream1.language
-        for stream2 in streams[stream1_i + 1:]:
-            if stream2.skip:
-                continue
-            if stream2.codec_type is not stream1.codec_type:
-                continue
-            if stream2.codec_type is CodecType.video and stream2.disposition.attached_pic and not mux_attached_pic:
-                continue
-            if stream2.codec_type is CodecType.subtitle and not mux_subtitles:
-                continue
-            if stream2.language != stream_language1:
-                continue
-            if stream2.file.getsize() != stream1.file.getsize():
-                continue
-            app.log.info('Hash-comparing %s to %s; Please wait...', stream1.file, stream2.file)
-            if stream2.file.md5_ex(show_progress_bar=True).hexdigest() != stream1.file.md5_ex(show_progress_bar=True).hexdigest():
-                continue
+        buckets[(stream.codec_type, stream.language, stream.file.getsize())].append(stream)
+    buckets = [bucket for bucket in buckets.values() if len(bucket) > 1]
+
+    def refine_buckets(buckets, hash_func):
+        candidates = [stream for bucket in buckets for stream in bucket]
+        if thread_executor is not None:
+            hashes = list(thread_executor.map(hash_func, candidates))
+        else:
+            hashes = list(map(hash_func, candidates))
+        iter_hashes = iter(hashes)
+        new_buckets = []
+        for bucket in buckets:
+            sub_buckets = collections.defaultdict(list)
+            for stream in bucket:
+                sub_buckets[next(iter_hashes)].append(stream)
+            new_buckets += [sub_bucket for sub_bucket in sub_buckets.values() if len(sub_bucket) > 1]
+        return new_buckets
+
+    if buckets:
+        # Cheap partial hashes first, then full hashes of the remaining candidates
+        buckets = refine_buckets(buckets, MmdemuxStream.partial_hash)
+    if buckets:
+        app.log.info('Hash-comparing %s; Please wait...',
+                     ', '.join(os.fspath(stream.file) for bucket in buckets for stream in bucket))
+        buckets = refine_buckets(buckets, MmdemuxStream.full_hash)
+
+    for bucket in buckets:
+        stream1 = bucket[0]
+        for stream2 in bucket[1:]:
             app.log.warning('%s identical to %s; Marking as skip',
                             stream2.file_name,
                             stream1.file_name,
@@ -3576,6 +3762,7 @@ def action_mux(inputfile, in_tags,
 
         mkvextract_tracks_args = []
         mkvextract_attachments_args = []
+        ffmpeg_extract_streams = []
 
         for stream in streams:
 
@@ -3722,38 +3909,8 @@ def action_mux(inputfile, in_tags,
                                 '.vp8.ivf',
                                 '.vp9.ivf',
                                 ))):
-                    with perfcontext('Extract %s stream #%s w/ ffmpeg' % (stream.codec_type, stream.pprint_index,), log=True, stat=f'extract.{stream.codec_type}.ffmpeg'):
-                        ffmpeg_args = [] + default_ffmpeg_args
-                        if app.args.seek_video:
-                            ffmpeg_args += [
-                                '-ss', ffmpeg.Timestamp(app.args.seek_video),
-                                ]
-                        ffmpeg_args += ffmpeg.input_args(inputfile)
-                        ffmpeg_args += [
-                            '-map_metadata', '-1',
-                            '-map_chapters', '-1',
-                            '-map', '0:%d' % (stream.index,),
-                            ]
-                        if stream.is_still_image:
-                            ffmpeg_args += [
-                                '-frames:v', 1,
-                                ]
-                        else:
-                            ffmpeg_args += [
-                                '-codec', 'copy',
-                                ]
-                        ffmpeg_args += [
-                            '-start_at_zero',
-                            ]
-                        ffmpeg_args += [
-                            '-f', stream.file.ffmpeg_container_format,
-                            stream.path,
-                            ]
-                        ffmpeg(*ffmpeg_args,
-                            progress_bar_max=estimate_stream_duration(inputfile=inputfile),
-                            progress_bar_title=f'Extract {stream.codec_type} track {stream.pprint_index} w/ ffmpeg',
-                            dry_run=app.args.dry_run,
-                            y=app.args.yes or app.args.remux)
+                    app.log.info('Will extract %s stream #%s w/ ffmpeg: %s', stream.codec_type, stream.pprint_index, stream_file_name)
+                    ffmpeg_extract_streams.append(stream)
                     continue
 
                 if app.args.track_extract_tool in ('mkvextract', Auto):
@@ -3768,6 +3925,17 @@ def action_mux(inputfile, in_tags,
 
                 raise NotImplementedError('unsupported track extract tool: %r' % (app.args.track_extract_tool,))
 
+        if ffmpeg_extract_streams:
+            # Single demux pass writing all tracks
+            with perfcontext('Extract tracks w/ ffmpeg', log=True, stat=f'extract.tracks.ffmpeg'):
+                ffmpeg_args = ffmpeg_extract_streams_args(inputfile, ffmpeg_extract_streams,
+                                                          seek_video=app.args.seek_video)
+                ffmpeg(*ffmpeg_args,
+                    progress_bar_max=estimate_stream_duration(inputfile=inputfile),
+                    progress_bar_title='Extract tracks %s w/ ffmpeg' % (
+                        ', '.join(str(stream.pprint_index) for stream in ffmpeg_extract_streams),),
+                    dry_run=app.args.dry_run,
+                    y=app.args.yes or app.args.remux)
         if mkvextract_tracks_args:
             with perfcontext('Extract tracks w/ mkvextract', log=True, stat=f'extract.tracks.mkvextract'):
                 cmd = [
@@ -3784,14 +3952,37 @@ def action_mux(inputfile, in_tags,
     with perfcontext('Extract tracks', log=True, stat=f'extract.all'):
         extract_streams(inputfile=inputfile, streams=mux_dict['streams'])
 
+    def probe_stream(stream):
+        # Best effort; Failures are reported again where the results are used.
+        for what, func in (
+                ('ffprobe', lambda: stream.file.ffprobe_dict),
+                ('mediainfo', lambda: stream.file.mediainfo_dict),
+                ('md5', stream.full_hash),  # Memoized for skip_duplicate_streams
+        ):
+            try:
+                func()
+            except Exception as e:
+                app.log.debug('Stream #%s: %s failed: %s', stream.pprint_index, what, e)
+
+    # Fan out the per-stream probing (ffprobe, mediainfo, md5)
+    if not app.args.dry_run:
+        with perfcontext('Probe extracted streams', log=True, stat=f'extract.probe'):
+            for future in [
+                    thread_executor.submit(probe_stream, stream)
+                    for stream in mux_dict['streams']
+                    if not stream.skip and stream.path.exists()]:
+                future.result()
+
     # Detect duplicates
     if not app.args.dry_run:
         skip_duplicate_streams(mux_dict['streams'],
-                               mux_subtitles=mux_subtitles)
+                               mux_subtitles=mux_subtitles,
+                               mux_attached_pic=mux_attached_pic)
 
     # Pre-stream post-processing
 
     subtitle_counts = []
+    subtitle_streams = []
 
     iter_mediainfo_track_dicts = iter(sorted_mediainfo_tracks(
         mediainfo_track_dict
@@ -3893,64 +4084,71 @@ def action_mux(inputfile, in_tags,
                 stream['pixel_aspect_ratio'] = str(pixel_aspect_ratio)  # invariable
 
         if mux_subtitles and stream.codec_type is CodecType.subtitle:
-            stream_forced = stream.is_forced
-            # TODO Detect closed_caption
-            if isinstance(stream.file, PgsFile):
-                palette = qip.pgs.pgs_segment_to_YCbCr_palette(pgs_segment=None)
-                def is_pgs_valid_ods_segment(pgs_segment):
-                    nonlocal palette
-                    if pgs_segment.segment_type is PgsFile.SegmentType.ODS:
-                        object_data = qip.pgs.rle_decode(pgs_segment.object_data,
-                                                         pgs_segment.width,
-                                                         pgs_segment.height,
-                                                         palette=palette)
-                        object_data = list(object_data)
-                        if not object_data or all(e == object_data[0] for e in object_data):
-                            return False  # Empty
-                        return True
-                    elif pgs_segment.segment_type is PgsFile.SegmentType.PDS:
-                        palette = qip.pgs.pgs_segment_to_YCbCr_palette(pgs_segment)
-                    return False
-                subtitle_count = sum(
-                    is_pgs_valid_ods_segment(pgs_segment)
-                    for pgs_segment in stream.file.iter_pgs_segments())
-            elif stream_file_ext in ('.sub', '.sup'):
-                try:
-                    d = ffprobe(i=outputdir / stream_file_name, show_packets=True)
-                except subprocess.CalledProcessError as e:
-                    app.log.error(e)
-                    num_extract_errors += 1
-                    subtitle_count = 0
-                else:
-                    out = d.out
-                    subtitle_count = out.count(
-                        b'[PACKET]' if type(out) is bytes else '[PACKET]')
-                    if stream_file_ext in ('.sup',):
-                        # TODO count only those frames with num_rect != 0
-                        subtitle_count = subtitle_count // 2
-            elif stream_file_ext in ('.idx',):
-                out = open(outputdir / stream_file_name, 'rb').read()
-                subtitle_count = out.count(b'timestamp:')
-            elif stream_file_ext in ('.srt', '.ass', '.vtt'):
-                out = open(outputdir / stream_file_name, 'rb').read()
-                subtitle_count = out.count(b'\n\n') + out.count(b'\n\r\n')
-            else:
-                raise NotImplementedError(stream_file_ext)
-            if subtitle_count == 1 \
-                    and File(outputdir / stream_file_name).getsize() == 2048:
-                app.log.warning('Detected empty single-frame subtitle stream #%s (%s); Skipping.',
-                                stream.pprint_index,
-                                stream.language)
-                stream['skip'] = f'Empty single-frame subtitle stream'
-            elif not subtitle_count:
-                app.log.warning('Detected empty subtitle stream #%s (%s); Skipping.',
-                                stream.pprint_index,
-                                stream.language)
-                stream['skip'] = 'Empty subtitle stream'
-            else:
-                stream['subtitle_count'] = subtitle_count
-                subtitle_counts.append(
-                    (stream, subtitle_count))
+            subtitle_streams.append(stream)
+
+    def count_subtitles(stream):
+        stream_file_name = stream['file_name']
+        stream_file_base, stream_file_ext = my_splitext(stream_file_name)
+        # TODO Detect closed_caption
+        if isinstance(stream.file, PgsFile):
+            palette = qip.pgs.pgs_segment_to_YCbCr_palette(pgs_segment=None)
+            def is_pgs_valid_ods_segment(pgs_segment):
+                nonlocal palette
+                if pgs_segment.segment_type is PgsFile.SegmentType.ODS:
+                    return not qip.pgs.ods_is_blank(pgs_segment.object_data,
+                                                    palette=palette,
+                                                    height=pgs_segment.height)
+                elif pgs_segment.segment_type is PgsFile.SegmentType.PDS:
+                    palette = qip.pgs.pgs_segment_to_YCbCr_palette(pgs_segment)
+                return False
+            subtitle_count = sum(
+                is_pgs_valid_ods_segment(pgs_segment)
+                for pgs_segment in stream.file.iter_pgs_segments())
+        elif stream_file_ext in ('.sub', '.sup'):
+            d = ffprobe(i=outputdir / stream_file_name, show_packets=True)
+            out = d.out
+            subtitle_count = out.count(
+                b'[PACKET]' if type(out) is bytes else '[PACKET]')
+            if stream_file_ext in ('.sup',):
+                # TODO count only those frames with num_rect != 0
+                subtitle_count = subtitle_count // 2
+        elif stream_file_ext in ('.idx',):
+            out = open(outputdir / stream_file_name, 'rb').read()
+            subtitle_count = out.count(b'timestamp:')
+        elif stream_file_ext in ('.srt', '.ass', '.vtt'):
+            out = open(outputdir / stream_file_name, 'rb').read()
+            subtitle_count = out.count(b'\n\n') + out.count(b'\n\r\n')
+        else:
+            raise NotImplementedError(stream_file_ext)
+        return subtitle_count
+
+    # Fan out the per-stream post-processing; Results are applied in stream order.
+    subtitle_count_futures = [
+        (stream, thread_executor.submit(count_subtitles, stream))
+        for stream in subtitle_streams]
+    for stream, subtitle_count_future in subtitle_count_futures:
+        stream_file_name = stream['file_name']
+        try:
+            subtitle_count = subtitle_count_future.result()
+        except subprocess.CalledProcessError as e:
+            app.log.error(e)
+            num_extract_errors += 1
+            subtitle_count = 0
+        if subtitle_count == 1 \
+                and File(outputdir / stream_file_name).getsize() == 2048:
+            app.log.warning('Detected empty single-frame subtitle stream #%s (%s); Skipping.',
+                            stream.pprint_index,
+                            stream.language)
+            stream['skip'] = f'Empty single-frame subtitle stream'
+        elif not subtitle_count:
+            app.log.warning('Detected empty subtitle stream #%s (%s); Skipping.',
+                            stream.pprint_index,
+                            stream.language)
+            stream['skip'] = 'Empty subtitle stream'
+        else:
+            stream['subtitle_count'] = subtitle_count
+            subtitle_counts.append(
+                (stream, subtitle_count))
 
     if mux_subtitles and not has_forced_subtitle and subtitle_counts:
         max_subtitle_size = max(subtitle_count
@@ -4480,6 +4678,43 @@ class MmdemuxStream(collections.UserDict, json.JSONEncodable):
     def __copy__(self):
         return self.__class__(self.data, parent=self.parent)
 
+    partial_hash_block_size = 1024 * 1024
+
+    def _memoized_hash(self, kind, hash_func):
+        # Memoized per file state so that modified files are hashed again
+        st = os.stat(self.path)
+        key = (kind, os.fspath(self.path), st.st_size, st.st_mtime_ns)
+        try:
+            hashes = self._hashes
+        except AttributeError:
+            hashes = self._hashes = {}
+        try:
+            return hashes[key]
+        except KeyError:
+            pass
+        value = hashes[key] = hash_func(st.st_size)
+        return value
+
+    def partial_hash(self):
+        '''Return the md5 digest of the head, middle and tail blocks of the stream file.'''
+        block_size = self.partial_hash_block_size
+
+        def hash_func(size):
+            if size <= 3 * block_size:
+                return self.full_hash()
+            hasher = hashlib.md5()
+            with open(self.path, 'rb') as fp:
+                for pos in (0, (size - block_size) // 2, size - block_size):
+                    fp.seek(pos)
+                    hasher.update(fp.read(block_size))
+            return hasher.hexdigest()
+
+        return self._memoized_hash('partial', hash_func)
+
+    def full_hash(self):
+        '''Return the md5 digest of the whole stream file.'''
+        return qip.file.file_hasher.hash_file(self.path, ('md5',))['md5']
+
     def new_sub_stream(self, sub_stream_index, sub_stream_file_name):
         sub_stream_dict = {k: v
                            for k, v in self.items()
@@ -5481,6 +5716,22 @@ class MmdemuxStream(collections.UserDict, json.JSONEncodable):
                             if not stream_crop_whlt and 'original_crop' not in stream_dict:
                                 if mediainfo_track_dict['@type'] == 'Image':
                                     pass  # Not supported
+                                elif app.args.cropdetect_samples > 1 and stream_dict.estimated_duration is not None:
+                                    stream_crop_whlt = ffmpeg.cropdetect_sampled(
+                                        default_ffmpeg_args=default_ffmpeg_args,
+                                        input_file=stream_dict.path,
+                                        duration=stream_dict.estimated_duration,
+                                        cropdetect_samples=app.args.cropdetect_samples,
+                                        skip_frame_nokey=app.args.cropdetect_skip_frame_nokey,
+                                        cropdetect_seek=app.args.cropdetect_seek,
+                                        cropdetect_duration=app.args.cropdetect_duration,
+                                        cropdetect_limit=app.args.cropdetect_limit,
+                                        cropdetect_round=app.args.cropdetect_round,
+                                        frame_width=mediainfo_width,
+                                        frame_height=mediainfo_height,
+                                        video_filter_specs=video_filter_specs,
+                                        jobs=app.args.jobs,
+                                        dry_run=app.args.dry_run)
                                 else:
                                     stream_crop_whlt = ffmpeg.cropdetect(
                                         default_ffmpeg_args=default_ffmpeg_args,
@@ -6081,7 +6332,16 @@ class MmdemuxStream(collections.UserDict, json.JSONEncodable):
                                 return
                             app.log.verbose('Stream #%s %s -> %s', stream_dict.pprint_index, stream_file_ext, new_stream.file_name)
 
-                            if False:
+                            if stream_file_ext == '.sup' and app.args.ocr_tool == 'tesseract':
+                                from qip.pgsocr import pgs_ocr_to_srt
+                                from qip.tesseract import tesseract
+                                with perfcontext('Convert %s -> %s w/ tesseract' % (stream_file_ext, new_stream.file_name), log=True, stat=f'optimize.{self.codec_type}.tesseract'):
+                                    if not app.args.dry_run:
+                                        pgs_ocr_to_srt(stream_dict.path, new_stream.path,
+                                                       language=tesseract.traineddata_language(stream_dict.language),
+                                                       jobs=None if app.args.jobs is Auto else app.args.jobs)
+
+                            elif False:
                                 subrip_matrix = app.args.subrip_matrix
                                 if subrip_matrix is Auto:
                                     subrip_matrix_dir = Path.home() / '.cache/SubRip/Matrices'
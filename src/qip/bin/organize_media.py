@@ -12,11 +12,15 @@
 
 from pathlib import Path
 import argparse
+import collections
+import concurrent.futures
 import decimal
 import errno
 import functools
 import glob
 import html
+import itertools
+import json
 import logging
 import os
 import pexpect
@@ -29,6 +33,7 @@ from qip.app import app
 from qip.cmp import *
 from qip.exec import *
 from qip.file import *
+from qip.librarydb import LibraryStateDB
 from qip.mm import *
 from qip.mm import MediaFile
 from qip.matroska import MatroskaFile
@@ -41,6 +46,8 @@ import qip.utils
 Auto = qip.utils.Constants.Auto
 all_part_names = {'disk', 'track', 'part'}
 
+library_db = None
+
 def str_or_none(v):
     if v in (None, 'None'):
         return None
@@ -61,6 +68,7 @@ def main():
     pgroup.add_argument('--interactive', '-i', action='store_true', help='interactive mode')
     pgroup.add_argument('--dry-run', '-n', dest='dry_run', action='store_true', help='dry-run mode')
     pgroup.add_argument('--yes', '-y', action='store_true', help='answer "yes" to all prompts')
+    pgroup.add_argument('--jobs', '-j', type=int, nargs='?', default=1, const=Auto, help='specifies the number of files to probe simultaneously')
     xgroup = pgroup.add_mutually_exclusive_group()
     xgroup.add_argument('--logging_level', default=argparse.SUPPRESS, help='set logging level')
     xgroup.add_argument('--quiet', '-q', dest='logging_level', default=argparse.SUPPRESS, action='store_const', const=logging.WARNING, help='quiet mode')
@@ -116,6 +124,7 @@ def main():
     pgroup = app.parser.add_argument_group('Files')
     pgroup.add_argument('--output', '-o', dest='outputdir', default=argparse.SUPPRESS, type=Path, help='specify the output directory')
     pgroup.add_bool_argument('--use-default-output', default=True, help='use default output directory from config file')
+    pgroup.add_argument('--library-db', default=None, type=Path, help='library state database; Only new or changed files are processed')
 
     pgroup = app.parser.add_argument_group('Compatibility')
     xgroup = pgroup.add_mutually_exclusive_group()
@@ -160,8 +169,16 @@ def main():
                     raise Exception('Output directory mandatory when input directory provided')
             if not app.args.use_default_output:
                 raise ValueError('No output directory specified and use of default output directories disabled')
-        for inputfile in app.args.inputfiles:
-            organize(inputfile)
+        global library_db
+        if app.args.library_db:
+            library_db = LibraryStateDB(app.args.library_db)
+        try:
+            for inputfile in app.args.inputfiles:
+                organize(inputfile)
+        finally:
+            if library_db is not None:
+                library_db.close()
+                library_db = None
 
         # }}}
     elif app.args.action == 'set-default':
@@ -787,28 +804,213 @@ def organize_tvshow(inputfile, *, suggest_tags):
 
     return dst_dir / dst_file_base
 
-def organize(inputfile):
+def iter_media_files(inputdir):
+    """Walk inputdir once, yielding the supported media files.
+
+    Files are yielded in sorted path order; Directories reached more than
+    once (through symbolic links) are only visited the first time.
+    """
+    seen_dirs = set()
+
+    def scan_dir(d):
+        try:
+            st = os.stat(d)
+        except OSError as e:
+            app.log.warning('%s: %s', d, e)
+            return ()
+        dir_key = (st.st_dev, st.st_ino)
+        if dir_key in seen_dirs:
+            return ()
+        seen_dirs.add(dir_key)
+        try:
+            with os.scandir(d) as it:
+                return iter(sorted(it, key=lambda entry: entry.name))
+        except OSError as e:
+            app.log.warning('%s: %s', d, e)
+            return ()
+
+    stack = [scan_dir(inputdir)]
+    while stack:
+        for entry in stack[-1]:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                stack.append(scan_dir(entry.path))
+                break
+            if os.path.splitext(entry.name)[1] in supported_media_exts:
+                yield Path(entry.path)
+        else:
+            stack.pop()
+
+def probe_media_file(inputfile):
+    if getattr(inputfile, 'library_state', None) is not None:
+        # Restored from the library state database
+        return inputfile
+    if not isinstance(inputfile, MediaFile):
+        inputfile = MediaFile.new_by_file_name(inputfile)
+    if not inputfile.file_name.is_file():
+        raise OSError(errno.ENOENT, f'No such file: {inputfile}')
+    app.log.verbose('Probing %s...', inputfile)
+    inputfile.extract_info(need_actual_duration=False)
+    #inputfile.tags = inputfile.load_tags()  # Already done by extract_info
+    return inputfile
+
+def probe_media_files(inputfiles, *, jobs=None):
+    """Probe media files concurrently.
+
+    At most `jobs` files are probed at once (default: CPU count).
+    (inputfile, exception) tuples are yielded as a stream, in the same order
+    as `inputfiles`.
+    """
+    if jobs is None or jobs is Auto:
+        jobs = os.cpu_count() or 1
+    inputfiles = iter(inputfiles)
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+
+        def submit(inputfile):
+            pending.append((inputfile, executor.submit(probe_media_file, inputfile)))
+
+        try:
+            # Keep the workers busy while limiting how far ahead of the organizer we go
+            for inputfile in itertools.islice(inputfiles, jobs * 2):
+                submit(inputfile)
+            while pending:
+                inputfile, future = pending.popleft()
+                try:
+                    result = (future.result(), None)
+                except Exception as e:
+                    result = (inputfile, e)
+                for inputfile in itertools.islice(inputfiles, 1):
+                    submit(inputfile)
+                yield result
+        finally:
+            for inputfile, future in pending:
+                future.cancel()
+
+def organize_options_key():
+    """Options that affect the destination of organized files."""
+    return repr(sorted({
+        'library_mode': getattr(app.args, 'library_mode', None),
+        'contenttype': app.args.contenttype,
+        'media_library_app': app.args.media_library_app,
+        'outputdir': os.fspath(getattr(app.args, 'outputdir', None) or ''),
+        'suffix': app.args.suffix,
+        'ascii_compat': app.args.ascii_compat,
+    }.items()))
+
+def encode_library_tags(tags):
+    flat_tags = TrackTags()
+    for tag in tags.keys(deep=True):
+        if tag is MediaTagEnum.picture:
+            continue
+        value = tags[tag]
+        if value is not None:
+            flat_tags[tag] = value
+    return flat_tags.json_dumps()
+
+def restore_library_file(inputfile_path, state):
+    inputfile = MediaFile.new_by_file_name(inputfile_path)
+    inputfile.tags = TrackTags.json_loads(state.tags)
+    info = json.loads(state.info) if state.info else {}
+    if info.get('stereo_3d_mode'):
+        inputfile.stereo_3d_mode = qip.mm.Stereo3DMode(info['stereo_3d_mode'])
+    inputfile.library_state = state
+    return inputfile
+
+def filter_library_files(inputfiles, *, stats):
+    """Skip the files already organized according to library_db.
+
+    Known files that still need organizing are restored with their recorded
+    tags instead of being probed again.
+    """
+    options = organize_options_key()
+    for inputfile_path in inputfiles:
+        try:
+            st = os.stat(inputfile_path)
+        except OSError:
+            yield inputfile_path
+            continue
+        state = library_db.lookup(st)
+        if state is None:
+            yield inputfile_path
+            continue
+        s_inputfile_path = os.fspath(inputfile_path)
+        if state.path != s_inputfile_path:
+            app.log.verbose('%s: Moved from %s.', inputfile_path, state.path)
+        if state.options == options and state.dst_path and (
+                s_inputfile_path == state.dst_path
+                or (s_inputfile_path == state.path and os.path.exists(state.dst_path))):
+            app.log.verbose('%s: Already organized.', inputfile_path)
+            library_db.seen(st, path=inputfile_path)
+            stats['unchanged'] += 1
+            continue
+        if state.tags is None:
+            yield inputfile_path
+            continue
+        yield restore_library_file(inputfile_path, state)
+
+def organize_library_file(inputfile, *, stats=None):
+    """Organize an already probed media file and record it in library_db."""
+    if library_db is None or app.args.dry_run:
+        return organize_media_file(inputfile, stats=stats)
+    st = os.stat(inputfile.file_name)
+    inputfile_path = inputfile.file_name
+    dst_file_name = organize_media_file(inputfile, stats=stats)
+    if app.args.file_op == 'move':
+        inputfile_path = dst_file_name
+        st = os.stat(dst_file_name)
+    # Recorded as organized (type, albumartist, ...)
+    tags = encode_library_tags(inputfile.tags)
+    stereo_3d_mode = getattr(inputfile, 'stereo_3d_mode', None)
+    info = json.dumps({
+        'stereo_3d_mode': stereo_3d_mode.value if stereo_3d_mode is not None else None,
+    })
+    library_db.record(st,
+                      path=inputfile_path,
+                      tags=tags,
+                      type=str(inputfile.tags.type),
+                      info=info,
+                      dst_path=dst_file_name,
+                      options=organize_options_key())
+    return dst_file_name
+
+def log_organize_summary(stats):
+    if not stats:
+        return
+    app.log.info('%s: %s',
+                 'Planned operations' if app.args.dry_run else 'Operations',
+                 ', '.join(f'{n} {op}' for op, n in sorted(stats.items())))
+
+def organize(inputfile, *, stats=None):
 
     if isinstance(inputfile, str):
         inputfile = Path(inputfile)
     if isinstance(inputfile, Path) and inputfile.is_dir():
         inputdir = inputfile
         app.log.verbose('Recursing into %s...', inputdir)
-        for inputfile_path in sorted(set(inputdir.glob('**/*'))):
-            inputext = inputfile_path.suffix
-            if (inputext in supported_media_exts
-                    or inputfile_path.is_dir()):
-                organize(inputfile_path)
+        stats = collections.Counter()
+        inputfiles = iter_media_files(inputdir)
+        if library_db is not None:
+            inputfiles = filter_library_files(inputfiles, stats=stats)
+        try:
+            for inputfile, exception in probe_media_files(inputfiles,
+                                                          jobs=app.args.jobs):
+                if exception is not None:
+                    stats['failed'] += 1
+                    raise exception
+                organize_library_file(inputfile, stats=stats)
+        finally:
+            log_organize_summary(stats)
         return True
 
-    if not isinstance(inputfile, MediaFile):
-        inputfile = MediaFile.new_by_file_name(inputfile)
+    return organize_library_file(probe_media_file(inputfile), stats=stats)
 
-    if not inputfile.file_name.is_file():
-        raise OSError(errno.ENOENT, f'No such file: {inputfile}')
+def organize_media_file(inputfile, *, stats=None):
+    """Organize an already probed media file."""
     app.log.info('Organizing %s...', inputfile)
-    inputfile.extract_info(need_actual_duration=False)
-    #inputfile.tags = inputfile.load_tags()  # Already done by extract_info
     if app.log.isEnabledFor(logging.DEBUG):
         inputfile.tags.pprint()
 
@@ -882,6 +1084,8 @@ def organize(inputfile):
             if dst_stat.st_ino == src_stat.st_ino:
                 app.log.verbose('  Use existing %s.', dst_file_name)
                 skip = True
+                if stats is not None:
+                    stats['unchanged'] += 1
                 break
             else:
                 if app.args.overwrite:
@@ -933,6 +1137,8 @@ def organize(inputfile):
                     qip.utils.progress_move(src, dst)
             else:
                 raise NotImplementedError(app.args.file_op)
+            if stats is not None:
+                stats[app.args.file_op + (' aux' if is_aux else '')] += 1
 
         do_file_op(inputfile.file_name, dst_file_name)
         for aux_file_name, dst_aux_file in aux_moves:
@@ -947,7 +1153,7 @@ def organize(inputfile):
     else:
         raise ValueError('Ran out of options / Too many collisions!')
 
-    return True
+    return Path(dst_file_name)
 
 
 if __name__ == "__main__":
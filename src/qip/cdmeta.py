@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''CD metadata (MusicBrainz, CDDB) lookups
+
+Answers are kept in a persistent cache keyed by MusicBrainz / FreeDB disc ID
+(`app.cache_dir`/cdmeta by default) and expire after per-kind TTLs. Local
+FreeDB and MusicBrainz dumps can be imported into the cache which can then
+serve as an offline index: in offline mode, lookups never reach the network.
+'''
+
+__all__ = (
+    'MetadataLookup',
+)
+
+from pathlib import Path
+import os
+import re
+import threading
+import time
+import urllib.error
+import logging
+log = logging.getLogger(__name__)
+
+from .app import app
+from . import json
+
+mb_releases_by_discid_includes = ('artists', 'recordings', 'release-groups')
+mb_release_by_id_includes = ('artists', 'artist-credits', 'recordings', 'discids', 'labels')
+
+# CDDB response codes
+CDDB_OK = 200
+CDDB_NO_MATCH = 202
+CDDB_READ_OK = 210
+CDDB_MULTIPLE_MATCHES = 211
+CDDB_ENTRY_NOT_FOUND = 401
+
+DAY = 24 * 60 * 60
+
+
+class MetadataLookup(object):
+    """MusicBrainz and CDDB lookups through a persistent cache.
+
+    Cached answers expire after ttls[kind] seconds (negative_ttl for "not
+    found" answers); Imported entries never expire. In offline mode, expired
+    entries are still used and queries not in the cache find nothing.
+    Network queries are serialized to respect the services' rate limits.
+    """
+
+    ttls = {
+        'mb-discid': 30 * DAY,
+        'mb-release': 90 * DAY,
+        'cddb-query': 90 * DAY,
+        'cddb-read': 365 * DAY,
+    }
+    negative_ttl = 1 * DAY
+
+    def __init__(self, store_dir=None, *, offline=False, use_cache=True, ttls=None, negative_ttl=None):
+        self._store_dir = Path(store_dir) if store_dir is not None else None
+        self.offline = offline
+        self.use_cache = use_cache
+        if ttls is not None:
+            self.ttls = dict(self.ttls, **ttls)
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+        self._network_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+    @property
+    def store_dir(self):
+        if not self.use_cache:
+            return None
+        store_dir = self._store_dir
+        if store_dir is None:
+            app_cache_dir = app.cache_dir
+            if app_cache_dir is not None:
+                store_dir = app_cache_dir / 'cdmeta'
+        return store_dir
+
+    def _store_file(self, store_dir, kind, key):
+        key = re.sub(r'[^A-Za-z0-9._-]', '_', str(key))
+        return json.JsonFile(store_dir / kind / f'{key}.json')
+
+    def load(self, kind, key):
+        """Return (found, value) from the cache; Expired entries are not found."""
+        store_dir = self.store_dir
+        if store_dir is None:
+            return False, None
+        store_file = self._store_file(store_dir, kind, key)
+        try:
+            entry = store_file.read_json()
+            value = entry['value']
+        except FileNotFoundError:
+            return False, None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.debug('Discarding corrupt metadata cache entry %s: %s', store_file, e)
+            return False, None
+        entry_time = entry.get('time')
+        if entry_time is not None and not self.offline:
+            ttl = self.ttls.get(kind) if self.is_found(kind, value) else self.negative_ttl
+            if ttl is not None and time.time() - entry_time > ttl:
+                log.debug('%s %s: Expired', kind, key)
+                return False, None
+        return True, value
+
+    def save(self, kind, key, value, *, expires=True):
+        store_dir = self.store_dir
+        if store_dir is None:
+            return
+        store_file = self._store_file(store_dir, kind, key)
+        store_file.file_name.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = json.JsonFile(store_file.file_name.with_name(
+            f'.{store_file.file_name.name}.{os.getpid()}.{threading.get_ident()}'))
+        tmp_file.write_json({
+            'value': value,
+            'time': time.time() if expires else None,
+        })
+        os.replace(tmp_file.file_name, store_file.file_name)
+
+    @staticmethod
+    def is_found(kind, value):
+        if value is None:
+            return False
+        if kind in ('cddb-query', 'cddb-read'):
+            # 210 is also "found exact matches" for queries
+            return value[0] in (CDDB_OK, CDDB_READ_OK, CDDB_MULTIPLE_MATCHES)
+        return True
+
+    def _lookup(self, kind, key, func, offline_value=None):
+        found, value = self.load(kind, key)
+        if found:
+            log.debug('%s %s: Found in cache', kind, key)
+            return value
+        if self.offline:
+            log.debug('%s %s: Not found in cache (offline)', kind, key)
+            return offline_value
+        with self._network_lock:
+            value = func()
+        self.save(kind, key, value)
+        return value
+
+    def get_releases_by_discid(self, discid, *, toc=None, includes=mb_releases_by_discid_includes):
+        """musicbrainzngs.get_releases_by_discid; None if not found."""
+        def func():
+            import musicbrainzngs
+            try:
+                return musicbrainzngs.get_releases_by_discid(
+                    discid,
+                    toc=toc,
+                    includes=list(includes),
+                )
+            except musicbrainzngs.ResponseError as e:
+                if isinstance(e.cause, urllib.error.HTTPError) and e.cause.code == 404:
+                    return None
+                raise
+        value = self._lookup('mb-discid', discid, func)
+        if value is None and self.offline:
+            value = self.get_indexed_releases_by_discid(discid)
+        return value
+
+    def get_release_by_id(self, releaseid, *, includes=mb_release_by_id_includes):
+        """musicbrainzngs.get_release_by_id; None if not found."""
+        def func():
+            import musicbrainzngs
+            return musicbrainzngs.get_release_by_id(
+                releaseid,
+                includes=list(includes),
+            )
+        value = self._lookup('mb-release', releaseid, func)
+        if value is not None:
+            self.index_release(value['release'])
+        return value
+
+    def cddb_query(self, track_info):
+        """CDDB.query; Returns (query_status, query_info)."""
+        def func():
+            from .extern import CDDB
+            return CDDB.query(track_info)
+        query_status, query_info = self._lookup(
+            'cddb-query', '%08x' % (int(track_info[0]),), func,
+            offline_value=(CDDB_NO_MATCH, None))
+        return query_status, query_info
+
+    def cddb_read(self, category, disc_id):
+        """CDDB.read; Returns (read_status, read_info)."""
+        def func():
+            from .extern import CDDB
+            return CDDB.read(category, disc_id)
+        read_status, read_info = self._lookup(
+            'cddb-read', f'{category}-{disc_id}', func,
+            offline_value=(CDDB_ENTRY_NOT_FOUND, None))
+        return read_status, read_info
+
+    # Offline index {{{
+
+    @staticmethod
+    def _release_discids(mbrelease):
+        for mbmedium in mbrelease.get('medium-list', ()):
+            for mbdisc in mbmedium.get('disc-list', ()):
+                yield mbdisc['id']
+
+    def index_release(self, mbrelease):
+        """Index the disc IDs of a MusicBrainz release."""
+        if self.store_dir is None:
+            return
+        summary = {k: v for k, v in mbrelease.items() if k != 'medium-list'}
+        with self._index_lock:
+            for discid in set(self._release_discids(mbrelease)):
+                found, releases = self.load('mb-discindex', discid)
+                releases = dict(releases or {})
+                if releases.get(mbrelease['id']) == summary:
+                    continue
+                releases[mbrelease['id']] = summary
+                self.save('mb-discindex', discid, releases, expires=False)
+
+    def get_indexed_releases_by_discid(self, discid):
+        """Build a get_releases_by_discid answer from the indexed releases."""
+        found, releases = self.load('mb-discindex', discid)
+        if not releases:
+            return None
+        return {
+            'disc': {
+                'id': discid,
+                'release-list': list(releases.values()),
+            },
+        }
+
+    # }}}
+
+    # Dumps {{{
+
+    def import_dump(self, path):
+        """Import a local dump; Returns the number of entries imported.
+
+        path can be:
+        - A FreeDB (xmcd) dump directory: <category>/<disc_id> files;
+        - A JSON lines file of MusicBrainz releases (as returned by
+          musicbrainzngs.get_release_by_id, with or without the 'release'
+          wrapper) or of entries written by export_dump.
+        Imported entries never expire.
+        """
+        path = Path(path)
+        if path.is_dir():
+            return self._import_freedb_dump(path)
+        num = 0
+        with open(path, 'r', encoding='utf-8') as fp:
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                d = json.loads(line)
+                if 'kind' in d:
+                    self.save(d['kind'], d['key'], d['value'], expires=False)
+                    if d['kind'] == 'mb-release' and d['value'] is not None:
+                        self.index_release(d['value']['release'])
+                else:
+                    mbrelease = d.get('release', d)
+                    self.save('mb-release', mbrelease['id'], {'release': mbrelease}, expires=False)
+                    self.index_release(mbrelease)
+                num += 1
+        log.info('%s: Imported %d entries', path, num)
+        return num
+
+    def _import_freedb_dump(self, path):
+        from .extern import CDDB
+        queries = {}
+        num = 0
+        for category_dir in sorted(path.iterdir()):
+            if not category_dir.is_dir():
+                continue
+            category = category_dir.name
+            for xmcd_file in sorted(category_dir.iterdir()):
+                with open(xmcd_file, 'r', encoding='utf-8', errors='replace') as fp:
+                    read_info = CDDB.parse_read_reply(line.rstrip('\n') for line in fp)
+                disc_ids = [disc_id.strip() for disc_id in read_info.get('DISCID', xmcd_file.name).split(',')]
+                for disc_id in disc_ids:
+                    self.save('cddb-read', f'{category}-{disc_id}', (CDDB_READ_OK, read_info), expires=False)
+                    queries.setdefault(disc_id, []).append({
+                        'category': category,
+                        'disc_id': disc_id,
+                        'title': read_info.get('DTITLE', ''),
+                    })
+                num += 1
+        for disc_id, query_infos in queries.items():
+            if len(query_infos) == 1:
+                query = (CDDB_OK, query_infos[0])
+            else:
+                query = (CDDB_MULTIPLE_MATCHES, query_infos)
+            self.save('cddb-query', disc_id, query, expires=False)
+        log.info('%s: Imported %d FreeDB entries', path, num)
+        return num
+
+    def export_dump(self, file):
+        """Write all cache entries to file as JSON lines; Returns their number."""
+        store_dir = self.store_dir
+        num = 0
+        if store_dir is None or not store_dir.is_dir():
+            return num
+        with open(file, 'w', encoding='utf-8') as fp:
+            for kind_dir in sorted(store_dir.iterdir()):
+                if not kind_dir.is_dir() or kind_dir.name == 'mb-discindex':
+                    continue
+                for entry_file in sorted(kind_dir.glob('*.json')):
+                    entry = json.JsonFile(entry_file).read_json()
+                    fp.write(json.dumps({
+                        'kind': kind_dir.name,
+                        'key': entry_file.stem,
+                        'value': entry['value'],
+                    }, ensure_ascii=False) + '\n')
+                    num += 1
+        return num
+
+    # }}}
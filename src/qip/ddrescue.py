@@ -2,15 +2,27 @@
 # vim: set fileencoding=utf-8 :
 
 __all__ = [
+        'DdrescueMapFile',
+        'DdrescueMapWatcher',
+        'Sblock',
         'ddrescue',
         ]
 
+from pathlib import Path
+import array
+import bisect
 import enum
 import logging
 import re
 import os
+import select
+import struct
+import threading
+import time
+import types
 log = logging.getLogger(__name__)
 
+from .app import app
 from .exec import Executable, do_spawn_cmd
 from .file import TextFile
 
@@ -48,7 +60,7 @@ class Block(object):
             self.fix_size()
         super().__init__()
 
-    def fix_size():  # limit size_ to largest possible value
+    def fix_size(self):  # limit size_ to largest possible value
         if self._size < 0 or self._size > LLONG_MAX - self._pos:
             self._size = LLONG_MAX - self._pos
 
@@ -76,7 +88,7 @@ class Block(object):
                 self._size = max(self._size + self._pos, 0)
                 self._pos = 0
 
-    def enlarge(s):
+    def enlarge(self, s):
         if s < 0:
             s = LLONG_MAX
         if s > LLONG_MAX - self._pos - self._size:
@@ -127,7 +139,7 @@ class Block(object):
         return self._pos == other.end
 
     def includes(self, other):
-        return self._pos <= b._pos and self.end >= other.end
+        return self._pos <= other._pos and self.end >= other.end
 
     def includes_pos(self, pos):
         return self._pos <= pos and self.end > pos
@@ -184,7 +196,7 @@ class Sblock(Block):
     def __init__(self, *args):
         if len(args) == 2:
             b, st = args
-            p, s = b._pos, s._size
+            p, s = b._pos, b._size
         elif len(args) == 3:
             p, s, st = args
         else:
@@ -236,16 +248,63 @@ class DdrescueMapFileError(ValueError):
 
 
 class DdrescueMapFile(TextFile):
-    """A GNU ddrescue map file"""
+    """A GNU ddrescue map file
+
+    The blocks are stored in parallel arrays (positions, sizes and status
+    characters) rather than as Sblock objects so that maps with hundreds of
+    thousands of blocks stay cheap to load, query and summarize.
+    """
 
     current_pos = None
     #current_msg = None
     current_status = None
     current_pass = None
     #index = None      # cached index of last find or change
-    sblocks = None    # note: blocks are consecutive (list)
+    sblock_pos = None     # array of positions (consecutive blocks)
+    sblock_size = None    # array of sizes
+    sblock_status = None  # bytearray of status characters
     _cached_tot_size = None
 
+    _re_status_runs = re.compile(rb'(.)\1*', re.DOTALL)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clear_sblocks()
+
+    def clear_sblocks(self):
+        self.sblock_pos = array.array('q')
+        self.sblock_size = array.array('q')
+        self.sblock_status = bytearray()
+        self._cached_tot_size = None
+
+    @property
+    def sblocks(self):
+        """List of Sblock objects (built on demand)."""
+        return [Sblock(pos, size, chr(ch))
+                for pos, size, ch in zip(self.sblock_pos, self.sblock_size, self.sblock_status)]
+
+    @sblocks.setter
+    def sblocks(self, sblocks):
+        self.clear_sblocks()
+        for sb in sblocks:
+            self.append_sblock(sb.pos, sb.size, sb.status)
+
+    def append_sblock(self, pos, size, status):
+        self.sblock_pos.append(pos)
+        self.sblock_size.append(size)
+        self.sblock_status.append(ord(Sblock.Status(status).value))
+        self._cached_tot_size = None
+
+    def replace_sblocks(self, i, j, sblock_pos, sblock_size, sblock_status):
+        """Replace blocks [i:j] with the given arrays."""
+        self.sblock_pos[i:j] = sblock_pos
+        self.sblock_size[i:j] = sblock_size
+        self.sblock_status[i:j] = sblock_status
+        self._cached_tot_size = None
+
+    def __len__(self):
+        return len(self.sblock_pos)
+
     @staticmethod
     def enumerate_lines(fp):
         """Read lines discarding comments, leading whitespace and blank lines."""
@@ -265,93 +324,459 @@ class DdrescueMapFile(TextFile):
         if file is None:
             with self.open('r') as file:
                 return self.load(file=file, default_sblock_status=default_sblock_status)
-        loose = Sblock.isstatus(default_sblock_status)
-        self.sblocks = []
-        self._cached_tot_size = None
+        self.clear_sblocks()
         iter_lines = self.enumerate_lines(file)
         try:
             linenum, line = next(iter_lines)
         except StopIteration:
             return  # Empty
-        # status line
+        self.parse_status_line(linenum, line)
+        self.sblock_pos, self.sblock_size, self.sblock_status = \
+            self.parse_sblock_lines(iter_lines, default_sblock_status=default_sblock_status)
+
+    def parse_status_line(self, linenum, line):
         self.current_pass = 1  # default value
         m = re.match(r'^(?P<pos>\d+|0[xX][A-Fa-f0-9]+)\s+(?P<ch>\S+)(?:\s+(?P<pass>\d+))?', line)  # "%lli %c %d\n"
         if m:
             self.current_pos = int(m.group('pos'), 0)
             ch = m.group('ch')
-            try:
+            if m.group('pass') is not None:
                 self.current_pass = int(m.group('pass'))
-            except KeyError:
-                pass
         if m and self.current_pos >= 0 and Sblock.isstatus(ch) and self.current_pass >= 1:
             self.current_status = Sblock.Status(ch)
         else:
             raise DdrescueMapFileError(self, linenum, line=line)
-        re_sblock = re.compile(r'^(?P<pos>\d+|0[xX][A-Fa-f0-9]+)\s+(?P<size>\d+|0[xX][A-Fa-f0-9]+)\s+(?P<ch>\S)$')  # "%lli %lli %c\n"
+
+    def parse_sblock_lines(self, iter_lines, *, end=0, default_sblock_status=None):
+        """Parse block lines ("%lli %lli %c") following a block ending at end.
+
+        Returns (positions, sizes, statuses) arrays.
+        """
+        loose = Sblock.isstatus(default_sblock_status)
+        if loose:
+            default_ch = ord(Sblock.Status(default_sblock_status).value)
+        valid_chs = frozenset(e.value for e in Sblock.Status)
+        sblock_pos = array.array('q')
+        sblock_size = array.array('q')
+        sblock_status = bytearray()
         for linenum, line in iter_lines:
-            m = re_sblock.match(line)
-            if m:
-                pos = int(m.group('pos'), 0)
-                size = int(m.group('size'), 0)
-                ch = m.group('ch')
-            if m and pos >= 0 and Sblock.isstatus(ch) and (size > 0 or (size == 0 and pos == 0)):
-                st = Sblock.Status(ch)
-                sb = Sblock(pos, size, st)
-                try:
-                    b = self.sblocks[-1]
-                except IndexError:
-                    end = 0
-                else:
-                    end = b.end
-                if sb.pos != end:
-                    if loose and sb.pos > end:
-                        sb2 = Sblock(end, sb.pos - end, default_sblock_status)
-                        self.sblocks.append(sb2)
-                    elif end > 0:
-                        raise DdrescueMapFileError(self, linenum, line=line)
-                self.sblocks.append(sb)
-            else:
+            try:
+                pos, size, ch = line.split()
+                pos = int(pos, 0)
+                size = int(size, 0)
+            except ValueError:
+                raise DdrescueMapFileError(self, linenum, line=line)
+            if pos < 0 or ch not in valid_chs or not (size > 0 or (size == 0 and pos == 0)):
                 raise DdrescueMapFileError(self, linenum, line=line)
+            if pos != end:
+                if loose and pos > end:
+                    sblock_pos.append(end)
+                    sblock_size.append(pos - end)
+                    sblock_status.append(default_ch)
+                elif end > 0:
+                    raise DdrescueMapFileError(self, linenum, line=line)
+            sblock_pos.append(pos)
+            sblock_size.append(size)
+            sblock_status.append(ord(ch))
+            end = pos + size
+        return sblock_pos, sblock_size, sblock_status
+
+    def find_index(self, pos):
+        """Index of the block including pos, or None."""
+        i = bisect.bisect_right(self.sblock_pos, pos) - 1
+        if i >= 0 and pos < self.sblock_pos[i] + self.sblock_size[i]:
+            return i
+        return None
+
+    def sblock_at(self, pos):
+        """The Sblock including pos, or None."""
+        i = self.find_index(pos)
+        if i is None:
+            return None
+        return Sblock(self.sblock_pos[i], self.sblock_size[i], chr(self.sblock_status[i]))
+
+    def iter_status_runs(self):
+        """Iterate (first index, end index, status) of runs of blocks of the same status."""
+        for m in self._re_status_runs.finditer(self.sblock_status):
+            yield m.start(), m.end(), Sblock.Status(chr(m.group(1)[0]))
+
+    def iter_areas(self, status=None):
+        """Iterate (pos, size, status) of the contiguous areas of the map,
+        optionally only those of the given status(es).
+        """
+        if isinstance(status, (Sblock.Status, str)):
+            status = (status,)
+        if status is not None:
+            status = frozenset(Sblock.Status(st) for st in status)
+        sblock_pos = self.sblock_pos
+        sblock_size = self.sblock_size
+        for l, r, st in self.iter_status_runs():
+            if status is None or st in status:
+                pos = sblock_pos[l]
+                yield pos, sblock_pos[r - 1] + sblock_size[r - 1] - pos, st
+
+    def iter_remaining_areas(self):
+        """Iterate (pos, size, status) of the areas not yet finished."""
+        return self.iter_areas(status=[st for st in Sblock.Status
+                                       if st is not Sblock.Status.finished])
 
     def is_finished(self):
-        return all(
-            sb.status is Sblock.Status.finished
-            for sb in self.sblocks)
+        return self.sblock_status.count(ord(Sblock.Status.finished.value)) == len(self.sblock_status)
 
     def compact_sblocks(self):
-        new_vector = []
-        l = 0
-        while l < len(self.sblocks):
-            run = self.sblocks[l]
-            r = l + 1
-            while r < len(self.sblocks) \
-                    and self.sblocks[r].status == run.status:
-                r += 1
-            if r > l + 1:
-                run.size = self.sblocks[r-1].end - run.pos
-            new_vector.append(run)
-            l = r;
-        self.sblocks = new_vector
+        if len(self.sblock_status) == len(self._re_status_runs.findall(self.sblock_status)):
+            return  # Already compact
+        areas = list(self.iter_areas())
+        self.clear_sblocks()
+        for pos, size, st in areas:
+            self.append_sblock(pos, size, st)
+
+    def count_sblocks(self, status):
+        return self.sblock_status.count(ord(Sblock.Status(status).value))
 
     def stats(self):
         d = {e: 0 for e in Sblock.Status}
-        total_size = 0
-        for sb in self.sblocks:
-            sb_size = sb.size
-            d[sb.status] += sb_size
-            total_size += sb_size
-        d['total'] = total_size
+        sblock_size = self.sblock_size
+        for l, r, st in self.iter_status_runs():
+            d[st] += sum(sblock_size[l:r])
+        d['total'] = sum(d.values())
         return d
 
     @property
     def tot_size(self):
         if self._cached_tot_size is None:
-            self._cached_tot_size = sum(
-                sb.size
-                for sb in self.sblocks)
+            self._cached_tot_size = sum(self.sblock_size)
         return self._cached_tot_size
 
 
+def _common_prefix_len(a, b):
+    # Binary search on memcmp-backed slice comparisons
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_len(a, b, limit):
+    la, lb = len(a), len(b)
+    lo, hi = 0, min(la, lb, limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la - mid:la - lo] == b[lb - mid:lb - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class _Inotify(object):
+    # Minimal inotify(7) through libc
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+
+    event_st = struct.Struct('iIII')  # wd, mask, cookie, len
+
+    def __init__(self, dir, mask):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        if libc.inotify_add_watch(self.fd, os.fsencode(dir), ctypes.c_uint32(mask)) < 0:
+            e = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(e, os.strerror(e), os.fspath(dir))
+
+    def read_names(self, timeout):
+        """Wait up to timeout seconds for events; Returns the set of names."""
+        names = set()
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if r:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, name_len = self.event_st.unpack_from(data, offset)
+                offset += self.event_st.size
+                names.add(os.fsdecode(data[offset:offset + name_len].rstrip(b'\0')))
+                offset += name_len
+        return names
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class DdrescueMapWatcher(object):
+    """Follow the progress of a running ddrescue through its map file.
+
+    ddrescue rewrites the whole map file periodically; Only the block lines
+    that differ from the previous version are re-parsed and spliced into the
+    map, and the per-status totals are adjusted by the difference.
+    Changes are detected with inotify, or by polling the file's stat.
+
+    Progress (rescued bytes, bad sectors, current pass and rescue rate) is
+    published through app.statsd gauges under `stat` and an optional
+    progress bar.
+    """
+
+    poll_interval = 1.0
+    min_interval = 1.0  # Minimum time between updates
+    sector_size = 2048
+
+    def __init__(self, map_file, *, stat='ddrescue', progress_bar=False,
+                 use_inotify=True, poll_interval=None, min_interval=None,
+                 sector_size=None, callbacks=()):
+        if not isinstance(map_file, DdrescueMapFile):
+            map_file = DdrescueMapFile(map_file)
+        self.map_file = map_file
+        self.stat = stat
+        self.show_progress_bar = progress_bar
+        self.progress_bar = None
+        self.use_inotify = use_inotify
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+        if min_interval is not None:
+            self.min_interval = min_interval
+        if sector_size is not None:
+            self.sector_size = sector_size
+        self.callbacks = list(callbacks)
+        self.progress = None
+        self._data = None         # Block section of the last version
+        self._status_sizes = {}   # {status char: total size}
+        self._file_stat = None
+        self._last_update = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _block_section_offset(data):
+        # Offset of the first block line: After the status line and comments
+        offset = 0
+        status_line = None
+        while offset < len(data):
+            eol = data.find(b'\n', offset)
+            if eol < 0:
+                eol = len(data)
+            line = data[offset:eol].strip()
+            if line and not line.startswith(b'#'):
+                if status_line is not None:
+                    return status_line, offset
+                status_line = (offset, line)
+            offset = eol + 1
+        return status_line, len(data)
+
+    def _iter_block_lines(self, data, start, end):
+        return self.map_file.enumerate_lines(
+            data[start:end].decode('ascii').splitlines())
+
+    def _count_status_sizes(self, i, j, sign):
+        map_file = self.map_file
+        status_sizes = self._status_sizes
+        for ch, size in zip(map_file.sblock_status[i:j], map_file.sblock_size[i:j]):
+            status_sizes[ch] = status_sizes.get(ch, 0) + sign * size
+
+    def update(self, data=None):
+        """Update from the map file's contents (read if not given).
+
+        Returns True if the map changed, False if not and None if the
+        contents are incomplete (ddrescue rewrite in progress) or invalid.
+        """
+        map_file = self.map_file
+        if data is None:
+            try:
+                with open(map_file.file_name, 'rb') as fp:
+                    data = fp.read()
+            except FileNotFoundError:
+                return None
+        if not data.endswith(b'\n'):
+            return None
+        status_line, offset = self._block_section_offset(data)
+        if status_line is None:
+            return None
+        try:
+            map_file.parse_status_line(0, status_line[1].decode('ascii'))
+        except (DdrescueMapFileError, UnicodeDecodeError) as e:
+            log.debug('%s: %s', map_file, e)
+            return None
+        new = data[offset:]
+        old = self._data
+        try:
+            if old is None or not self._update_blocks(old, new):
+                sblock_arrays = map_file.parse_sblock_lines(self._iter_block_lines(new, 0, len(new)))
+                map_file.replace_sblocks(0, len(map_file), *sblock_arrays)
+                self._status_sizes = {}
+                self._count_status_sizes(0, len(map_file), 1)
+                if new.count(b'\n') != len(map_file):
+                    # Blank or comment lines within blocks: No incremental updates
+                    new = None
+        except (DdrescueMapFileError, UnicodeDecodeError) as e:
+            log.debug('%s: %s', map_file, e)
+            self._data = None
+            return None
+        changed = old is None or old != new
+        self._data = new
+        return changed
+
+    def _update_blocks(self, old, new):
+        # Returns False if a full parse is required
+        map_file = self.map_file
+        p = _common_prefix_len(old, new)
+        if p == len(old) == len(new):
+            return True  # Unchanged
+        s = _common_suffix_len(old, new, min(len(old), len(new)) - p)
+        # Changed lines: [head, tail) in old, [head, tail + delta) in new
+        head = old.rfind(b'\n', 0, p) + 1
+        tail = old.find(b'\n', len(old) - s)
+        tail = len(old) if tail < 0 else tail + 1
+        delta = len(new) - len(old)
+        i = old.count(b'\n', 0, head)
+        j = len(map_file) - old.count(b'\n', tail)
+        end = map_file.sblock_pos[i - 1] + map_file.sblock_size[i - 1] if i else 0
+        sblock_arrays = map_file.parse_sblock_lines(
+            self._iter_block_lines(new, head, tail + delta), end=end)
+        if len(sblock_arrays[0]) != new.count(b'\n', head, tail + delta):
+            return False  # Blank or comment lines within blocks
+        if j < len(map_file):
+            new_end = sblock_arrays[0][-1] + sblock_arrays[1][-1] if sblock_arrays[0] else end
+            if new_end != map_file.sblock_pos[j]:
+                return False
+        self._count_status_sizes(i, j, -1)
+        map_file.replace_sblocks(i, j, *sblock_arrays)
+        self._count_status_sizes(i, i + len(sblock_arrays[0]), 1)
+        return True
+
+    def stats(self):
+        """Like DdrescueMapFile.stats, from the running totals."""
+        d = {e: self._status_sizes.get(ord(e.value), 0) for e in Sblock.Status}
+        d['total'] = sum(d.values())
+        return d
+
+    def publish(self):
+        """Update self.progress and publish it."""
+        map_file = self.map_file
+        now = time.monotonic()
+        stats = self.stats()
+        progress = types.SimpleNamespace(
+            rescued=stats[Sblock.Status.finished],
+            bad_size=stats[Sblock.Status.bad_sector],
+            bad_sectors=stats[Sblock.Status.bad_sector] // self.sector_size,
+            bad_areas=map_file.count_sblocks(Sblock.Status.bad_sector),
+            total=stats['total'],
+            current_pos=map_file.current_pos,
+            current_status=map_file.current_status,
+            current_pass=map_file.current_pass,
+            rate=0.0,
+            time=now,
+        )
+        prev = self.progress
+        if prev is not None and now > prev.time:
+            progress.rate = max(0, progress.rescued - prev.rescued) / (now - prev.time)
+        self.progress = progress
+        if app.statsd:
+            app.statsd.gauge(f'{self.stat}.rescued', progress.rescued)
+            app.statsd.gauge(f'{self.stat}.bad_sectors', progress.bad_sectors)
+            app.statsd.gauge(f'{self.stat}.bad_areas', progress.bad_areas)
+            app.statsd.gauge(f'{self.stat}.pass', progress.current_pass)
+            app.statsd.gauge(f'{self.stat}.rate', progress.rate)
+        if self.show_progress_bar and progress.total:
+            if self.progress_bar is None:
+                try:
+                    from qip.utils import BytesBar
+                except ImportError:
+                    self.show_progress_bar = False
+                else:
+                    self.progress_bar = BytesBar(f'Rescuing {self.map_file}', max=progress.total)
+            if self.progress_bar is not None:
+                self.progress_bar.max = progress.total
+                self.progress_bar.goto(progress.rescued)
+        for callback in self.callbacks:
+            callback(progress)
+        return progress
+
+    def check(self, force=False):
+        """Update and publish if the map file changed."""
+        try:
+            st = os.stat(self.map_file.file_name)
+        except FileNotFoundError:
+            return False
+        file_stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if not force and file_stat == self._file_stat:
+            return False
+        now = time.monotonic()
+        if not force and self._last_update is not None \
+                and now - self._last_update < self.min_interval:
+            return False
+        self._last_update = now
+        changed = self.update()
+        if changed is None:
+            return False
+        self._file_stat = file_stat
+        if changed or self.progress is None:
+            self.publish()
+        return changed
+
+    def run(self):
+        """Watch until stop() is called."""
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(
+                    Path(self.map_file.file_name).parent,
+                    _Inotify.IN_CLOSE_WRITE | _Inotify.IN_MOVED_TO | _Inotify.IN_CREATE)
+            except (OSError, AttributeError) as e:
+                log.debug('inotify not available (%s); Polling %s', e, self.map_file)
+        try:
+            name = Path(self.map_file.file_name).name
+            self.check(force=True)
+            while not self._stop_event.is_set():
+                if inotify is not None:
+                    if name not in inotify.read_names(self.poll_interval):
+                        # Still check on timeout: Throttled or missed events
+                        if self._last_update is not None \
+                                and time.monotonic() - self._last_update < self.poll_interval:
+                            continue
+                else:
+                    self._stop_event.wait(self.poll_interval)
+                self.check()
+            self.check(force=True)
+        finally:
+            if inotify is not None:
+                inotify.close()
+            if self.progress_bar is not None:
+                self.progress_bar.finish()
+                self.progress_bar = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name=f'DdrescueMapWatcher-{self.map_file}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+
 class Ddrescue(Executable):
 
     name = 'ddrescue'
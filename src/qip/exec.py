@@ -3,6 +3,10 @@
 
 __all__ = [
         'SpawnedProcessError',
+        'LinePattern',
+        'OutputRecorder',
+        'PipeRecordThread',
+        'collect_child_rusage',
         'dbg_exec_cmd',
         'do_exec_cmd',
         'suggest_exec_cmd',
@@ -37,6 +41,7 @@ __all__ = [
 
 from pathlib import Path
 import abc
+import asyncio
 import collections
 import contextlib
 import enum
@@ -49,6 +54,7 @@ import pexpect.fdpexpect
 import pexpect.popen_spawn
 import pexpect.spawnbase
 import pexpect.utils
+import ptyprocess
 import re
 import shlex
 import shutil
@@ -93,18 +99,158 @@ class SpawnedProcessError(subprocess.CalledProcessError):
         super().__init__(returncode=returncode, cmd=cmd, output=output, stderr=stderr)
 
 
+LinePattern = collections.namedtuple(
+    'LinePattern',
+    (
+        'pattern',
+        'prefixes',
+    ),
+)
+LinePattern.__doc__ = """Pattern only tried on lines starting with one of prefixes.
+
+Leading whitespace and "[tag]" groups (log levels, contexts) are skipped
+before prefixes are compared.
+"""
+
+_line_patterns_cache = {}
+
+_child_rusage = threading.local()
+
+@contextlib.contextmanager
+def collect_child_rusage():
+    """Collect the resource usage of children reaped by Popen and spawn
+    objects created by the current thread within this context.
+
+    Yields the list of os.wait4 rusage results, appended as children are
+    reaped.
+    """
+    collectors = _child_rusage.__dict__.setdefault('collectors', [])
+    rusages = []
+    collectors.append(rusages)
+    try:
+        yield rusages
+    finally:
+        collectors.remove(rusages)
+
+def _current_rusage_collectors():
+    return tuple(getattr(_child_rusage, 'collectors', ()))
+
+class Popen(subprocess.Popen):
+    """subprocess.Popen reaping its child with os.wait4 (see collect_child_rusage)."""
+
+    def __init__(self, *args, **kwargs):
+        self._rusage_collectors = _current_rusage_collectors()
+        super().__init__(*args, **kwargs)
+
+    def _wait4pid(self, pid, options):
+        pid, sts, rusage = os.wait4(pid, options)
+        if pid:
+            for rusages in self._rusage_collectors:
+                rusages.append(rusage)
+        return (pid, sts)
+
+    def _try_wait(self, wait_flags):
+        try:
+            return self._wait4pid(self.pid, wait_flags)
+        except ChildProcessError:
+            # See subprocess.Popen._try_wait
+            return (self.pid, 0)
+
+    def _internal_poll(self, *args, _waitpid=None, **kwargs):
+        return super()._internal_poll(*args, _waitpid=self._wait4pid, **kwargs)
+
+def run(*popenargs, input=None, capture_output=False, timeout=None, check=False, **kwargs):
+    """subprocess.run using Popen (see collect_child_rusage)."""
+    if input is not None:
+        if kwargs.get('stdin') is not None:
+            raise ValueError('stdin and input arguments may not both be used.')
+        kwargs['stdin'] = subprocess.PIPE
+    if capture_output:
+        if kwargs.get('stdout') is not None or kwargs.get('stderr') is not None:
+            raise ValueError('stdout and stderr arguments may not be used '
+                             'with capture_output.')
+        kwargs['stdout'] = subprocess.PIPE
+        kwargs['stderr'] = subprocess.PIPE
+    with Popen(*popenargs, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired as exc:
+            process.kill()
+            exc.stdout, exc.stderr = process.communicate()
+            raise
+        except:
+            process.kill()
+            raise
+        retcode = process.poll()
+        if check and retcode:
+            raise subprocess.CalledProcessError(retcode, process.args,
+                                                output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(process.args, retcode, stdout, stderr)
+
+class PtyProcess(ptyprocess.PtyProcess):
+    """ptyprocess.PtyProcess reaping its child with os.wait4 (see collect_child_rusage)."""
+
+    def __init__(self, pid, fd):
+        self._rusage_collectors = _current_rusage_collectors()
+        super().__init__(pid, fd)
+
+    def _wait4(self, options):
+        pid, status, rusage = os.wait4(self.pid, options)
+        if not pid:
+            return False
+        for rusages in self._rusage_collectors:
+            rusages.append(rusage)
+        if os.WIFEXITED(status):
+            self.status = status
+            self.exitstatus = os.WEXITSTATUS(status)
+            self.signalstatus = None
+            self.terminated = True
+        elif os.WIFSIGNALED(status):
+            self.status = status
+            self.exitstatus = None
+            self.signalstatus = os.WTERMSIG(status)
+            self.terminated = True
+        elif os.WIFSTOPPED(status):
+            raise ptyprocess.PtyProcessError('Child process is stopped. This is not supported.')
+        return True
+
+    def wait(self):
+        if self.isalive():
+            self._wait4(0)
+        return self.exitstatus
+
+    def isalive(self):
+        if self.terminated:
+            return False
+        try:
+            # Linux requires the blocking form to get the status of a defunct
+            # process; flag_eof is set by read_nonblocking (See ptyprocess)
+            return not self._wait4(0 if self.flag_eof else os.WNOHANG)
+        except ChildProcessError:
+            raise ptyprocess.PtyProcessError('isalive() encountered condition '
+                    'where "terminated" is 0, but there was no child '
+                    'process. Did someone else call waitpid() '
+                    'on our process?')
+
 class _SpawnMixin(pexpect.spawnbase.SpawnBase):
 
+    line_oriented = False
+    line_read_size = 65536
+
     def __init__(self, *args, errors=None, timeout=None, **kwargs):
         super().__init__(*args, codec_errors=errors, timeout=timeout, **kwargs)
 
     def communicate(self, pattern_dict,
                     timeout=-1, searchwindowsize=-1):
-        pattern_kv_list = list(pattern_dict.items())
-        pattern_list = [k for k, v in pattern_kv_list]
-        compiled_pattern_list = self.compile_pattern_list(pattern_list)
         if timeout == -1:
             timeout = self.timeout
+        if self.line_oriented:
+            yield from self.communicate_lines(pattern_dict, timeout=timeout)
+            return
+        pattern_kv_list = list(pattern_dict.items())
+        pattern_list = [k.pattern if isinstance(k, LinePattern) else k
+                        for k, v in pattern_kv_list]
+        compiled_pattern_list = self.compile_pattern_list(pattern_list)
         from pexpect.expect import Expecter, searcher_re
         searcher = searcher_re(compiled_pattern_list)
         exp = Expecter(spawn=self, searcher=searcher, searchwindowsize=searchwindowsize)
@@ -115,6 +261,135 @@ class _SpawnMixin(pexpect.spawnbase.SpawnBase):
             k, v = pattern_kv_list[idx]
             yield v
 
+    def compile_line_patterns(self, pattern_list):
+        """Return a list of (compiled regex, prefixes) tuples for pattern_list.
+
+        EOF and TIMEOUT are returned as is. Results are cached per class.
+        """
+        pattern_list = tuple(pattern_list)
+        cache_key = (type(self), self.string_type, pattern_list)
+        try:
+            return _line_patterns_cache[cache_key]
+        except KeyError:
+            pass
+        line_patterns = []
+        for k in pattern_list:
+            if k is pexpect.EOF or k is pexpect.TIMEOUT:
+                line_patterns.append(k)
+                continue
+            prefixes = None
+            if isinstance(k, LinePattern):
+                k, prefixes = k
+                prefixes = tuple(self._coerce_expect_string(prefix)
+                                 for prefix in prefixes)
+            regex, = self.compile_pattern_list([k])
+            line_patterns.append((regex, prefixes))
+        _line_patterns_cache[cache_key] = line_patterns
+        return line_patterns
+
+    def communicate_lines(self, pattern_dict, timeout=None):
+        """Line-oriented alternative to pexpect's buffer scanning.
+
+        Output is split once on CR, LF or CRLF and each line is only
+        matched (with re.match) against the patterns whose prefixes it
+        starts with. Partial lines (prompts) are tried after each read.
+        Reads wait in select() via read_nonblocking so idle processes cost
+        nothing.
+        """
+        pattern_kv_list = list(pattern_dict.items())
+        line_patterns = self.compile_line_patterns(k for k, v in pattern_kv_list)
+        regex_patterns = [(idx,) + line_pattern
+                          for idx, line_pattern in enumerate(line_patterns)
+                          if isinstance(line_pattern, tuple)]
+        special_idx = {line_pattern: idx
+                       for idx, line_pattern in enumerate(line_patterns)
+                       if not isinstance(line_pattern, tuple)}
+        empty = self.string_type()
+        cr, lbracket, rbracket = (b'\r', b'[', b']') if self.string_type is bytes else ('\r', '[', ']')
+        line_re = re.compile(b'[^\r\n]*(?:\r\n|\r|\n)' if self.string_type is bytes
+                             else '[^\r\n]*(?:\r\n|\r|\n)')
+
+        def match_line(line):
+            text = line.lstrip()
+            while text[:1] == lbracket:
+                end = text.find(rbracket)
+                if end == -1:
+                    break
+                text = text[end + 1:].lstrip()
+            for idx, regex, prefixes in regex_patterns:
+                if prefixes is not None and not text.startswith(prefixes):
+                    continue
+                m = regex.match(line)
+                if m is not None and m.end():
+                    return idx, m
+            return None, None
+
+        before = empty
+        buf = empty
+        eof = False
+        while True:
+            try:
+                buf += self.read_nonblocking(max(self.maxread, self.line_read_size), timeout)
+            except pexpect.EOF:
+                eof = True
+            except pexpect.TIMEOUT as err:
+                try:
+                    idx = special_idx[pexpect.TIMEOUT]
+                except KeyError:
+                    raise err from None
+                self.before = before + buf
+                self.match = self.after = pexpect.TIMEOUT
+                self.match_index = idx
+                # Keep the partial line in buf; It may complete on a later read.
+                before = empty
+                yield pattern_kv_list[idx][1]
+                continue
+
+            lines = line_re.findall(buf)
+            buf = buf[sum(map(len, lines)):]
+            if eof:
+                if buf:
+                    lines.append(buf)
+                    buf = empty
+            elif not buf and lines and lines[-1].endswith(cr):
+                # May be the first half of a CRLF split across reads
+                buf = lines.pop()
+            for line in lines:
+                while line:
+                    idx, m = match_line(line)
+                    if m is None:
+                        before += line
+                        break
+                    self.before = before
+                    self.match = m
+                    self.after = m.group(0)
+                    self.match_index = idx
+                    line = line[m.end():]
+                    before = empty
+                    yield pattern_kv_list[idx][1]
+            if buf:
+                # Partial line (prompt)
+                idx, m = match_line(buf)
+                if m is not None:
+                    self.before = before
+                    self.match = m
+                    self.after = m.group(0)
+                    self.match_index = idx
+                    buf = buf[m.end():]
+                    before = empty
+                    yield pattern_kv_list[idx][1]
+
+            if eof:
+                self.before = before + buf
+                self.match = self.after = pexpect.EOF
+                try:
+                    idx = special_idx[pexpect.EOF]
+                except KeyError:
+                    raise pexpect.EOF('End Of File (EOF).')
+                self.match_index = idx
+                yield pattern_kv_list[idx][1]
+                return
+
     def __enter__(self):
         pass
 
@@ -133,13 +408,19 @@ class _SpawnMixin(pexpect.spawnbase.SpawnBase):
 class spawn(_SpawnMixin, pexpect.spawn):
 
     def __init__(self, command, args=[],
+                 pass_fds=(),
                  **kwargs):
         if command is not None:
             command = os.fspath(command)
         args = list2cmdlist(args)
+        self.pass_fds = tuple(pass_fds)
         super().__init__(command=command, args=args,
                          **kwargs)
 
+    def _spawnpty(self, args, **kwargs):
+        # See pexpect.pty_spawn.spawn._spawnpty
+        return PtyProcess.spawn(args, pass_fds=self.pass_fds, **kwargs)
+
 class fdspawn(_SpawnMixin, pexpect.fdpexpect.fdspawn):
 
     def __init__(self, fd, command=None, args=None,
@@ -200,10 +481,10 @@ class popen_spawn(_SpawnMixin, pexpect.popen_spawn.PopenSpawn):
                 # raise ValueError('read_from not set and neither stdout nor stderr are pipes')
                 read_from = None
 
-        self.proc = subprocess.Popen(cmd,
-                                     bufsize=bufsize,
-                                     stdin=stdin, stdout=stdout, stderr=stderr,
-                                     **kwargs)
+        self.proc = Popen(cmd,
+                          bufsize=bufsize,
+                          stdin=stdin, stdout=stdout, stderr=stderr,
+                          **kwargs)
         self.pid = self.proc.pid
         self.closed = False
         self._buf = self.string_type()
@@ -262,9 +543,9 @@ def dbg_exec_cmd(cmd, *, hidden_args=[],
         stdout = subprocess.PIPE
     cmd = list2cmdlist(cmd)
     hidden_args = list2cmdlist(hidden_args)
-    run_out = subprocess.run(cmd + hidden_args,
-                             stdout=stdout,
-                             check=True, **kwargs)
+    run_out = run(cmd + hidden_args,
+                  stdout=stdout,
+                  check=True, **kwargs)
     if return_CompletedProcess:
         return run_out
     else:
@@ -324,7 +605,7 @@ def dbg_popen_cmd(cmd, *, hidden_args=[], dry_run=None, log_append='', **kwargs)
                     log_append)
     cmd = list2cmdlist(cmd)
     hidden_args = list2cmdlist(hidden_args)
-    return subprocess.Popen(cmd + hidden_args, **kwargs)
+    return Popen(cmd + hidden_args, **kwargs)
 
 def do_popen_cmd(cmd, *, dry_run=None, log_append='', **kwargs):
     if dry_run is None:
@@ -368,11 +649,13 @@ def dbg_spawn_cmd(cmd, hidden_args=[],
                   dry_run=None, no_status=False, yes=False, logfile=True,
                   cwd=None,
                   encoding=None, errors=None,
+                  output_tail_limit=None,
                   ):
     if app.log.isEnabledFor(logging.DEBUG):
         app.log.verbose('CMD: %s',
                         list2cmdline(cmd))
-    out = ''
+    # Full output by default: Callers parse it.
+    out = OutputRecorder(text=True, tail_limit=output_tail_limit)
     if logfile is True:
         logfile = sys.stdout if encoding else sys.stdout.buffer
     elif logfile is False:
@@ -391,11 +674,13 @@ def dbg_spawn_cmd(cmd, hidden_args=[],
             ])
         if index == 2:
             #app.log.debug('<<< %s%s', byte_decode(p.before), byte_decode(p.match.group(0)))
-            out += byte_decode(p.before) + byte_decode(p.match.group(0))
+            out.write(byte_decode(p.before))
+            out.write(byte_decode(p.match.group(0)))
         elif index == 0:
             #app.log.debug('<<< %s%s', byte_decode(p.before), p.match.group(0))
             #puts [list <<< $expect_out(buffer)]
-            out += byte_decode(p.before) + byte_decode(p.match.group(0))
+            out.write(byte_decode(p.before))
+            out.write(byte_decode(p.match.group(0)))
             logfile = p.logfile
             logfile_send = p.logfile_send
             try:
@@ -417,7 +702,8 @@ def dbg_spawn_cmd(cmd, hidden_args=[],
         elif index == 1:
             #app.log.debug('<<< %s%s', byte_decode(p.before), p.match.group(0))
             #puts [list <<< $expect_out(buffer)]
-            out += byte_decode(p.before) + byte_decode(p.match.group(0))
+            out.write(byte_decode(p.before))
+            out.write(byte_decode(p.match.group(0)))
             logfile = p.logfile
             logfile_send = p.logfile_send
             try:
@@ -438,7 +724,7 @@ def dbg_spawn_cmd(cmd, hidden_args=[],
                 p.logfile = logfile
         elif index == 3:
             #app.log.debug('<<< %s%s', byte_decode(p.before))
-            out += byte_decode(p.before)
+            out.write(byte_decode(p.before))
             break
     try:
         p.wait()
@@ -446,6 +732,7 @@ def dbg_spawn_cmd(cmd, hidden_args=[],
         if err.value != 'Cannot wait for dead child process.':
             raise
     p.close()
+    out = out.getvalue()
     if p.signalstatus is not None:
         raise Exception('Command exited due to signal %r' % (p.signalstatus,))
     if not no_status and p.exitstatus:
@@ -539,7 +826,7 @@ class Executable(metaclass=abc.ABCMeta):
 
     Args = Args
 
-    popen_class = subprocess.Popen
+    popen_class = Popen
 
     run_func = None
     run_func_options = (
@@ -616,13 +903,13 @@ class Executable(metaclass=abc.ABCMeta):
         p = spawn_func(cmd[0], args=cmd[1:] + hidden_args, logfile=logfile,
                        encoding=encoding, errors=errors,  # text=text,
                        **kwargs)
+        recorder = OutputRecorder(text=bool(text_mode))
         with p:
             pattern_dict = p.get_pattern_dict()
-            out = '' if text_mode else b''
             for v in p.communicate(pattern_dict=pattern_dict):
-                out += p.before
+                recorder.write(p.before)
                 if p.match and p.match is not pexpect.EOF:
-                    out += p.match.group(0)
+                    recorder.write(p.match.group(0))
                 if callable(v):
                     if p.match is pexpect.EOF:
                         b = v(None)
@@ -632,6 +919,7 @@ class Executable(metaclass=abc.ABCMeta):
                         break
                 if p.after is pexpect.EOF:
                     break
+        out = recorder.getvalue()
         if p.signalstatus is not None:
             raise Exception('Command exited due to signal %r' % (p.signalstatus,))
         if not no_status and p.exitstatus:
@@ -662,13 +950,13 @@ class Executable(metaclass=abc.ABCMeta):
         elif logfile is False:
             logfile = None
         p = self.popen_spawn(cmd + hidden_args, logfile=logfile, **kwargs)
+        recorder = OutputRecorder(text=True)
         with p:
             pattern_dict = p.get_pattern_dict()
-            out = ''
             for v in p.communicate(pattern_dict=pattern_dict):
-                out += byte_decode(p.before)
+                recorder.write(byte_decode(p.before))
                 if p.match and p.match is not pexpect.EOF:
-                    out += byte_decode(p.match.group(0))
+                    recorder.write(byte_decode(p.match.group(0)))
                 if callable(v):
                     if p.match is pexpect.EOF:
                         b = v(None)
@@ -678,6 +966,7 @@ class Executable(metaclass=abc.ABCMeta):
                         break
                 if p.after is pexpect.EOF:
                     break
+        out = recorder.getvalue()
         if p.signalstatus is not None:
             raise Exception('Command exited due to signal %r' % (p.signalstatus,))
         if not no_status and p.exitstatus:
@@ -904,6 +1193,16 @@ class Executable(metaclass=abc.ABCMeta):
 
     __call__ = run
 
+    async def arun(self, *args, executor=None, **kwargs):
+        """Asynchronous run(); The command runs in executor (default: the loop's).
+
+        See qip.jobs.JobScheduler for concurrency limits.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor,
+            functools.partial(self.run, *args, **kwargs))
+
     def popen(self, *args, **kwargs):
         return self._popen(*args, **kwargs)
 
@@ -1039,39 +1338,139 @@ class Ionice(Executable):
 ionice = Ionice()
 
 
+class OutputRecorder(object):
+    """Bounded capture of streamed output.
+
+    Only the last tail_limit bytes (or characters, in text mode) are kept
+    unless tail_limit is None. Everything can also be spilled to a file
+    (path or file object) and passed to callbacks as it is written.
+
+    write() and getvalue() may be called from different threads.
+    """
+
+    def __init__(self, text=False, tail_limit=None, spill_file=None, callbacks=()):
+        self.text = text
+        self.tail_limit = tail_limit
+        self.callbacks = list(callbacks)
+        self.total_size = 0
+        self.truncated = False
+        self._lock = threading.Lock()
+        self._chunks = collections.deque()
+        self._size = 0
+        self._spill_fp = None
+        self._close_spill_fp = False
+        if spill_file is not None:
+            if isinstance(spill_file, (str, os.PathLike)):
+                self._spill_fp = open(spill_file, 'w' if text else 'wb')
+                self._close_spill_fp = True
+            else:
+                self._spill_fp = spill_file
+
+    def write(self, data):
+        if not data:
+            return
+        if self._spill_fp is not None:
+            self._spill_fp.write(data)
+        for callback in self.callbacks:
+            callback(data)
+        tail_limit = self.tail_limit
+        with self._lock:
+            self.total_size += len(data)
+            if tail_limit == 0:
+                self.truncated = True
+                return
+            chunks = self._chunks
+            chunks.append(data)
+            self._size += len(data)
+            if tail_limit is not None:
+                # Drop whole chunks that are entirely outside of the tail
+                while self._size - len(chunks[0]) >= tail_limit:
+                    self._size -= len(chunks.popleft())
+                    self.truncated = True
+
+    def getvalue(self):
+        with self._lock:
+            value = ('' if self.text else b'').join(self._chunks)
+            if self.tail_limit is not None and len(value) > self.tail_limit:
+                value = value[-self.tail_limit:]
+                self.truncated = True
+            self._chunks.clear()
+            if value:
+                self._chunks.append(value)
+            self._size = len(value)
+        return value
+
+    def close(self):
+        if self._spill_fp is not None:
+            if self._close_spill_fp:
+                self._spill_fp.close()
+            else:
+                self._spill_fp.flush()
+            self._spill_fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
 class PipeRecordThread(threading.Thread):
+    """Record what is written to file_w (or read from file_r).
 
-    def __init__(self, file_r=None, text=False, blocksize=1024*8, target=None, **kwargs):
+    By default, only the last default_tail_limit bytes/characters are kept in
+    output; Pass full_output=True to keep everything.
+    """
+
+    default_tail_limit = 1024 * 1024
+
+    def __init__(self, file_r=None, text=False, blocksize=1024*8, target=None,
+                 *, tail_limit=None, full_output=False, spill_file=None, callbacks=(),
+                 **kwargs):
         if file_r is None:
             r, w = os.pipe()
-            self.file_r = os.fdopen(r, mode='r' + ('t' if text else 'b'), closefd=True)
+            file_r = os.fdopen(r, mode='r' + ('t' if text else 'b'), closefd=True)
             self.file_w = os.fdopen(w, mode='w' + ('t' if text else 'b'), closefd=True)
+        self.file_r = file_r
         self.text = text
-        if self.text:
-            self.output = ''
-        else:
-            self.output = b''
-            self.blocksize = blocksize
+        self.blocksize = blocksize
+        self.target = target
+        if full_output:
+            tail_limit = None
+        elif tail_limit is None:
+            tail_limit = self.default_tail_limit
+        self.recorder = OutputRecorder(text=text,
+                                       tail_limit=tail_limit,
+                                       spill_file=spill_file,
+                                       callbacks=callbacks)
         super().__init__(**kwargs)
 
+    @property
+    def output(self):
+        return self.recorder.getvalue()
+
     def run(self):
         file_r = self.file_r
-        target = self.target
-        if self.text:
-            for line in file_r:
-                line = byte_decode(line)
-                self.output += line
-                if target:
-                    target(line)
-        else:
-            blocksize = self.blocksize
-            while True:
-                out = file_r.read(blocksize)
-                if not out:
-                    break
-                self.output += out
-                if target:
-                    target(out)
+        recorder = self.recorder
+        try:
+            if self.text:
+                for line in file_r:
+                    line = byte_decode(line)
+                    recorder.write(line)
+                    target = self.target
+                    if target:
+                        target(line)
+            else:
+                blocksize = self.blocksize
+                while True:
+                    out = file_r.read(blocksize)
+                    if not out:
+                        break
+                    recorder.write(out)
+                    target = self.target
+                    if target:
+                        target(out)
+        finally:
+            recorder.close()
 
 
 class Editor(Executable):
@@ -20,6 +20,7 @@ import pexpect
 import re
 import subprocess
 import sys
+import threading
 import types
 log = logging.getLogger(__name__)
 
@@ -27,7 +28,7 @@ from .perf import perfcontext
 from .exec import *
 from .exec import _SpawnMixin, spawn as _exec_spawn, popen_spawn as _exec_popen_spawn, arg2cmdarg
 from .parser import lines_parser
-from .utils import byte_decode, Timestamp as _BaseTimestamp, Ratio, round_half_up, StreamTransform, Constants, grouper
+from .utils import byte_decode, Timestamp as _BaseTimestamp, Ratio, round_half_up, StreamTransform, Constants, grouper, Auto
 from qip.file import *
 from qip.collections import OrderedSet
 from qip.app import app
@@ -471,8 +472,127 @@ class Disposition(collections.namedtuple(
 
 del _disposition_info_map
 
+class FfmpegProgress(object):
+    """One block of `ffmpeg -progress` key=value output."""
+
+    __slots__ = (
+        'frame',
+        'fps',
+        'bitrate',
+        'total_size',
+        'out_time_us',
+        'dup_frames',
+        'drop_frames',
+        'speed',
+        'progress',
+    )
+
+    def __init__(self, **kwargs):
+        for k in self.__slots__:
+            setattr(self, k, kwargs.get(k, None))
+
+    @classmethod
+    def from_dict(cls, d):
+        def conv(v, func):
+            if v is None or v == 'N/A':
+                return None
+            try:
+                return func(v)
+            except ValueError:
+                return None
+        return cls(
+            frame=conv(d.get('frame'), int),
+            fps=conv(d.get('fps'), Decimal),
+            bitrate=conv(d.get('bitrate'), str),
+            total_size=conv(d.get('total_size'), int),
+            # out_time_ms is also in microseconds
+            out_time_us=conv(d.get('out_time_us', d.get('out_time_ms')), int),
+            dup_frames=conv(d.get('dup_frames'), int),
+            drop_frames=conv(d.get('drop_frames'), int),
+            speed=conv(d.get('speed', '').rstrip('x') or None, float),
+            progress=d.get('progress'),
+        )
+
+    @property
+    def out_time(self):
+        if self.out_time_us is None:
+            return None
+        return Timestamp(self.out_time_us / 1000000)
+
+    @property
+    def is_end(self):
+        return self.progress == 'end'
+
+    def __repr__(self):
+        return '%s(%s)' % (
+            self.__class__.__name__,
+            ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__))
+
+class FfmpegProgressPipe(object):
+    """Pipe for `ffmpeg -progress pipe:N`.
+
+    The write end is passed to ffmpeg and closed in the parent once spawned;
+    The read end is handed over to the FfmpegProgressReader.
+    """
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        # Spawned children close all but their pass_fds
+        os.set_inheritable(self.write_fd, True)
+
+    @property
+    def progress_url(self):
+        return f'pipe:{self.write_fd}'
+
+    def close_write(self):
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    def detach_read(self):
+        fd, self.read_fd = self.read_fd, None
+        return fd
+
+    def close(self):
+        self.close_write()
+        if self.read_fd is not None:
+            os.close(self.read_fd)
+            self.read_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+class FfmpegProgressReader(threading.Thread):
+    """Parse `ffmpeg -progress` blocks from fd and pass each FfmpegProgress to callback."""
+
+    def __init__(self, fd, callback):
+        self.fd = fd
+        self.callback = callback
+        super().__init__(name='ffmpeg-progress', daemon=True)
+
+    def run(self):
+        block = {}
+        with open(self.fd, 'r', encoding='utf-8', errors='replace') as fp:
+            for line in fp:
+                k, sep, v = line.partition('=')
+                if not sep:
+                    continue
+                k = k.strip()
+                block[k] = v.strip()
+                if k == 'progress':
+                    try:
+                        self.callback(FfmpegProgress.from_dict(block))
+                    except Exception as e:
+                        log.debug('ffmpeg progress callback failed: %s', e)
+                    block = {}
+
 class _FfmpegSpawnMixin(_SpawnMixin):
 
+    line_oriented = True
+
     invocation_purpose = None
     show_progress_bar = None
     progress_bar = None
@@ -486,10 +606,14 @@ class _FfmpegSpawnMixin(_SpawnMixin):
     current_info_section = None
     streams_info = None
     progress_match = None
+    progress = None
+    progress_reader = None
+    progress_lock = None
     log_counter = None
 
     def __init__(self, *args, invocation_purpose=None,
                  show_progress_bar=None, progress_bar_max=None, progress_bar_title=None,
+                 progress_channel=None,
                  encoding=None, errors=None,
                  env=None, **kwargs):
         assert encoding is not None or errors is not None, 'text mode required for ffmpeg spawn parsing'
@@ -507,6 +631,8 @@ class _FfmpegSpawnMixin(_SpawnMixin):
             'output': {},
         }
         self.log_counter = collections.Counter()
+        # Serializes progress_update (FfmpegProgressReader thread) with __exit__
+        self.progress_lock = threading.Lock()
         if self.invocation_purpose == 'cropdetect':
             self.cropdetect_result = None
             self.cropdetect_frames_count = 0
@@ -514,9 +640,17 @@ class _FfmpegSpawnMixin(_SpawnMixin):
         env['AV_LOG_FORCE_NOCOLOR'] = '1'
         env['TERM'] = 'dumb'
         env.pop('TERMCAP', None)
+        if progress_channel is not None:
+            kwargs['pass_fds'] = tuple(kwargs.get('pass_fds', ())) + (progress_channel.write_fd,)
         super().__init__(*args, env=env,
                          encoding=encoding, errors=errors,
                          **kwargs)
+        if progress_channel is not None:
+            # Only ffmpeg holds the write end now so EOF is seen when it exits.
+            progress_channel.close_write()
+            self.progress_reader = FfmpegProgressReader(progress_channel.detach_read(),
+                                                        self.progress_update)
+            self.progress_reader.start()
 
     def log_line(self, str, *, level=logging.INFO, id=None):
         if id:
@@ -610,6 +744,42 @@ class _FfmpegSpawnMixin(_SpawnMixin):
             self.log_line(str, level=logging.DEBUG)
         return True
 
+    def progress_update(self, progress):
+        # Called from the FfmpegProgressReader thread
+        with self.progress_lock:
+            self.progress = progress
+            progress_bar = self.progress_bar
+            if progress_bar is not None:
+                if self.progress_bar_max:
+                    if isinstance(self.progress_bar_max, _BaseTimestamp):
+                        if progress.out_time is not None and progress.out_time.seconds >= 0.0:
+                            progress_bar.goto(progress.out_time.seconds + self.progress_start_pts_time.seconds)
+                    elif progress.frame is not None:
+                        progress_bar.goto(progress.frame + self.progress_start_frame)
+                    if progress.fps is not None and progress.fps >= 0:
+                        progress_bar.fps = progress.fps
+                else:
+                    progress_bar.next()
+                self.on_progress_bar_line = True
+            if app.statsd:
+                stat = f'ffmpeg.{self.invocation_purpose or "run"}'
+                if progress.fps is not None:
+                    app.statsd.gauge(f'{stat}.fps', float(progress.fps))
+                if progress.speed is not None:
+                    app.statsd.gauge(f'{stat}.speed', progress.speed)
+
+    @property
+    def out_time(self):
+        """Final (or latest) output time as reported by ffmpeg, if known."""
+        if self.progress is not None and self.progress.out_time is not None:
+            return self.progress.out_time
+        if self.progress_match is not None and self.progress_match.group('time'):
+            try:
+                return Timestamp(byte_decode(self.progress_match.group('time')))
+            except ValueError:
+                pass
+        return None
+
     def parsed_cropdetect_line(self, str):
         self.cropdetect_result = byte_decode(self.match.group('crop'))
         if self.invocation_purpose == 'cropdetect':
@@ -735,18 +905,18 @@ class _FfmpegSpawnMixin(_SpawnMixin):
             # frame= 2235 fps=221 q=-0.0 size= 1131482kB time=00:01:14.60 bitrate=124237.6kbits/s dup=447 drop=0 speed=7.37x
             # frame= 7068 fps=0.0 q=-1.0 q=-1.0 size=  126208kB time=00:04:58.13 bitrate=3467.9kbits/s speed= 595x    '
             # [info] frame=21054 fps=0.0 q=-1.0 size=  244736kB time=00:14:38.08 bitrate=2283.2kbits/s speed=1.75e+03x
-            (fr'^(?:\[info\]\s)?(?:frame= *(?P<frame>\d+) +fps= *(?P<fps>\S+) +q= *(?P<q>\S+)(?: +q= *(?P<q2>\S+))? )?L?size= *(?:N/A|(?P<size>\S+)) +time= *(?P<time>\S+) +bitrate= *(?:N/A|(?P<bitrate>\S+))(?: +dup= *(?P<dup>\S+))?(?: +drop= *(?P<drop>\S+))? +speed= *(?P<speed>\S+) *{re_eol}', self.progress_line),
+            (LinePattern(fr'^(?:\[info\]\s)?(?:frame= *(?P<frame>\d+) +fps= *(?P<fps>\S+) +q= *(?P<q>\S+)(?: +q= *(?P<q2>\S+))? )?L?size= *(?:N/A|(?P<size>\S+)) +time= *(?P<time>\S+) +bitrate= *(?:N/A|(?P<bitrate>\S+))(?: +dup= *(?P<dup>\S+))?(?: +drop= *(?P<drop>\S+))? +speed= *(?P<speed>\S+) *{re_eol}', ('frame=', 'size=', 'Lsize=')), self.progress_line),
 
             # [Parsed_cropdetect_1 @ 0x56473433ba40] x1:0 x2:717 y1:0 y2:477 w:718 h:478 x:0 y:0 pts:504504000 t:210.210000 crop=718:478:0:0
-            (fr'^\[Parsed_cropdetect\S* @ \S+\]\s(?:\[info\]\s)?x1:(?P<x1>\S+) x2:(?P<x2>\S+) y1:(?P<y1>\S+) y2:(?P<y2>\S+) w:(?P<w>\S+) h:(?P<h>\S+) x:(?P<x>\S+) y:(?P<y>\S+) pts:(?P<pts>\S+) t:(?P<time>\S+) crop=(?P<crop>\S+) *{re_eol}', self.parsed_cropdetect_line),
+            (LinePattern(fr'^\[Parsed_cropdetect\S* @ \S+\]\s(?:\[info\]\s)?x1:(?P<x1>\S+) x2:(?P<x2>\S+) y1:(?P<y1>\S+) y2:(?P<y2>\S+) w:(?P<w>\S+) h:(?P<h>\S+) x:(?P<x>\S+) y:(?P<y>\S+) pts:(?P<pts>\S+) t:(?P<time>\S+) crop=(?P<crop>\S+) *{re_eol}', ('x1:',)), self.parsed_cropdetect_line),
 
-            (fr'^\[ffmpeg-2pass-pipe\]\s(?P<pass_name>PASS [12]){re_eol}', self.progress_pass),
+            (LinePattern(fr'^\[ffmpeg-2pass-pipe\]\s(?P<pass_name>PASS [12]){re_eol}', ('PASS ',)), self.progress_pass),
 
             # [info] Input #0, h264, from 'test-movie3/track-00-video.h264':
             # [info] Input #0, h264, from 'pipe:':
-            (fr'^(?:\[info\]\s)? *Input #(?P<index>\S+), (?P<format>\S+), from \'(?P<file_name>.+?)\':{re_eol}', self.start_input_info_section),
+            (LinePattern(fr'^(?:\[info\]\s)? *Input #(?P<index>\S+), (?P<format>\S+), from \'(?P<file_name>.+?)\':{re_eol}', ('Input #',)), self.start_input_info_section),
             # [info] Output #0, null, to 'pipe:':
-            (fr'^(?:\[info\]\s)? *Output #(?P<index>\S+), (?P<format>\S+), to \'(?P<file_name>.+?)\':{re_eol}', self.start_output_info_section),
+            (LinePattern(fr'^(?:\[info\]\s)? *Output #(?P<index>\S+), (?P<format>\S+), to \'(?P<file_name>.+?)\':{re_eol}', ('Output #',)), self.start_output_info_section),
             # [info]     Stream #0:0: Video: h264 (High), yuv420p(progressive), 1920x1080 [SAR 1:1 DAR 16:9], 24.08 fps, 23.98 tbr, 1200k tbn, 47.95 tbc
             # [info]     Stream #0:0: Video: wrapped_avframe, yuv420p, 1920x1080 [SAR 1:1 DAR 16:9], q=2-31, 200 kb/s, 23.98 fps, 23.98 tbn, 23.98 tbc
             # [info]     Stream #0:0: Video: wrapped_avframe, 1 reference frame, yuv420p(left), 720x480 [SAR 8:9 DAR 4:3], q=2-31, 200 kb/s, 29.97 fps, 29.97 tbn, 29.97 tbc
@@ -754,58 +924,58 @@ class _FfmpegSpawnMixin(_SpawnMixin):
             # [info]     Stream #0:0: Video: h264 (High), 1 reference frame, yuv420p(progressive, left), 1920x1080 (1920x1088) [SAR 1:1 DAR 16:9], 24.08 fps, 23.98 tbr, 1200k tbn, 47.95 tbc
             # [info]     Stream #0:0: Video: vc1 (Advanced), 1 reference frame (WVC1 / 0x31435657), yuv420p(bt709, progressive, left), 1920x1080 [SAR 1:1 DAR 16:9], 23.98 fps, 23.98 tbr, 23.98 tbn, 47.95 tbc
             # [info]     Stream #0:0: Video: ffv1, 1 reference frame (FFV1 / 0x31564646), yuv420p(left), 720x480, SAR 8:9 DAR 4:3, 23.98 fps, 23.98 tbr, 1k tbn, 1k tbc (default)'
-            (fr'^(?:\[info\]\s)? *Stream #(?P<stream_no>\S+)(?:\((?P<language>\w{3})\))?: (?P<stream_type>Video): (?P<format1>[^,]+)(?:, (?P<num_ref_frames>\d+) reference frame(?: \([^)]+\))?)?, (?P<format2>[^(,]+(?:\([^)]+\))?), (?P<width>\d+)x(?P<height>\d+)[, ][^\r\n]*{re_eol}', self.start_stream_info_section),
+            (LinePattern(fr'^(?:\[info\]\s)? *Stream #(?P<stream_no>\S+)(?:\((?P<language>\w{3})\))?: (?P<stream_type>Video): (?P<format1>[^,]+)(?:, (?P<num_ref_frames>\d+) reference frame(?: \([^)]+\))?)?, (?P<format2>[^(,]+(?:\([^)]+\))?), (?P<width>\d+)x(?P<height>\d+)[, ][^\r\n]*{re_eol}', ('Stream #',)), self.start_stream_info_section),
             # [info]     Stream #0:1(eng): Audio: opus ([255][255][255][255] / 0xFFFFFFFF), 48000 Hz, 5.1, fltp, delay 312 (default)
             # [info]     Stream #0:2(fra): Audio: opus ([255][255][255][255] / 0xFFFFFFFF), 48000 Hz, 5.1, fltp, delay 312
-            (fr'^(?:\[info\]\s)? *Stream #(?P<stream_no>\S+)(?:\((?P<language>\w{3})\))?: (?P<stream_type>Audio): (?P<format1>[^,]+)(?: \(\[\d+\]\[\d+\]\[\d+\]\[\d+\] / 0x[0-9A-Fa-f]+\))?, (?P<sample_rate>\d+) Hz, (?P<channel_layout>\S+), (?P<sample_fmt>(?:[us]\d+|flt|dbl)p?), delay (?P<delay>\d+)(?: \((?P<disposition>default)\))?[^\r\n]*{re_eol}', self.start_stream_info_section),
+            (LinePattern(fr'^(?:\[info\]\s)? *Stream #(?P<stream_no>\S+)(?:\((?P<language>\w{3})\))?: (?P<stream_type>Audio): (?P<format1>[^,]+)(?: \(\[\d+\]\[\d+\]\[\d+\]\[\d+\] / 0x[0-9A-Fa-f]+\))?, (?P<sample_rate>\d+) Hz, (?P<channel_layout>\S+), (?P<sample_fmt>(?:[us]\d+|flt|dbl)p?), delay (?P<delay>\d+)(?: \((?P<disposition>default)\))?[^\r\n]*{re_eol}', ('Stream #',)), self.start_stream_info_section),
             # [info]     Stream #0:3(eng): Subtitle: hdmv_pgs_subtitle ([255][255][255][255] / 0xFFFFFFFF), 1920x1080
             # [info]     Stream #0:4(fra): Subtitle: hdmv_pgs_subtitle ([255][255][255][255] / 0xFFFFFFFF), 1920x1080
             # [info]     Stream #0:5(fra): Subtitle: webvtt (forced)
-            (fr'^(?:\[info\]\s)? *Stream #(?P<stream_no>\S+)(?:\((?P<language>\w{3})\))?: (?P<stream_type>Subtitle): (?P<format1>[^,]+)(?: \(\[\d+\]\[\d+\]\[\d+\]\[\d+\] / 0x[0-9A-Fa-f]+\))?(?:, (?P<width>\d+)x(?P<height>\d+))?(?: \((?P<disposition>forced)\))?[^\r\n]*{re_eol}', self.start_stream_info_section),
+            (LinePattern(fr'^(?:\[info\]\s)? *Stream #(?P<stream_no>\S+)(?:\((?P<language>\w{3})\))?: (?P<stream_type>Subtitle): (?P<format1>[^,]+)(?: \(\[\d+\]\[\d+\]\[\d+\]\[\d+\] / 0x[0-9A-Fa-f]+\))?(?:, (?P<width>\d+)x(?P<height>\d+))?(?: \((?P<disposition>forced)\))?[^\r\n]*{re_eol}', ('Stream #',)), self.start_stream_info_section),
 
-            (fr'^(?:\[warning\]\s)?Overriding aspect ratio with stream copy may produce invalid files{re_eol}', self.generic_debug_line),
-            (fr'^(?:\[warning\]\s)?Output file is empty, nothing was encoded \(check -ss / -t / -frames parameters if used\){re_eol}', functools.partial(self.generic_error, level=logging.WARNING, error_tag='output-file-empty-nothing-encoded')),
+            (LinePattern(fr'^(?:\[warning\]\s)?Overriding aspect ratio with stream copy may produce invalid files{re_eol}', ('Overriding ',)), self.generic_debug_line),
+            (LinePattern(fr'^(?:\[warning\]\s)?Output file is empty, nothing was encoded \(check -ss / -t / -frames parameters if used\){re_eol}', ('Output file is empty',)), functools.partial(self.generic_error, level=logging.WARNING, error_tag='output-file-empty-nothing-encoded')),
 
             # File 'TheTruthAboutCatsAndDogs/title_t00.demux.mkv' already exists. Overwrite ? [y/N]
-            (fr'^File \'(?P<file_name>.+?)\' already exists\. Overwrite ?\? \[y/N\] *$', self.prompt_file_overwrite),
+            (LinePattern(fr'^File \'(?P<file_name>.+?)\' already exists\. Overwrite ?\? \[y/N\] *$', ("File '",)), self.prompt_file_overwrite),
 
             # PTS 21474840773, next:1417490188 invalid dropping st:0
             # DTS 21474840774, next:1417531896 st:0 invalid dropping
-            (fr'^(?:\[warning\]\s)?(?P<dts_or_pts>DTS|PTS) \d+, next:\d+ ?(invalid dropping st:0|st:0 invalid dropping){re_eol}', self.generic_debug_line),
+            (LinePattern(fr'^(?:\[warning\]\s)?(?P<dts_or_pts>DTS|PTS) \d+, next:\d+ ?(invalid dropping st:0|st:0 invalid dropping){re_eol}', ('DTS ', 'PTS ')), self.generic_debug_line),
 
             # [h264 @ 0x55f98a7caa00] [error] sps_id 1 out of range
             # [NULL @ 0x55f98a7c3b80] [error] sps_id 1 out of range
-            (fr'^(?:\[\S+ @ 0x[0-9a-f]+\]\s)?(?:\[error\]\s)? *sps_id 1 out of range{re_eol}', self.generic_debug_line),
+            (LinePattern(fr'^(?:\[\S+ @ 0x[0-9a-f]+\]\s)?(?:\[error\]\s)? *sps_id 1 out of range{re_eol}', ('sps_id ',)), self.generic_debug_line),
 
             # [mp4 @ 0x55ce3d6c48c0] [warning] pts has no value
-            (fr'^(?:\[\S+ @ 0x[0-9a-f]+\]\s)?(?:\[warning\]\s)? *pts has no value{re_eol}', self.generic_debug_line),
+            (LinePattern(fr'^(?:\[\S+ @ 0x[0-9a-f]+\]\s)?(?:\[warning\]\s)? *pts has no value{re_eol}', ('pts has no value',)), self.generic_debug_line),
 
             # [stream_segment,ssegment @ 0x55d20668d080] [warning] Non-monotonous DTS in output stream 0:0; previous: 75717, current: 75717; changing to 75718. This may result in incorrect timestamps in the output file.
             # [ipod @ 0x564125e0a940] Non-monotonous DTS in output stream 0:0; previous: 1554006132, current: 1554005644; changing to 1554006133. This may result in incorrect timestamps in the output file.
             # [ipod @ 0x55b1ace8a280] [warning] Non-monotonous DTS in output stream 0:0; previous: 1628578383, current: 1628577279; changing to 1628578384. This may result in incorrect timestamps in the output file.
-            (fr'^(?:\[\S+ @ \w+\]\s)?(?:\[warning\]\s)? *Non-monotonous DTS in output stream (?P<stream>\S+); previous: (?P<previous_dts>\d+), current: (?P<current_dts>\d+); changing to (?P<changing_dts>\d+)\. This may result in incorrect timestamps in the output file\.{re_eol}', functools.partial(self.generic_warning_line, id='out-stream-non-monotone-dts')),
+            (LinePattern(fr'^(?:\[\S+ @ \w+\]\s)?(?:\[warning\]\s)? *Non-monotonous DTS in output stream (?P<stream>\S+); previous: (?P<previous_dts>\d+), current: (?P<current_dts>\d+); changing to (?P<changing_dts>\d+)\. This may result in incorrect timestamps in the output file\.{re_eol}', ('Non-monotonous ',)), functools.partial(self.generic_warning_line, id='out-stream-non-monotone-dts')),
             # [stream_segment,ssegment @ 0x55842aa56b40] [verbose] segment:'Labyrinth4K/Labyrinth (1986)/track-00-video-chap02.h265' starts with packet stream:0 pts:6000 pts_time:250.25 frame:6000
-            (fr'^(?:\[\S+ @ \w+\]\s)?(?:\[verbose\]\s)? *segment:\'(?P<segment_file>.+)\' starts with packet stream:(?P<stream>\S+) pts:(?P<pts>\S+) pts_time:(?P<pts_time>\S+) frame:(?P<frame>\S+){re_eol}', self.start_segment_file),
+            (LinePattern(fr'^(?:\[\S+ @ \w+\]\s)?(?:\[verbose\]\s)? *segment:\'(?P<segment_file>.+)\' starts with packet stream:(?P<stream>\S+) pts:(?P<pts>\S+) pts_time:(?P<pts_time>\S+) frame:(?P<frame>\S+){re_eol}', ("segment:'",)), self.start_segment_file),
             # [flac @ 0x562193faef40] Application provided invalid, non monotonically increasing dts to muxer in stream 0: 30753792 >= 1875456
             # [flac @ 0x55c9765da980] [error] Application provided invalid, non monotonically increasing dts to muxer in stream 0: 697365 >= 697365
 
             # [NULL @ 0x5607c5d80480] [warning] sample/frame number mismatch in adjacent frames
-            (fr'(?:\[\S+ @ \w+\]\s)?(?:\[warning\]\s)? *sample/frame number mismatch in adjacent frames{re_eol}', functools.partial(self.generic_error, level=logging.WARNING, error_tag='adjacent-sample-frame-mismatch')),
+            (LinePattern(fr'(?:\[\S+ @ \w+\]\s)?(?:\[warning\]\s)? *sample/frame number mismatch in adjacent frames{re_eol}', ('sample/frame ',)), functools.partial(self.generic_error, level=logging.WARNING, error_tag='adjacent-sample-frame-mismatch')),
 
             # [NULL @ 0x555ff5d3b1c0] sample/frame number mismatch in adjacent frames
             # TODO Re-open https://trac.ffmpeg.org/ticket/5937 ?
-            (fr'^(?:\[\S+ @ \w+\]\s)?sample/frame number mismatch in adjacent frames{re_eol}', self.generic_debug_line),
+            (LinePattern(fr'^(?:\[\S+ @ \w+\]\s)?sample/frame number mismatch in adjacent frames{re_eol}', ('sample/frame ',)), self.generic_debug_line),
 
-            (fr'(?:\[\S+ @ \w+\]\s)?(?:\[error\]\s)? *Application provided invalid, non monotonically increasing dts to muxer in stream (?P<stream>\S+): (?P<dts1>\d+) >= (?P<dts2>\d+){re_eol}', functools.partial(self.generic_error, level=logging.WARNING, error_tag='in-stream-non-monotone-dts')),
+            (LinePattern(fr'(?:\[\S+ @ \w+\]\s)?(?:\[error\]\s)? *Application provided invalid, non monotonically increasing dts to muxer in stream (?P<stream>\S+): (?P<dts1>\d+) >= (?P<dts2>\d+){re_eol}', ('Application provided ',)), functools.partial(self.generic_error, level=logging.WARNING, error_tag='in-stream-non-monotone-dts')),
 
             # [ac3 @ 0x563251c008c0] Estimating duration from bitrate, this may be inaccurate
-            (fr'^(?:\[\S+ @ \w+\]\s)?Estimating duration from bitrate, this may be inaccurate{re_eol}', self.generic_debug_line),
+            (LinePattern(fr'^(?:\[\S+ @ \w+\]\s)?Estimating duration from bitrate, this may be inaccurate{re_eol}', ('Estimating ',)), self.generic_debug_line),
 
             # Output file is empty, nothing was encoded
-            (fr'^(?:\[warning\]\s)? *Output file is empty, nothing was encoded\s*{re_eol}', self.log_output_file_empty),
+            (LinePattern(fr'^(?:\[warning\]\s)? *Output file is empty, nothing was encoded\s*{re_eol}', ('Output file is empty',)), self.log_output_file_empty),
 
             # Multiple -c, -codec, -acodec, -vcodec, -scodec or -dcodec options specified for stream 1, only the last option '-c:1 libtheora' will be used.
-            (fr'^Multiple -c, -codec, -acodec, -vcodec, -scodec or -dcodec options specified for stream (?P<stream>\S+), only the last option \'(?P<option>.*)\' will be used\.{re_eol}', self.generic_debug_line),
+            (LinePattern(fr'^Multiple -c, -codec, -acodec, -vcodec, -scodec or -dcodec options specified for stream (?P<stream>\S+), only the last option \'(?P<option>.*)\' will be used\.{re_eol}', ('Multiple ',)), self.generic_debug_line),
 
             (fr'^\[info\]\s[^\r\n]*?{re_eol}', self.unknown_info_line),
             (fr'^\[verbose\]\s[^\r\n]*?{re_eol}', self.unknown_verbose_line),
@@ -817,7 +987,7 @@ class _FfmpegSpawnMixin(_SpawnMixin):
             (fr'^\x1b\[[0-9;]+m', self.terminal_escape_sequence),  # Should not happen with AV_LOG_FORCE_NOCOLOR
 
             #     Last message repeated 1604 times
-            (fr'^(\s*Last message repeated (?P<count>\d+) times{re_eol})+', None),
+            (LinePattern(fr'^(\s*Last message repeated (?P<count>\d+) times{re_eol})+', ('Last message repeated ',)), None),
 
             (fr'[^\n]*?{re_eol}', self.unknown_line),
             (pexpect.EOF, self.eof),
@@ -855,12 +1025,18 @@ class _FfmpegSpawnMixin(_SpawnMixin):
         return ret
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        if self.progress_bar is not None:
-            progress_bar = self.progress_bar
-            self.progress_bar = None
-            progress_bar.finish()
-            self.on_progress_bar_line = False
-        return super().__exit__(exc_type, exc_value, exc_traceback)
+        with self.progress_lock:
+            if self.progress_bar is not None:
+                progress_bar = self.progress_bar
+                self.progress_bar = None
+                progress_bar.finish()
+                self.on_progress_bar_line = False
+        try:
+            return super().__exit__(exc_type, exc_value, exc_traceback)
+        finally:
+            if self.progress_reader is not None:
+                # ffmpeg is done; Collect the final progress block.
+                self.progress_reader.join(timeout=5)
 
 class FfmpegSpawn(_FfmpegSpawnMixin, _exec_spawn):
 
@@ -1115,6 +1291,9 @@ class _Ffmpeg(Executable):
     spawn = FfmpegSpawn
     popen_spawn = FfmpegPopenSpawn
 
+    # Track progress using `-progress pipe:N -nostats` rather than parsing stats lines
+    progress_pipe = False
+
     @classmethod
     def kwargs_to_cmdargs(cls, **kwargs):
         cmdargs = []
@@ -1297,11 +1476,21 @@ class Ffmpeg(_Ffmpeg):
              slurm=False, slurm_cpus_per_task=None,
              progress_bar_max=None,
              progress_bar_title=None,
+             progress_pipe=None,
              **kwargs):
         args = list(args)
 
         if run_func:
             slurm = False
+        if progress_pipe is None:
+            progress_pipe = self.progress_pipe
+        if progress_pipe and (
+                run_func
+                or slurm
+                or dry_run or getattr(app.args, 'dry_run', False)
+                or any(kwargs.get(k) is not None for k in ('fd', 'stdin', 'stdout', 'stderr'))):
+            # Only supported when spawned and parsed by this process
+            progress_pipe = False
 
         if slurm:
             try:
@@ -1369,14 +1558,20 @@ class Ffmpeg(_Ffmpeg):
             run_kwargs['progress_bar_max'] = progress_bar_max
             run_kwargs['progress_bar_title'] = progress_bar_title
 
-        if run_kwargs:
-            run_func = functools.partial(run_func, **run_kwargs)
+        with contextlib.ExitStack() as exit_stack:
+            if progress_pipe:
+                progress_channel = exit_stack.enter_context(FfmpegProgressPipe())
+                args[0:0] = ['-progress', progress_channel.progress_url, '-nostats']
+                run_kwargs['progress_channel'] = progress_channel
+
+            if run_kwargs:
+                run_func = functools.partial(run_func, **run_kwargs)
 
-        return super()._run(
-            *args,
-            dry_run=dry_run,
-            run_func=run_func,
-            **kwargs)
+            return super()._run(
+                *args,
+                dry_run=dry_run,
+                run_func=run_func,
+                **kwargs)
 
     def run2pass(self, *args, **kwargs):
         args = list(args)
@@ -1524,6 +1719,126 @@ class Ffmpeg(_Ffmpeg):
                 assert w > 0 and h > 0 and l >= 0 and t >= 0, (w, h, l, t)
         return stream_crop
 
+    @staticmethod
+    def aggregate_cropdetect_results(crops, cropdetect_round=2, min_area_ratio=0.5,
+                                     frame_width=None, frame_height=None):
+        '''Merge the (w, h, l, t) crop boxes detected at multiple sample points.
+
+        The most common box wins if it is detected by a majority of samples.
+        Otherwise, outliers (usually dark scenes yielding much smaller boxes)
+        are rejected and the union of the remaining boxes is returned so that
+        no picture area gets cropped; It is rounded outward, within the frame
+        size if known.
+        '''
+        crops = [tuple(crop) for crop in crops]
+        if not crops:
+            return None
+        crop, count = collections.Counter(crops).most_common(1)[0]
+        if count * 2 > len(crops):
+            return crop
+        areas = sorted(w * h for w, h, l, t in crops)
+        median_area = areas[len(areas) // 2]
+        crops = [(w, h, l, t) for w, h, l, t in crops
+                 if w * h >= median_area * min_area_ratio]
+        l = min(l for w, h, l, t in crops)
+        t = min(t for w, h, l, t in crops)
+        w = max(l1 + w1 for w1, h1, l1, t1 in crops) - l
+        h = max(t1 + h1 for w1, h1, l1, t1 in crops) - t
+        if cropdetect_round:
+            w += -w % cropdetect_round
+            h += -h % cropdetect_round
+        if frame_width is not None:
+            w = min(w, frame_width)
+            l = max(0, min(l, frame_width - w))
+        if frame_height is not None:
+            h = min(h, frame_height)
+            t = max(0, min(t, frame_height - h))
+        return w, h, l, t
+
+    def cropdetect_sampled(self, input_file, *, duration,
+                           cropdetect_samples=8,
+                           cropdetect_seek=None, cropdetect_duration=300,
+                           cropdetect_round=2,
+                           frame_width=None, frame_height=None,
+                           jobs=None,
+                           show_progress_bar=True,
+                           progress_bar_title=None,
+                           dry_run=False,
+                           **kwargs):
+        '''Detect cropping from samples evenly spaced across the duration.
+
+        The total `cropdetect_duration` is divided among `cropdetect_samples`
+        sample windows which are analyzed concurrently by up to `jobs` ffmpeg
+        processes (default: CPU count). The per-sample results are merged
+        using aggregate_cropdetect_results.
+        '''
+        import concurrent.futures
+        start = float(cropdetect_seek or 0)
+        duration = float(duration)
+        if cropdetect_samples <= 1 or duration - start <= float(cropdetect_duration):
+            return self.cropdetect(input_file=input_file,
+                                   cropdetect_seek=cropdetect_seek,
+                                   cropdetect_duration=cropdetect_duration,
+                                   cropdetect_round=cropdetect_round,
+                                   show_progress_bar=show_progress_bar,
+                                   progress_bar_title=progress_bar_title,
+                                   dry_run=dry_run,
+                                   **kwargs)
+        sample_duration = float(cropdetect_duration) / cropdetect_samples
+        span = duration - start
+        sample_seeks = [
+            max(start, start + span * (i + 0.5) / cropdetect_samples - sample_duration / 2)
+            for i in range(cropdetect_samples)]
+        if jobs is None or jobs is Auto:
+            jobs = os.cpu_count() or 1
+
+        def sample_cropdetect(sample_seek):
+            return self.cropdetect(input_file=input_file,
+                                   cropdetect_seek=sample_seek,
+                                   cropdetect_duration=sample_duration,
+                                   cropdetect_round=cropdetect_round,
+                                   show_progress_bar=False,
+                                   dry_run=dry_run,
+                                   **kwargs)
+
+        crops = []
+        with perfcontext('Sampled cropdetect w/ ffmpeg'):
+            progress_bar = None
+            if show_progress_bar:
+                try:
+                    from .utils import ProgressBar
+                except ImportError:
+                    pass
+                else:
+                    progress_bar = ProgressBar(progress_bar_title or 'Cropdetect',
+                                               max=cropdetect_samples)
+            try:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                    futures = {
+                        executor.submit(sample_cropdetect, sample_seek): sample_seek
+                        for sample_seek in sample_seeks}
+                    for future in concurrent.futures.as_completed(futures):
+                        try:
+                            crop = future.result()
+                        except ValueError as e:
+                            # Usually a completely dark sample
+                            log.debug('Crop detection at %s failed: %s', Timestamp(futures[future]), e)
+                        else:
+                            if crop is not None:
+                                log.debug('Crop detection at %s: %r', Timestamp(futures[future]), crop)
+                                crops.append(crop)
+                        if progress_bar is not None:
+                            progress_bar.next()
+            finally:
+                if progress_bar is not None:
+                    progress_bar.finish()
+        if dry_run:
+            return None
+        if not crops:
+            raise ValueError('Crop detection failed at all sample points')
+        return self.aggregate_cropdetect_results(crops, cropdetect_round=cropdetect_round,
+                                                 frame_width=frame_width, frame_height=frame_height)
+
 ffmpeg = Ffmpeg()
 
 class Ffmpeg2passPipe(_Ffmpeg, PipedPortableScript):
@@ -1646,12 +1961,44 @@ class unit_value(collections.namedtuple(
     pass
 
 
+class _CompactRecord(object):
+    '''Base of the light-weight records yielded by ffprobe's compact parsing mode.
+
+    Subclasses define `__slots__` as the tuple of requested entries.
+    '''
+
+    __slots__ = ()
+
+    def __init__(self):
+        for attr in self.__slots__:
+            setattr(self, attr, None)
+
+    def __repr__(self):
+        return '%s(%s)' % (
+            self.__class__.__name__,
+            ', '.join('%s=%r' % (attr, getattr(self, attr))
+                      for attr in self.__slots__))
+
+
 class Ffprobe(_Ffmpeg):
 
     name = 'ffprobe'
 
     run_func = staticmethod(dbg_exec_cmd)
 
+    # 'ffprobe': Always run the ffprobe executable
+    # 'av': Probe in-process using PyAV when possible, falling back to ffprobe
+    probe_backend = 'ffprobe'
+
+    ProbeResult = collections.namedtuple(
+        'ProbeResult',
+        (
+            'file',
+            'ffprobe_dict',
+            'exception',
+        ),
+    )
+
     def build_cmd(self, *args, **kwargs):
         args = list(args)
 
@@ -1661,6 +2008,130 @@ class Ffprobe(_Ffmpeg):
         assert os.fspath(cmd.pop(-1)) == '-'
         return cmd
 
+    @classmethod
+    def parse_json_output(cls, out):
+        from . import json
+        out = clean_cmd_output(out)
+        parser = lines_parser(out.split('\n'))
+        while parser.advance():
+            if parser.line == '{':
+                parser.pushback(parser.line)
+                return json.loads('\n'.join(parser.lines_iter))
+        return None
+
+    def probe(self, file, **kwargs):
+        '''Return the ffprobe dict (-print_format json) of file.
+
+        Results are looked up in and saved to the probe cache.
+        '''
+        from .probecache import probe_cache
+
+        kwargs.setdefault('show_streams', True)
+        kwargs.setdefault('show_format', True)
+        kwargs.setdefault('show_chapters', True)
+        kwargs.setdefault('show_error', True)
+
+        file_name = toPath(file) if file is not None else None
+
+        if self.probe_backend == 'av':
+            ffprobe_dict = self._av_probe(file_name, **kwargs)
+            if ffprobe_dict is not None:
+                return ffprobe_dict
+
+        cache_key = probe_cache.make_key('ffprobe', file_name, kwargs)
+        out = probe_cache.get(cache_key)
+        if out is None:
+            d = self(i=file,
+                     #threads=0,
+                     v='info',
+                     print_format='json',
+                     **kwargs)
+            out = clean_cmd_output(d.out)
+        else:
+            cache_key = None  # Already cached
+        ffprobe_dict = self.parse_json_output(out)
+        if not ffprobe_dict:
+            raise ValueError('No json found in output of ffprobe')
+        probe_cache.put(cache_key, out)
+        return ffprobe_dict
+
+    def _av_probe(self, file_name, **kwargs):
+        '''Probe file_name in-process using PyAV.
+
+        Returns None if PyAV is unavailable, the requested information is not
+        supported or probing fails; The caller should then fall back to
+        running ffprobe.
+        '''
+        from . import avprobe
+        from . import json
+        from .probecache import probe_cache
+        if not avprobe.HAVE_AV or file_name is None:
+            return None
+        if not set(kwargs) <= {'show_streams', 'show_format', 'show_chapters', 'show_error'}:
+            return None
+        if kwargs.get('show_chapters') and not avprobe.HAVE_AV_CHAPTERS:
+            # Don't drop (or cache the lack of) chapters
+            log.debug('%s: Chapters not supported by PyAV, probing w/ ffprobe', file_name)
+            return None
+        cache_key = probe_cache.make_key('avprobe', file_name, kwargs)
+        out = probe_cache.get(cache_key)
+        if out is not None:
+            return self.parse_json_output(out)
+        try:
+            with perfcontext('Probe w/ PyAV'):
+                ffprobe_dict = avprobe.probe_dict(file_name, **kwargs)
+        except Exception as e:
+            log.debug('%s: PyAV probe failed, falling back to ffprobe: %s', file_name, e)
+            return None
+        # Stored as text, the same as ffprobe's output
+        probe_cache.put(cache_key, json.dumps(ffprobe_dict, indent=2))
+        return ffprobe_dict
+
+    def probe_many(self, files, *, jobs=None, **kwargs):
+        '''Probe multiple files concurrently.
+
+        At most `jobs` ffprobe processes run at once (default: CPU count).
+        ProbeResult tuples are yielded as a stream, in the same order as
+        `files`; A failure to probe one file is reported in its result's
+        `exception` field and does not abort the batch.
+        '''
+        import concurrent.futures
+        import itertools
+        from .mm import MediaFile
+        if jobs is None or jobs is Auto:
+            jobs = os.cpu_count() or 1
+        files = iter(files)
+        pending = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+
+            def probe_file(file):
+                if isinstance(file, MediaFile) \
+                        and type(file).extract_ffprobe_dict is not MediaFile.extract_ffprobe_dict:
+                    # Honor file-specific probing (VobFile, ImageFile, ...)
+                    return file.extract_ffprobe_dict(**kwargs)
+                return self.probe(file, **kwargs)
+
+            def submit(file):
+                pending.append((file, executor.submit(probe_file, file)))
+
+            try:
+                # Keep the workers busy while limiting how far ahead of the consumer we go
+                for file in itertools.islice(files, jobs * 2):
+                    submit(file)
+                while pending:
+                    file, future = pending.popleft()
+                    try:
+                        result = self.ProbeResult(file, future.result(), None)
+                    except Exception as e:
+                        log.debug('%s: ffprobe failed: %s', file, e)
+                        result = self.ProbeResult(file, None, e)
+                    for file in itertools.islice(files, 1):
+                        submit(file)
+                    yield result
+            finally:
+                for file, future in pending:
+                    future.cancel()
+
     class Frame(types.SimpleNamespace):
 
         _attr_convs = {
@@ -1691,6 +2162,10 @@ class Ffprobe(_Ffmpeg):
             'pkt_pts': NA_or_int,  # 0
             'pkt_pts_time': NA_or_Decimal,  # 0.000000
             'pkt_size': int,  # 1536
+            'pts': NA_or_int,  # 0
+            'pts_time': NA_or_Decimal,  # 0.000000
+            'duration': NA_or_int,  # 32
+            'duration_time': NA_or_Decimal,  # 0.032000
             'repeat_pict': int,  # 0
             'sample_aspect_ratio': NA_or_Ratio,  # 186:157
             'stream_index': int,  # 1
@@ -1750,10 +2225,118 @@ class Ffprobe(_Ffmpeg):
             # 'flags': TODO,  # K_
             }
 
-    def iter_frames(self, file, *, default_ffmpeg_args=[], dry_run=False):
+    @staticmethod
+    def _is_benign_error_msg(msg):
+        if msg == 'sps_id 1 out of range':
+            # [h264 @ 0x55f98a7caa00] [error] sps_id 1 out of range
+            # [NULL @ 0x55f98a7c3b80] [error] sps_id 1 out of range
+            return True
+        if msg.startswith('missing picture in access unit with size'):
+            # [NULL @ 0x555cde195b80] [error] missing picture in access unit with size 802
+            return True
+        if msg == 'no frame!':
+            # [h264 @ 0x555cde19ca00] [error] no frame!
+            return True
+        if msg.endswith(' invalid dropping st:0') \
+                or msg.endswith(' st:0 invalid dropping'):
+            # PTS 21474840773, next:1417490188 invalid dropping st:0
+            # DTS 21474840774, next:1417531896 st:0 invalid dropping
+            return True
+        if 'ac-tex damaged at' in msg \
+                or 'Warning MVs not available' in msg:
+            # [mpeg2video @ 0x55610c7ca940] [error] ac-tex damaged at 8 2
+            # [mpeg2video @ 0x55610c7ca940] [error] Warning MVs not available
+            return True
+        return False
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _compact_record_class(name, entries):
+        return type(name, (_CompactRecord,), {'__slots__': entries})
+
+    def _iter_compact_records(self, file, *, section, record_name, attr_convs,
+                              entries, select_streams=None,
+                              default_ffmpeg_args=[], dry_run=False):
+        '''Iterate the `section` entries of file in compact format.
+
+        Only the requested `entries` are output by ffprobe, converted and
+        stored in `__slots__` records.
+        '''
+        entries = tuple(entries)
+        record_class = self._compact_record_class(record_name, entries)
+        convs = {attr: attr_convs.get(attr, str) for attr in entries}
+        ffprobe_args = list(default_ffmpeg_args) + [
+            '-loglevel', 'level+error', '-hide_banner',
+        ]
+        if select_streams is not None:
+            ffprobe_args += ['-select_streams', str(select_streams)]
+        ffprobe_args += [
+            '-i', file,
+            '-show_entries', '%s=%s' % (section, ','.join(entries)),
+            '-print_format', 'compact=print_section=0',
+        ]
+        error_lines = []
+        re_error_line = re.compile(r'\[(?P<type>error|panic)\] (?P<msg>.+)')
+        with self.popen(*ffprobe_args,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        text=True,
+                        popen_func=do_popen_cmd,
+                        dry_run=dry_run) as p:
+            for line_no, line in enumerate(p.stdout, start=1):
+                line = line.rstrip('\r\n')
+                if not line:
+                    continue
+                if line[0] == '[':
+                    m = re_error_line.search(line)
+                    if m:
+                        if not self._is_benign_error_msg(m.group('msg')):
+                            error_lines.append(line)
+                        continue
+                record = record_class()
+                for item in line.split('|'):
+                    attr, sep, value = item.partition('=')
+                    try:
+                        conv = convs[attr]
+                    except KeyError:
+                        raise ValueError('Unrecognized %s entry line %d: %s' % (section, line_no, line))
+                    try:
+                        value = conv(value)
+                    except Exception as err:
+                        raise ValueError('%s = %s: (%s) %s' % (attr, value, err.__class__.__name__, err))
+                    setattr(record, attr, value)
+                yield record
+            if error_lines or p.returncode:
+                raise subprocess.CalledProcessError(
+                        returncode=p.returncode or 0,
+                        cmd=subprocess.list2cmdline(ffprobe_args),
+                        output='\n'.join(error_lines))
+
+    def iter_frames(self, file, *, entries=None, select_streams=None, default_ffmpeg_args=[], dry_run=False):
+        '''Iterate the frames (and subtitles) of file.
+
+        If `entries` is given, only those frame fields are requested from
+        ffprobe and frames are yielded as light-weight `__slots__` records
+        (subtitles and side data are not reported.)
+        '''
+        if entries is not None:
+            yield from self._iter_compact_records(
+                file,
+                section='frame',
+                record_name='FrameRecord',
+                attr_convs=Ffprobe.Frame._attr_convs,
+                entries=entries,
+                select_streams=select_streams,
+                default_ffmpeg_args=default_ffmpeg_args,
+                dry_run=dry_run)
+            return
         from qip.parser import lines_parser
         ffprobe_args = list(default_ffmpeg_args) + [
             '-loglevel', 'level+error', '-hide_banner',
+        ]
+        if select_streams is not None:
+            ffprobe_args += ['-select_streams', str(select_streams)]
+        ffprobe_args += [
             '-i', file,
             '-show_frames',
         ]
@@ -1854,27 +2437,7 @@ class Ffprobe(_Ffmpeg):
                     continue
                 m = re_error_line.search(line)
                 if m:
-                    if m.group('msg') == 'sps_id 1 out of range':
-                        # [h264 @ 0x55f98a7caa00] [error] sps_id 1 out of range
-                        # [NULL @ 0x55f98a7c3b80] [error] sps_id 1 out of range
-                        pass
-                    elif m.group('msg').startswith('missing picture in access unit with size'):
-                        # [NULL @ 0x555cde195b80] [error] missing picture in access unit with size 802
-                        pass
-                    elif m.group('msg') == 'no frame!':
-                        # [h264 @ 0x555cde19ca00] [error] no frame!
-                        pass
-                    elif m.group('msg').endswith(' invalid dropping st:0') \
-                        or m.group('msg').endswith(' st:0 invalid dropping'):
-                        # PTS 21474840773, next:1417490188 invalid dropping st:0
-                        # DTS 21474840774, next:1417531896 st:0 invalid dropping
-                        pass
-                    elif 'ac-tex damaged at' in m.group('msg') \
-                        or 'Warning MVs not available'in m.group('msg'):
-                        # [mpeg2video @ 0x55610c7ca940] [error] ac-tex damaged at 8 2
-                        # [mpeg2video @ 0x55610c7ca940] [error] Warning MVs not available
-                        pass
-                    else:
+                    if not self._is_benign_error_msg(m.group('msg')):
                         error_lines.append(line)
                     continue
                 raise ValueError('Unrecognized line %d: %s' % (parser.line_no, line))
@@ -1885,10 +2448,29 @@ class Ffprobe(_Ffmpeg):
                         cmd=subprocess.list2cmdline(ffprobe_args),
                         output='\n'.join(error_lines))
 
-    def iter_packets(self, file, *, dry_run=False):
+    def iter_packets(self, file, *, entries=None, select_streams=None, dry_run=False):
+        '''Iterate the packets of file.
+
+        If `entries` is given, only those packet fields are requested from
+        ffprobe and packets are yielded as light-weight `__slots__` records.
+        '''
+        if entries is not None:
+            yield from self._iter_compact_records(
+                file,
+                section='packet',
+                record_name='PacketRecord',
+                attr_convs=Ffprobe.Packet._attr_convs,
+                entries=entries,
+                select_streams=select_streams,
+                dry_run=dry_run)
+            return
         from qip.parser import lines_parser
         ffprobe_args = [
             '-loglevel', 'panic', '-hide_banner',
+        ]
+        if select_streams is not None:
+            ffprobe_args += ['-select_streams', str(select_streams)]
+        ffprobe_args += [
             '-i', file,
             '-show_packets',
         ]
@@ -1907,17 +2489,17 @@ class Ffprobe(_Ffmpeg):
                         except ValueError:
                             pass
                         else:
-                            conv = frame._attr_convs.get(attr, None)
+                            conv = packet._attr_convs.get(attr, None)
                             if conv:
                                 value = conv(value)
-                            setattr(frame, attr, value)
+                            setattr(packet, attr, value)
                             continue
                         if line == '[/PACKET]':
                             break
                         raise ValueError('Unrecognized PACKET line %d: %s' % (parser.line_no, line))
                     else:
                         raise ValueError('Unclosed PACKET near line %d' % (parser.line_no,))
-                    yield frame
+                    yield packet
                     continue
                 raise ValueError('Unrecognized line %d: %s' % (parser.line_no, line))
 
@@ -9,20 +9,25 @@ __all__ = [
         'HtmlFile',
         'XmlFile',
         'TempFile',
+        'FileHasher',
+        'file_hasher',
         ]
 
 from contextlib import contextmanager
 from gettext import gettext as _, ngettext
 from pathlib import Path
+import collections
 import functools
 import hashlib
 import io
 import os
 import pathlib
 import shutil
+import stat
 import subprocess
 import sys
 import tempfile
+import threading
 import urllib.parse
 import urllib.request
 
@@ -33,6 +38,12 @@ from qip.propex import propex
 from qip.decorator import func_once
 from qip.utils import Auto
 
+try:
+    import xxhash
+    HAVE_XXHASH = True
+except ImportError:
+    HAVE_XXHASH = False
+
 _osPath = type(Path(''))
 
 
@@ -44,10 +55,20 @@ def toPath(value):
     return Path(value)
 
 # http://stackoverflow.com/questions/3431825/generating-a-md5-checksum-of-a-file
-def hashfile(afile, hasher, blocksize=65536,
+def hashfile(afile, hasher, blocksize=1024 * 1024,
              show_progress_bar=None, progress_bar_max=None, progress_bar_title=None,
              ):
+    """Update hasher with the remaining contents of afile and return it.
+
+    hasher may also be a list or tuple of hashers, all updated in a single
+    pass over the data.
+    """
+    if isinstance(hasher, (list, tuple)):
+        hashers = hasher
+    else:
+        hashers = (hasher,)
     pos = 0
+    start_pos = 0
     if show_progress_bar is None:
         show_progress_bar = progress_bar_max is not None
     if show_progress_bar:
@@ -56,7 +77,7 @@ def hashfile(afile, hasher, blocksize=65536,
         except ImportError:
             show_progress_bar = False
     if show_progress_bar:
-        start_pos = afile.tell()
+        start_pos = pos = afile.tell()
         if progress_bar_max is None:
             if afile.seekable():
                 afile.seek(0, io.SEEK_END)
@@ -71,14 +92,31 @@ def hashfile(afile, hasher, blocksize=65536,
         else:
             progress_bar = ProgressSpinner(progress_bar_title or 'Calculating hash')
     try:
-        buf = afile.read(blocksize)
-        pos += len(buf)
-        while len(buf) > 0:
-            hasher.update(buf)
-            if show_progress_bar:
-                progress_bar.goto(pos - start_pos)
+        readinto = getattr(afile, 'readinto', None)
+        if readinto is not None:
+            # Read into a single reused buffer
+            buf = bytearray(blocksize)
+            view = memoryview(buf)
+            while True:
+                n = readinto(buf)
+                if not n:
+                    break
+                data = view[:n] if n < blocksize else view
+                for h in hashers:
+                    h.update(data)
+                pos += n
+                if show_progress_bar:
+                    progress_bar.goto(pos - start_pos)
+        else:
             buf = afile.read(blocksize)
             pos += len(buf)
+            while len(buf) > 0:
+                for h in hashers:
+                    h.update(buf)
+                if show_progress_bar:
+                    progress_bar.goto(pos - start_pos)
+                buf = afile.read(blocksize)
+                pos += len(buf)
     finally:
         if show_progress_bar:
             progress_bar.finish()
@@ -86,6 +124,109 @@ def hashfile(afile, hasher, blocksize=65536,
     # [(fname, hashfile(open(fname, 'rb'), hashlib.md5())) for fname in fnamelst]
 
 
+def new_hasher(algorithm):
+    """Return a new hasher object for algorithm (hashlib name or xxh32/xxh64/xxh128)."""
+    if algorithm.startswith('xxh'):
+        if not HAVE_XXHASH:
+            raise ValueError(f'Hash algorithm {algorithm} requires the xxhash module')
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+class FileHasher(object):
+    """Compute file digests, memoizing results.
+
+    All requested digests are computed in a single pass over the file data.
+    Results are keyed on the file's (device, inode, size, mtime) so they
+    remain valid across paths (hard links) and are recomputed as soon as the
+    file is modified. Only the max_entries most recently used files are
+    memoized. If `disk_cache` is enabled, results are also persisted in the
+    probe cache.
+    """
+
+    blocksize = 1024 * 1024
+    disk_cache = False
+    max_entries = 4096
+
+    def __init__(self, *, blocksize=None, disk_cache=None, max_entries=None):
+        if blocksize is not None:
+            self.blocksize = blocksize
+        if disk_cache is not None:
+            self.disk_cache = disk_cache
+        if max_entries is not None:
+            self.max_entries = max_entries
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def hash_file(self, file_name, algorithms=('md5',), **kwargs):
+        """Return a {algorithm: hexdigest} dictionary for file_name."""
+        algorithms = tuple(algorithms)
+        file_name = toPath(file_name)
+        st = file_name.stat()
+        if not stat.S_ISREG(st.st_mode):
+            raise ValueError(f'Not a regular file: {file_name}')
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digests = dict(self._memory.get(key, {}))
+            if digests:
+                self._memory.move_to_end(key)
+        missing = [algorithm for algorithm in algorithms
+                   if algorithm not in digests]
+        disk_key = None
+        if missing and self.disk_cache:
+            from qip.probecache import probe_cache
+            # Keyed on the file's stat only; Never on a content hash (recursion)
+            disk_key = probe_cache.make_key('hash', file_name, {'algorithms': sorted(missing)},
+                                            content_hash=False)
+            disk_digests = probe_cache.get(disk_key)
+            if disk_digests is not None:
+                digests.update(disk_digests)
+                missing = [algorithm for algorithm in algorithms
+                           if algorithm not in digests]
+                disk_key = None
+        if missing:
+            hashers = [new_hasher(algorithm) for algorithm in missing]
+            with open(file_name, 'rb', buffering=0) as fp:
+                hashfile(fp, hashers, blocksize=self.blocksize, **kwargs)
+            new_digests = {algorithm: hasher.hexdigest()
+                           for algorithm, hasher in zip(missing, hashers)}
+            digests.update(new_digests)
+            if disk_key is not None:
+                probe_cache.put(disk_key, new_digests)
+        with self._lock:
+            self._memory.setdefault(key, {}).update(digests)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+        return {algorithm: digests[algorithm] for algorithm in algorithms}
+
+    def hash_files(self, file_names, algorithms=('md5',), *, jobs=None):
+        """Hash multiple files concurrently.
+
+        Yields (file_name, digests, exception) tuples in the same order as
+        file_names using up to `jobs` worker threads (default: CPU count.)
+        """
+        import concurrent.futures
+        if jobs is None or jobs is Auto:
+            jobs = os.cpu_count() or 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                (file_name, executor.submit(self.hash_file, file_name, algorithms))
+                for file_name in file_names]
+            for file_name, future in futures:
+                try:
+                    yield file_name, future.result(), None
+                except Exception as e:
+                    yield file_name, None, e
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+
+file_hasher = FileHasher()
+
+
 class _argparse_type(object):
 
     def __init__(self, file_cls, mode='r', resolved=True, **kwargs):
@@ -322,7 +463,8 @@ class File(object):
         raise NotImplementedError()
 
     def hash(self, hasher, **kwargs):
-        return hashfile(self.open(mode='rb'), hasher, **kwargs)
+        with self.open(mode='rb') as fp:
+            return hashfile(fp, hasher, **kwargs)
 
     md5 = propex(
         name='md5')
@@ -39,14 +39,14 @@ class FlacFile(SoundFile):
 
     _picture_extensions = tuple(_vorbis_picture_extensions)
 
-    def rip_cue_track(self, cue_track, bin_file=None, tags=None, yes=False):
+    def rip_cue_track(self, cue_track, bin_file=None, tags=None, yes=False, bin_fp=None):
         from .ffmpeg import ffmpeg
         from qip.wav import WavFile
         with WavFile.NamedTemporaryFile() as wav_file:
-            wav_file.rip_cue_track(cue_track=cue_track, bin_file=bin_file, tags=None, yes=yes)
+            wav_file.rip_cue_track(cue_track=cue_track, bin_file=bin_file, tags=None, yes=yes, bin_fp=bin_fp)
             # write -> read
             wav_file.flush()
-            wav_file.seel(0)
+            wav_file.seek(0)
             ffmpeg_args = [
                 '-i', wav_file,
             ]
@@ -192,7 +192,7 @@ class FlacFile(SoundFile):
                          progress_bar_max=progress_bar_max,
                          progress_bar_title=progress_bar_title or f'Encode {self} w/ ffmpeg',
                          )
-            out_time = ffmpeg.Timestamp(out.spawn.progress_match.group('time'))
+            out_time = out.spawn.out_time
             print('')
             if expected_duration is not None:
                 expected_duration = ffmpeg.Timestamp(expected_duration)
@@ -379,11 +379,12 @@ class ImageFile(MediaFile):
                 return ffprobe_dict
             raise ValueError('No json found in output of %r' % subprocess.list2cmdline(cmd))
 
-    def extract_info(self, need_actual_duration=False):
+    def extract_info(self, need_actual_duration=False, ffprobe_dict=None):
         tags_done = False
 
-        if shutil.which('ffprobe'):
-            ffprobe_dict = self.extract_ffprobe_dict()
+        if ffprobe_dict is not None or shutil.which('ffprobe'):
+            if ffprobe_dict is None:
+                ffprobe_dict = self.extract_ffprobe_dict()
             if ffprobe_dict:
                 # import pprint ; pprint.pprint(ffprobe_dict)
                 stream_dict, = ffprobe_dict['streams']
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Asynchronous job scheduling of Executable runs
+
+Jobs are limited per tool (and optionally per resource, such as a drive),
+wait by priority and report their resource usage.
+'''
+
+__all__ = (
+    'JobScheduler',
+    'PrioritySemaphore',
+)
+
+from pathlib import Path
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import os
+import resource
+import threading
+import time
+import types
+import logging
+log = logging.getLogger(__name__)
+
+from .app import app
+from .exec import collect_child_rusage
+
+_RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', None)
+
+
+class PrioritySemaphore(object):
+    """asyncio semaphore waking the highest priority waiter first (FIFO within
+    the same priority).
+    """
+
+    def __init__(self, value=1):
+        if value < 0:
+            raise ValueError('Semaphore initial value must be >= 0')
+        self._value = value
+        self._waiters = []  # heap of (-priority, seq, future)
+        self._seq = itertools.count()
+
+    def locked(self):
+        return self._value == 0
+
+    async def acquire(self, priority=0):
+        if self._value > 0:
+            self._value -= 1
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Woken up but cancelled anyway; Pass the slot on.
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        self._value += 1
+        while self._waiters and self._value > 0:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                # Cancelled waiter
+                continue
+            self._value -= 1
+            fut.set_result(True)
+
+
+class JobScheduler(object):
+    """Run Executable jobs concurrently within per-tool limits.
+
+    limits maps an executable name (or (name, resource_id) tuple) to the
+    maximum number of concurrent jobs; Tools without a limit use
+    default_limit (None is unlimited).
+
+    Queued jobs can be cancelled; Running jobs can't be interrupted and
+    complete in their worker thread (their slot is held until then).
+    """
+
+    default_limits = {
+        'ffmpeg': 2,
+        'ffprobe': 8,
+        'mediainfo': 8,
+        'makemkvcon': 1,
+    }
+
+    def __init__(self, limits=None, *, default_limit=None, max_workers=None):
+        self.limits = dict(self.default_limits)
+        if limits:
+            self.limits.update(limits)
+        self.default_limit = default_limit
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or max(32, (os.cpu_count() or 1) * 2),
+            thread_name_prefix='JobScheduler')
+        self.jobs = []
+        self._semaphores = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._rusage0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def job_key(self, executable, resource_id=None):
+        name = Path(os.fspath(executable.name)).name
+        return name if resource_id is None else (name, resource_id)
+
+    def get_semaphore(self, key):
+        try:
+            return self._semaphores[key]
+        except KeyError:
+            pass
+        name = key[0] if isinstance(key, tuple) else key
+        limit = self.limits.get(key, self.limits.get(name, self.default_limit))
+        semaphore = self._semaphores[key] = None if limit is None else PrioritySemaphore(limit)
+        return semaphore
+
+    async def run(self, executable, *args, priority=0, resource_id=None, **kwargs):
+        """Run executable(*args, **kwargs) when a slot is available.
+
+        Returns the result of executable.run(); The job's accounting record
+        is appended to self.jobs.
+        """
+        key = self.job_key(executable, resource_id=resource_id)
+        job = types.SimpleNamespace(
+            key=key,
+            priority=priority,
+            args=args,
+            queue_time=None,
+            wall_time=None,
+            cpu_user=None,
+            cpu_system=None,
+            maxrss=None,
+            thread_cpu=None,
+            exception=None,
+        )
+        semaphore = self.get_semaphore(key)
+        t0 = time.perf_counter()
+        if semaphore is not None:
+            await semaphore.acquire(priority)
+        job.queue_time = time.perf_counter() - t0
+        loop = asyncio.get_running_loop()
+        try:
+            cfuture = self.executor.submit(self._run_job, job, executable, args, kwargs)
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+        if semaphore is not None:
+            # Hold the slot until the job really ends, even if cancelled.
+            cfuture.add_done_callback(
+                lambda cfuture: loop.call_soon_threadsafe(semaphore.release))
+        return await asyncio.wrap_future(cfuture)
+
+    def submit(self, executable, *args, **kwargs):
+        """Schedule a job and return its asyncio.Task (cancellable)."""
+        task = asyncio.ensure_future(self.run(executable, *args, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def cancel_all(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def wait(self, return_exceptions=True):
+        return await asyncio.gather(*self._tasks, return_exceptions=return_exceptions)
+
+    def _run_job(self, job, executable, args, kwargs):
+        th0 = _RUSAGE_THREAD is not None and resource.getrusage(_RUSAGE_THREAD)
+        t0 = time.perf_counter()
+        rusages = ()
+        try:
+            with collect_child_rusage() as rusages:
+                return executable.run(*args, **kwargs)
+        except BaseException as e:
+            job.exception = e
+            raise
+        finally:
+            job.wall_time = time.perf_counter() - t0
+            if rusages:
+                # Usage of this job's own children, as they were reaped.
+                job.cpu_user = sum(ru.ru_utime for ru in rusages)
+                job.cpu_system = sum(ru.ru_stime for ru in rusages)
+                job.maxrss = max(ru.ru_maxrss for ru in rusages)
+            if th0:
+                th1 = resource.getrusage(_RUSAGE_THREAD)
+                job.thread_cpu = (th1.ru_utime - th0.ru_utime) + (th1.ru_stime - th0.ru_stime)
+            with self._lock:
+                self.jobs.append(job)
+            if app.statsd:
+                name = job.key[0] if isinstance(job.key, tuple) else job.key
+                app.statsd.timing(f'jobs.{name}.wall', job.wall_time * 1000)
+
+    def resource_usage(self):
+        """Aggregated usage of all jobs run so far."""
+        ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage = types.SimpleNamespace(
+            jobs=0,
+            failed_jobs=0,
+            wall_time=0.0,
+            queue_time=0.0,
+            cpu_user=ru.ru_utime - self._rusage0.ru_utime,
+            cpu_system=ru.ru_stime - self._rusage0.ru_stime,
+            # High-water mark of all children, including those not run as jobs.
+            maxrss=ru.ru_maxrss,
+            by_key={},
+        )
+        with self._lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            usage.jobs += 1
+            usage.failed_jobs += job.exception is not None
+            usage.wall_time += job.wall_time
+            usage.queue_time += job.queue_time
+            key_usage = usage.by_key.setdefault(job.key, types.SimpleNamespace(jobs=0, wall_time=0.0))
+            key_usage.jobs += 1
+            key_usage.wall_time += job.wall_time
+        return usage
+
+    def shutdown(self, wait=True):
+        self.cancel_all()
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.shutdown()
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 # vim: set fileencoding=utf-8 :
 
+import errno
+import io
 import os
 
 import logging
@@ -11,8 +13,16 @@ from qip.file import toPath
 from qip.mm import FrameRate
 from qip.utils import Timestamp
 
-from qip.libdvdread_swig import *
-import qip.libdvdread_swig as libdvdread_swig
+try:
+    from qip.libdvdread_swig import *
+    import qip.libdvdread_swig as libdvdread_swig
+except ImportError:
+    # SWIG extension not built (see libdvdread_swig.i)
+    HAVE_LIBDVDREAD = False
+    libdvdread_swig = None
+    DVD_VIDEO_LB_LEN = 2048
+else:
+    HAVE_LIBDVDREAD = True
 
 class dvd_reader(object):
 
@@ -50,6 +60,8 @@ class dvd_reader(object):
         assert self.handle is None
         device = self.device
         assert device is not None
+        if not HAVE_LIBDVDREAD:
+            raise NotImplementedError('qip.libdvdread_swig extension not built')
         handle = libdvdread_swig.DVDOpen(os.fspath(device))
         if handle is None:
             raise Exception(f'Can\'t open disc {device}!')
@@ -76,18 +88,49 @@ class dvd_reader(object):
         return self.handle is None
 
     def OpenFile(self, title, domain):
-        return dvd_file(libdvdread_swig.DVDOpenFile(
+        handle = libdvdread_swig.DVDOpenFile(
             self.handle,
             title,
-            domain))
+            domain)
+        if handle is None:
+            raise Exception(f'Can\'t open title {title} (domain {domain}) of {self.device}!')
+        return dvd_file(handle)
 
 
 class dvd_file(object):
 
+    handle = None  # "dvd_file_t *"
+
     def __init__(self, handle):
         self.handle = handle
         super().__init__()
 
+    def __del__(self):
+        if self.handle is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            self.close()
+
+    def close(self):
+        handle = self.handle
+        assert handle is not None
+        try:
+            libdvdread_swig.DVDCloseFile(handle)
+        finally:
+            self.handle = None
+
+    def FileSize(self):
+        """Size in blocks (DVD_VIDEO_LB_LEN bytes)."""
+        size = libdvdread_swig.DVDFileSize(self.handle)
+        if size < 0:
+            raise OSError('DVDFileSize failed')
+        return size
+
     def ReadBlocks(self, offset, count):
         return libdvdread_swig.wrapDVDReadBlocks(
             self.handle,
@@ -95,6 +138,120 @@ class dvd_file(object):
             count,
         )
 
+    def ReadBlocksInto(self, offset, buf):
+        """Read len(buf) // DVD_VIDEO_LB_LEN blocks into the writable buffer buf.
+
+        Returns the number of blocks read.
+        """
+        try:
+            wrapDVDReadBlocksInto = libdvdread_swig.wrapDVDReadBlocksInto
+        except AttributeError:
+            # Extension built without wrapDVDReadBlocksInto
+            data = self.ReadBlocks(offset, len(buf) // DVD_VIDEO_LB_LEN)
+            memoryview(buf)[:len(data)] = data
+            return len(data) // DVD_VIDEO_LB_LEN
+        return wrapDVDReadBlocksInto(self.handle, offset, buf)
+
+class VobBlockReader(io.RawIOBase):
+    """Raw stream of a VOB read through a libdvdread dvd_file.
+
+    Blocks are read in batches of batch_blocks into a reusable buffer;
+    Block-aligned reads of whole blocks go straight into the caller's buffer.
+    """
+
+    block_size = DVD_VIDEO_LB_LEN
+    batch_blocks = 512  # 1 MiB
+
+    def __init__(self, dvd_file, *, batch_blocks=None, closefd=True):
+        super().__init__()
+        self.dvd_file = dvd_file
+        if batch_blocks is not None:
+            self.batch_blocks = batch_blocks
+        self.closefd = closefd
+        self.size = dvd_file.FileSize() * self.block_size
+        self._pos = 0
+        self._buf = bytearray(self.batch_blocks * self.block_size)
+        self._buf_view = memoryview(self._buf)
+        self._buf_pos = 0  # Stream position of the buffer
+        self._buf_len = 0  # Valid bytes in the buffer
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f'invalid whence ({whence!r})')
+        if pos < 0:
+            raise ValueError(f'negative seek position {pos}')
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        self._checkClosed()
+        view = memoryview(b).cast('B')
+        want = min(len(view), self.size - self._pos)
+        if want <= 0:
+            return 0
+        offset = self._pos - self._buf_pos
+        if not 0 <= offset < self._buf_len:
+            block, offset = divmod(self._pos, self.block_size)
+            if offset == 0 and want >= self.block_size:
+                n = self._read_blocks_into(
+                    block, view[:want - want % self.block_size]) * self.block_size
+                self._pos += n
+                return n
+            self._buf_pos = block * self.block_size
+            self._buf_len = 0
+            self._buf_len = self._read_blocks_into(block, self._buf_view) * self.block_size
+        n = min(want, self._buf_len - offset)
+        view[:n] = self._buf_view[offset:offset + n]
+        self._pos += n
+        return n
+
+    def _read_blocks_into(self, block, buf):
+        n = self.dvd_file.ReadBlocksInto(block, buf)
+        if not n:
+            # Not EOF (size is known); Don't silently truncate the stream.
+            raise OSError(errno.EIO, f'Failed to read block {block} of {self.size // self.block_size}')
+        return n
+
+    def copy_to(self, fp_out):
+        """Copy the rest of the stream to fp_out (such as a pipe to ffmpeg).
+
+        Returns the number of bytes copied.
+        """
+        buf = bytearray(self.batch_blocks * self.block_size)
+        view = memoryview(buf)
+        total = 0
+        while True:
+            n = self.readinto(buf)
+            if not n:
+                break
+            fp_out.write(view[:n])
+            total += n
+        return total
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self.closefd:
+                    self.dvd_file.close()
+            finally:
+                super().close()
+
 class dvd_ifo(object):
 
     dvd: dvd_reader = None
@@ -59,4 +59,25 @@ PyObject *wrapDVDReadBlocks(dvd_file_t *dvd_file, int offset, size_t block_count
 }
 %}
 
+PyObject *wrapDVDReadBlocksInto(dvd_file_t *dvd_file, int offset, PyObject *buffer);
+
+%{
+PyObject *wrapDVDReadBlocksInto(dvd_file_t *dvd_file, int offset, PyObject *buffer) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(buffer, &view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) < 0) {
+        return NULL;
+    }
+    ssize_t nRead;
+    Py_BEGIN_ALLOW_THREADS
+    nRead = DVDReadBlocks(dvd_file, offset, view.len / DVD_VIDEO_LB_LEN,
+                          (unsigned char *)view.buf);
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
+    if (nRead < 0) {
+        return PyErr_SetFromErrno(PyExc_IOError);
+    }
+    return PyLong_FromSsize_t(nRead);
+}
+%}
+
 // vim: ft=c
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Persistent state of organized media libraries
+
+Files are identified by (device, inode, size, mtime) so a file keeps its
+identity when renamed or moved within a file system and loses it when
+modified.
+'''
+
+__all__ = (
+    'LibraryFileState',
+    'LibraryStateDB',
+)
+
+from pathlib import Path
+import collections
+import os
+import sqlite3
+import threading
+import time
+import logging
+log = logging.getLogger(__name__)
+
+LibraryFileState = collections.namedtuple(
+    'LibraryFileState',
+    (
+        'key',       # (dev, ino, size, mtime_ns)
+        'path',      # Last known path
+        'tags',      # Extracted tags (JSON)
+        'type',      # Deduced type
+        'info',      # Other extracted info (JSON)
+        'dst_path',  # Destination path
+        'options',   # Organize options the destination was computed with
+        'last_seen',
+    ),
+)
+
+
+class LibraryStateDB(object):
+    """SQLite store of the state of organized media files.
+
+    The extracted tags, deduced type and destination of each file are
+    recorded so unchanged files need not be probed nor evaluated again.
+    Changes are committed every commit_interval records and on close.
+    """
+
+    commit_interval = 1000
+
+    def __init__(self, db_file):
+        self.db_file = Path(db_file)
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._conn = sqlite3.connect(os.fspath(self.db_file), check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    dev INTEGER NOT NULL,
+                    ino INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    tags TEXT,
+                    type TEXT,
+                    info TEXT,
+                    dst_path TEXT,
+                    options TEXT,
+                    last_seen REAL,
+                    PRIMARY KEY (dev, ino, size, mtime_ns)
+                )''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS files_path ON files (path)')
+            self._conn.commit()
+
+    @staticmethod
+    def file_key(st):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def lookup(self, st):
+        """Return the LibraryFileState of the file with stat result st, or None."""
+        key = self.file_key(st)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT path, tags, type, info, dst_path, options, last_seen FROM files'
+                ' WHERE dev=? AND ino=? AND size=? AND mtime_ns=?',
+                key).fetchone()
+        if row is None:
+            return None
+        return LibraryFileState(key, *row)
+
+    def record(self, st, *, path, tags=None, type=None, info=None, dst_path=None, options=None):
+        """Record the state of the file with stat result st.
+
+        Older states recorded for the same path (modified file) are dropped.
+        """
+        key = self.file_key(st)
+        path = os.fspath(path)
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM files WHERE path=? AND NOT (dev=? AND ino=? AND size=? AND mtime_ns=?)',
+                (path,) + key)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files'
+                ' (dev, ino, size, mtime_ns, path, tags, type, info, dst_path, options, last_seen)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                key + (path, tags, type, info,
+                       None if dst_path is None else os.fspath(dst_path),
+                       options, time.time()))
+            self._changed()
+
+    def seen(self, st, *, path):
+        """Update the path and last seen time of a known file."""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE files SET path=?, last_seen=?'
+                ' WHERE dev=? AND ino=? AND size=? AND mtime_ns=?',
+                (os.fspath(path), time.time()) + self.file_key(st))
+            self._changed()
+
+    def _changed(self):
+        # Assumes self._lock is held
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_interval:
+            self._conn.commit()
+            self._uncommitted = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        if self._conn is not None:
+            self.commit()
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
@@ -1026,7 +1026,7 @@ class MatroskaFile(BinaryMediaFile):
                          progress_bar_max=progress_bar_max,
                          progress_bar_title=progress_bar_title or f'Encode {self} w/ ffmpeg',
                          )
-            out_time = ffmpeg.Timestamp(out.spawn.progress_match.group('time'))
+            out_time = out.spawn.out_time
             print('')
             if expected_duration is not None:
                 expected_duration = ffmpeg.Timestamp(expected_duration)
@@ -706,42 +706,12 @@ class MediaFile(File):
         return True
 
     def extract_ffprobe_dict(self, **kwargs):
-        from .exec import clean_cmd_output
-        from .parser import lines_parser
-        from . import json
         from .ffmpeg import ffprobe
-
-        kwargs.setdefault('show_streams', True)
-        kwargs.setdefault('show_format', True)
-        kwargs.setdefault('show_chapters', True)
-        kwargs.setdefault('show_error', True)
-
-        d = ffprobe(i=self,
-                    #threads=0,
-                    v='info',
-                    print_format='json',
-                    **kwargs)
-        out = d.out
-        out = clean_cmd_output(out)
-        parser = lines_parser(out.split('\n'))
-        ffprobe_dict = None
-        while parser.advance():
-            if parser.line == '{':
-                parser.pushback(parser.line)
-                ffprobe_dict = json.loads('\n'.join(parser.lines_iter))
-                break
-            parser.line = parser.line.strip()
-            if parser.line == '':
-                pass
-            else:
-                #log.debug('TODO: %s', parser.line)
-                pass
-        if ffprobe_dict:
-            if log.isEnabledFor(logging.DEBUG):
-                import pprint
-                log.debug('ffprobe_dict:\n%s', pprint.pformat(ffprobe_dict))
-            return ffprobe_dict
-        raise ValueError('No json found in output of ffprobe')
+        ffprobe_dict = ffprobe.probe(self, **kwargs)
+        if log.isEnabledFor(logging.DEBUG):
+            import pprint
+            log.debug('ffprobe_dict:\n%s', pprint.pformat(ffprobe_dict))
+        return ffprobe_dict
 
     ffprobe_dict = propex(
         name='ffprobe_dict',
@@ -754,10 +724,17 @@ class MediaFile(File):
     def extract_mediainfo_dict(self,
                                *args, **kwargs):
         from .mediainfo import mediainfo
-        d = mediainfo(self.file_name, *args, **kwargs)
-        out = d.out
+        from .probecache import probe_cache
+        cache_key = probe_cache.make_key('mediainfo', self.file_name, dict(kwargs, _args=args))
+        out = probe_cache.get(cache_key)
+        if out is None:
+            d = mediainfo(self.file_name, *args, **kwargs)
+            out = byte_decode(d.out)
+        else:
+            cache_key = None  # Already cached
         mediainfo_dict = mediainfo.parse(out)
         if mediainfo_dict:
+            probe_cache.put(cache_key, out)
             if log.isEnabledFor(logging.DEBUG):
                 import pprint
                 log.debug('mediainfo_dict:\n%s', pprint.pformat(mediainfo_dict))
@@ -1095,7 +1072,7 @@ class MediaFile(File):
                                        progress_bar_title=progress_bar_title or f'Write {self} chapters w/ ffmpeg',
                                        )
 
-    def extract_info(self, need_actual_duration=False):
+    def extract_info(self, need_actual_duration=False, ffprobe_dict=None):
         tags_done = False
 
         try:
@@ -1107,8 +1084,9 @@ class MediaFile(File):
                 self.tags.update(loaded_tags)
                 tags_done = True
 
-        if shutil.which('ffprobe'):
-            ffprobe_dict = self.extract_ffprobe_dict()
+        if ffprobe_dict is not None or shutil.which('ffprobe'):
+            if ffprobe_dict is None:
+                ffprobe_dict = self.extract_ffprobe_dict()
             if ffprobe_dict:
                 # import pprint ; pprint.pprint(ffprobe_dict)
                 for stream_dict in ffprobe_dict['streams']:
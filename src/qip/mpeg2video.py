@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+__all__ = (
+    'Mpeg2PictureFlags',
+    'Mpeg2PictureFlagsParser',
+    'supported_codec_names',
+)
+
+# ISO/IEC 13818-2 (MPEG-2 Video)
+
+import collections
+import logging
+log = logging.getLogger(__name__)
+
+supported_codec_names = (
+    'mpeg1video',
+    'mpeg2video',
+)
+
+picture_start_code = b'\x00\x00\x01\x00'
+extension_start_code = b'\x00\x00\x01\xb5'
+
+sequence_extension_id = 0x1
+picture_coding_extension_id = 0x8
+
+# picture_structure
+PICT_TOP_FIELD = 1
+PICT_BOTTOM_FIELD = 2
+PICT_FRAME = 3
+
+Mpeg2PictureFlags = collections.namedtuple(
+    'Mpeg2PictureFlags',
+    (
+        'interlaced_frame',
+        'top_field_first',
+        'repeat_pict',
+    ),
+)
+
+_progressive_picture_flags = Mpeg2PictureFlags(
+    interlaced_frame=False,
+    top_field_first=False,
+    repeat_pict=0,
+)
+
+
+class Mpeg2PictureFlagsParser(object):
+    """Extract frame field flags from MPEG-1/2 video packets without decoding.
+
+    The flags are read from the picture coding extension header and reported
+    the same way libavcodec's mpeg12 decoder sets them on decoded frames.
+    The sequence extension's progressive_sequence flag is tracked across
+    packets.
+
+    Field pictures are paired into frames whose field order is that of the
+    first field; The second field of a pair yields no flags of its own,
+    whether it is in the same packet as the first or in the next one.
+    """
+
+    progressive_sequence = True
+    first_field_structure = None  # Structure of an unpaired first field
+
+    def parse(self, data):
+        """Return the Mpeg2PictureFlags of the first picture in data.
+
+        Returns None if data contains no picture header or only the second
+        field of a field picture pair.
+        """
+        data = bytes(data)
+        pos = data.find(picture_start_code)
+        # Sequence extensions precede the picture header
+        end = len(data) if pos == -1 else pos
+        ext_pos = data.find(extension_start_code, 0, end)
+        while ext_pos != -1:
+            self._parse_extension(data, ext_pos + 4)
+            ext_pos = data.find(extension_start_code, ext_pos + 4, end)
+        if pos == -1:
+            return None
+        picture_coding = self._find_picture_coding_extension(data, pos)
+        if picture_coding is None:
+            # MPEG-1
+            self.first_field_structure = None
+            return _progressive_picture_flags
+        picture_structure, flags = picture_coding
+        if picture_structure == PICT_FRAME:
+            self.first_field_structure = None
+            return flags
+        if self.first_field_structure is not None \
+                and self.first_field_structure != picture_structure:
+            # Second field of the pair started in the previous packet
+            self.first_field_structure = None
+            return None
+        # First field; The second field may follow in the same packet
+        self.first_field_structure = picture_structure
+        next_pos = data.find(picture_start_code, pos + 4)
+        if next_pos != -1:
+            next_picture_coding = self._find_picture_coding_extension(data, next_pos)
+            if next_picture_coding is not None \
+                    and next_picture_coding[0] not in (PICT_FRAME, picture_structure):
+                self.first_field_structure = None
+        return flags._replace(
+            interlaced_frame=True,
+            top_field_first=picture_structure == PICT_TOP_FIELD,
+            repeat_pict=0,
+        )
+
+    def _find_picture_coding_extension(self, data, pos):
+        # The picture coding extension follows the picture header (MPEG-2 only)
+        # Returns (picture_structure, flags) or None
+        end = data.find(picture_start_code, pos + 4)
+        if end == -1:
+            end = len(data)
+        ext_pos = data.find(extension_start_code, pos + 4, end)
+        while ext_pos != -1:
+            picture_coding = self._parse_extension(data, ext_pos + 4)
+            if picture_coding is not None:
+                return picture_coding
+            ext_pos = data.find(extension_start_code, ext_pos + 4, end)
+        return None
+
+    def _parse_extension(self, data, pos):
+        try:
+            extension_id = data[pos] >> 4
+        except IndexError:
+            return None
+        if extension_id == sequence_extension_id:
+            # extension_start_code_identifier 4, profile_and_level_indication 8, progressive_sequence 1
+            if pos + 2 <= len(data):
+                self.progressive_sequence = bool(data[pos + 1] & 0x08)
+            return None
+        if extension_id == picture_coding_extension_id:
+            # extension_start_code_identifier 4, f_code 4x4,
+            # intra_dc_precision 2, picture_structure 2,
+            # top_field_first 1, frame_pred_frame_dct 1,
+            # concealment_motion_vectors 1, q_scale_type 1,
+            # intra_vlc_format 1, alternate_scan 1,
+            # repeat_first_field 1, chroma_420_type 1,
+            # progressive_frame 1, ...
+            if pos + 5 > len(data):
+                return None
+            picture_structure = data[pos + 2] & 0x03
+            top_field_first = bool(data[pos + 3] & 0x80)
+            repeat_first_field = bool(data[pos + 3] & 0x02)
+            progressive_frame = bool(data[pos + 4] & 0x80)
+            repeat_pict = 0
+            if repeat_first_field:
+                if self.progressive_sequence:
+                    repeat_pict = 4 if top_field_first else 2
+                elif progressive_frame:
+                    repeat_pict = 1
+            return picture_structure, Mpeg2PictureFlags(
+                interlaced_frame=not (progressive_frame or self.progressive_sequence),
+                top_field_first=top_field_first,
+                repeat_pict=repeat_pict,
+            )
+        return None
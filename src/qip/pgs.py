@@ -3,13 +3,19 @@
 
 __all__ = (
     'PgsFile',
+    'PgsSegmentReader',
 )
 
 # http://blog.thescorpius.com/index.php/2017/07/15/presentation-graphic-stream-sup-files-bluray-subtitle-format/
 
+import array
+import bisect
+import collections
 import enum
 import itertools
 import logging
+import mmap
+import os
 import struct
 import types
 log = logging.getLogger(__name__)
@@ -306,6 +312,310 @@ def pgs_iter_segments(fp):
             break
         yield pgs_segment
 
+## Memory-mapped segment reader
+
+PgsPaletteEntry = collections.namedtuple(
+    'PgsPaletteEntry',
+    (
+        'palette_entry_id',
+        'luminance',
+        'color_difference_red',
+        'color_difference_blue',
+        'transparency',
+    ),
+)
+
+PgsWindowEntry = collections.namedtuple(
+    'PgsWindowEntry',
+    (
+        'window_id',
+        'horizontal_pos',
+        'vertical_pos',
+        'width',
+        'height',
+    ),
+)
+
+class PgsSegmentRecord(object):
+    """Light-weight PGS segment referencing the reader's buffer.
+
+    Type-specific fields are decoded on access; Records are only valid while
+    their reader is open.
+    """
+
+    __slots__ = (
+        '_buf',
+        'offset',
+        'pts',
+        'dts',
+        'segment_type',
+        'segment_size',
+    )
+
+    def __init__(self, buf, offset, pts, dts, segment_type, segment_size):
+        self._buf = buf
+        self.offset = offset
+        self.pts = pts
+        self.dts = dts
+        self.segment_type = segment_type
+        self.segment_size = segment_size
+
+    @property
+    def magic_number(self):
+        return b'PG'
+
+    @property
+    def data_offset(self):
+        return self.offset + pgs_segment_header_st.size
+
+    @property
+    def data(self):
+        data_offset = self.data_offset
+        return self._buf[data_offset:data_offset + self.segment_size]
+
+    def __repr__(self):
+        return '%s(offset=%r, pts=%r, dts=%r, segment_type=%s, segment_size=%r)' % (
+            self.__class__.__name__,
+            self.offset, self.pts, self.dts, self.segment_type.name, self.segment_size)
+
+class PgsPdsSegmentRecord(PgsSegmentRecord):
+
+    __slots__ = ()
+
+    @property
+    def palette_id(self):
+        return self._buf[self.data_offset]
+
+    @property
+    def palette_version_number(self):
+        return self._buf[self.data_offset + 1]
+
+    @property
+    def palette_entries(self):
+        offset = self.data_offset + pgs_pds_segment_header_st.size
+        end = self.data_offset + self.segment_size
+        entry_size = pgs_pds_segment_entry_st.size
+        return [PgsPaletteEntry._make(pgs_pds_segment_entry_st.unpack_from(self._buf, entry_offset))
+                for entry_offset in range(offset, end - entry_size + 1, entry_size)]
+
+class PgsOdsSegmentRecord(PgsSegmentRecord):
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            l1, l2, l3 = self._unpack()[3:6]
+        except struct.error as e:
+            raise ValueError(f'Error reading PGS ODS segment at offset {self.offset} of {self.segment_size} bytes: {e}')
+        object_data_length = (l1 << 16) | (l2 << 8) | l3
+        if self.segment_size - pgs_ods_segment_st.size != (object_data_length - 4):  # -4 because Width and Height is part of the "object data"
+            raise ValueError(f'Invalid object data length {object_data_length} for PGS ODS segment of size {self.segment_size}')
+
+    def _unpack(self):
+        return pgs_ods_segment_st.unpack_from(self._buf, self.data_offset)
+
+    @property
+    def object_id(self):
+        return self._unpack()[0]
+
+    @property
+    def object_version_numner(self):
+        return self._unpack()[1]
+
+    @property
+    def sequence_flags(self):
+        return self._unpack()[2]
+
+    @property
+    def object_data_length(self):
+        l1, l2, l3 = self._unpack()[3:6]
+        return (l1 << 16) | (l2 << 8) | l3
+
+    @property
+    def width(self):
+        return self._unpack()[6]
+
+    @property
+    def height(self):
+        return self._unpack()[7]
+
+    @property
+    def object_data(self):
+        offset = self.data_offset + pgs_ods_segment_st.size
+        return self._buf[offset:self.data_offset + self.segment_size]
+
+class PgsPcsSegmentRecord(PgsSegmentRecord):
+
+    __slots__ = ()
+
+    def _unpack(self):
+        return pgs_pcs_segment_st.unpack_from(self._buf, self.data_offset)
+
+    @property
+    def width(self):
+        return self._unpack()[0]
+
+    @property
+    def height(self):
+        return self._unpack()[1]
+
+    @property
+    def frame_rate(self):
+        return self._unpack()[2]
+
+    @property
+    def composition_number(self):
+        return self._unpack()[3]
+
+    @property
+    def composition_state(self):
+        return PgsPcsCompositionStateEnum(self._unpack()[4])
+
+    @property
+    def palette_update_flag(self):
+        return PaletteUpdateFlag(self._unpack()[5])
+
+    @property
+    def palette_id(self):
+        return self._unpack()[6]
+
+    @property
+    def composition_objects_count(self):
+        return self._unpack()[7]
+
+    @property
+    def composition_objects_data(self):
+        offset = self.data_offset + pgs_pcs_segment_st.size
+        return self._buf[offset:self.data_offset + self.segment_size]
+
+class PgsWdsSegmentRecord(PgsSegmentRecord):
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.segment_size:
+            raise ValueError(f'Error reading PGS WDS segment header at offset {self.offset} of {self.segment_size} bytes')
+        windows_count = self.windows_count
+        if pgs_wds_segment_header_st.size + windows_count * pgs_wds_segment_entry_st.size != self.segment_size:
+            raise ValueError(f'Invalid number of windows in segment: {windows_count} (segment size {self.segment_size})')
+
+    @property
+    def windows_count(self):
+        return self._buf[self.data_offset]
+
+    @property
+    def window_entries(self):
+        offset = self.data_offset + pgs_wds_segment_header_st.size
+        entry_size = pgs_wds_segment_entry_st.size
+        return [PgsWindowEntry._make(pgs_wds_segment_entry_st.unpack_from(self._buf, offset + i * entry_size))
+                for i in range(self.windows_count)]
+
+_pgs_segment_record_classes = {
+    PgsSegmentTypeEnum.PDS: PgsPdsSegmentRecord,
+    PgsSegmentTypeEnum.ODS: PgsOdsSegmentRecord,
+    PgsSegmentTypeEnum.PCS: PgsPcsSegmentRecord,
+    PgsSegmentTypeEnum.WDS: PgsWdsSegmentRecord,
+    PgsSegmentTypeEnum.END: PgsSegmentRecord,
+}
+
+class PgsSegmentReader(object):
+    """Walk the segments of a .sup file mapped in memory.
+
+    Segments are yielded as light-weight records holding views into the
+    mapped file so scanning requires constant memory regardless of the file
+    size.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._fp = None
+        self._mmap = None
+        self._buf = None
+        self._pts_index = None
+
+    def open(self):
+        self._fp = open(self.file_name, 'rb')
+        if os.fstat(self._fp.fileno()).st_size:
+            self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buf = memoryview(self._mmap)
+        else:
+            self._buf = memoryview(b'')
+        return self
+
+    def close(self):
+        self._pts_index = None
+        if self._buf is not None:
+            self._buf = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Segment views still referenced; Released when collected.
+                pass
+            self._mmap = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def iter_segments(self, offset=0):
+        buf = self._buf
+        size = len(buf)
+        header_size = pgs_segment_header_st.size
+        unpack_from = pgs_segment_header_st.unpack_from
+        record_classes = _pgs_segment_record_classes
+        while offset < size:
+            try:
+                magic_number, pts, dts, segment_type, segment_size = \
+                    unpack_from(buf, offset)
+            except struct.error as e:
+                raise ValueError(f'Error reading PGS segment header at offset {offset} of {size} bytes: {e}')
+            test_pgs_segment_magic_number(magic_number)
+            segment_type = PgsSegmentTypeEnum(segment_type)
+            if offset + header_size + segment_size > size:
+                raise ValueError(f'Truncated PGS {segment_type.name} segment at offset {offset}')
+            yield record_classes[segment_type](buf, offset, pts, dts, segment_type, segment_size)
+            offset += header_size + segment_size
+
+    __iter__ = iter_segments
+
+    @property
+    def pts_index(self):
+        """(pts, offset) arrays of the display sets, ordered by pts."""
+        pts_index = self._pts_index
+        if pts_index is None:
+            ptss = array.array('Q')
+            offsets = array.array('Q')
+            for segment in self.iter_segments():
+                if segment.segment_type is PgsSegmentTypeEnum.PCS:
+                    ptss.append(segment.pts)
+                    offsets.append(segment.offset)
+            if any(pts1 > pts2 for pts1, pts2 in zip(ptss, ptss[1:])):
+                pairs = sorted(zip(ptss, offsets))
+                ptss = array.array('Q', (pts for pts, offset in pairs))
+                offsets = array.array('Q', (offset for pts, offset in pairs))
+            pts_index = self._pts_index = (ptss, offsets)
+        return pts_index
+
+    def find_display_set_offset(self, pts):
+        """Return the offset of the last display set starting at or before pts."""
+        ptss, offsets = self.pts_index
+        i = bisect.bisect_right(ptss, pts)
+        if not i:
+            return None
+        return offsets[i - 1]
+
+    def iter_segments_from_pts(self, pts):
+        offset = self.find_display_set_offset(pts)
+        return self.iter_segments(offset or 0)
+
 class PgsFile(BinarySubtitleFile):
     # HDMV Presentation Graphic Stream subtitles
 
@@ -321,8 +631,11 @@ class PgsFile(BinarySubtitleFile):
     def iter_pgs_segments(self):
         if self.fp is not None:
             return pgs_iter_segments(self.fp)
-        with self.open(mode='r') as fp:
-            return iter(list(pgs_iter_segments(fp)))
+        return self._iter_mapped_pgs_segments()
+
+    def _iter_mapped_pgs_segments(self):
+        with PgsSegmentReader(self.file_name) as reader:
+            yield from reader.iter_segments()
 
 def rle_decode(rle_data, width, height, palette=None):
     palettize = (lambda entry: entry) if palette is None else (lambda entry: palette[entry])
@@ -367,4 +680,99 @@ def rle_decode(rle_data, width, height, palette=None):
     if i < height:
         log.warning('rle_decode: Hanging pixels without line ending (expected: %d, actual: %d)', height, i)
 
+def iter_rle_runs(rle_data, height=None):
+    """Iterate the (entry, repeat) runs of PGS RLE data without expanding them.
+
+    End of line markers are reported as (None, 0) runs. Iteration stops after
+    `height` lines, if given, or at the end of the data.
+    """
+    # See https://github.com/Sec-ant/BDSupReader/blob/master/src/RunLength.c
+    rle_data = memoryview(rle_data).cast('B')
+    size = len(rle_data)
+    offset = 0
+    i = 0
+    try:
+        while offset < size:
+            first = rle_data[offset]
+            if first > 0:
+                offset += 1
+                yield first, 1
+                continue
+            second = rle_data[offset + 1]
+            if second == 0:
+                offset += 2
+                yield None, 0
+                i += 1
+                if i == height:
+                    break
+            elif second < 64:
+                offset += 2
+                yield 0, second
+            elif second < 128:
+                repeat = ((second - 64) << 8) + rle_data[offset + 2]
+                offset += 3
+                yield 0, repeat
+            elif second < 192:
+                entry = rle_data[offset + 2]
+                offset += 3
+                yield entry, second - 128
+            else:
+                repeat = ((second - 192) << 8) + rle_data[offset + 2]
+                entry = rle_data[offset + 3]
+                offset += 4
+                yield entry, repeat
+    except IndexError:
+        log.warning('iter_rle_runs: Truncated RLE data at offset %d of %d', offset, size)
+
+def rle_decode_into(rle_data, width, height, out=None):
+    """Decode PGS RLE data into a width*height bytearray of palette entries.
+
+    If `out` is given, it is reused (and must be large enough).
+    Lines are padded or truncated to `width`.
+    """
+    if out is None:
+        out = bytearray(width * height)
+    line_start = pos = 0
+    line_end = width
+    fills = {}
+    for entry, repeat in iter_rle_runs(rle_data, height=height):
+        if entry is None:
+            if pos < line_end:
+                out[pos:line_end] = bytes(line_end - pos)
+            line_start += width
+            line_end = line_start + width
+            pos = line_start
+            continue
+        if pos + repeat > line_end:
+            repeat = line_end - pos
+        if repeat == 1:
+            out[pos] = entry
+        elif repeat > 0:
+            try:
+                fill = fills[entry]
+            except KeyError:
+                fill = fills[entry] = bytes((entry,)) * width
+            out[pos:pos + repeat] = fill[:repeat]
+        pos += repeat
+    if line_start < height * width:
+        log.warning('rle_decode: Hanging pixels without line ending (expected: %d, actual: %d)', height, line_start // width)
+    return out
+
+def ods_is_blank(object_data, palette=None, height=None):
+    """Return True if all pixels of the RLE object_data have the same color.
+
+    Runs are scanned without being expanded and scanning stops at the first
+    run of a different color.
+    """
+    color = None
+    for entry, repeat in iter_rle_runs(object_data, height=height):
+        if not repeat:
+            continue
+        entry_color = entry if palette is None else palette[entry]
+        if color is None:
+            color = entry_color
+        elif entry_color != color:
+            return False
+    return True
+
 PgsFile._build_extension_to_class_map()
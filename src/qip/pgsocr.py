@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''OCR of PGS (.sup) subtitles into SubRip (.srt)
+
+Display sets are decoded directly from the .sup file into cropped grayscale
+bitmaps (dark text on a white background), identical bitmaps are recognized
+only once and the resulting text is assembled with the original timings.
+'''
+
+__all__ = (
+    'PgsBitmap',
+    'PgsSubtitleEvent',
+    'TesseractOcrBackend',
+    'iter_pgs_display_sets',
+    'iter_pgs_subtitle_events',
+    'pgs_ocr_to_srt',
+)
+
+from pathlib import Path
+import collections
+import concurrent.futures
+import hashlib
+import os
+import struct
+import tempfile
+import zlib
+import logging
+log = logging.getLogger(__name__)
+
+from .pgs import (
+    PgsSegmentReader,
+    PgsSegmentTypeEnum,
+    PgsOdsSequenceFlags,
+    rle_decode_into,
+)
+
+PGS_TIME_BASE = 90000
+
+pgs_composition_object_st = struct.Struct('!HBBHH')
+"""
+Name                        Size in bytes   Description
+Object ID                   2               ID of the ODS segment that defines the image to be shown
+Window ID                   1               Id of the WDS segment to which the image is allocated in the PCS
+Object Cropped Flag         1               0x40: Force display of the cropped image object
+                                            0x00: Off
+Object Horizontal Position  2               X offset from the top left pixel of the image on the screen
+Object Vertical Position    2               Y offset from the top left pixel of the image on the screen
+Object Cropping Horizontal Position 2       (if cropped)
+Object Cropping Vertical Position   2       (if cropped)
+Object Cropping Width       2               (if cropped)
+Object Cropping Height      2               (if cropped)
+"""
+
+pgs_composition_object_crop_st = struct.Struct('!HHHH')
+
+PgsCompositionObject = collections.namedtuple(
+    'PgsCompositionObject',
+    (
+        'object_id',
+        'window_id',
+        'horizontal_pos',
+        'vertical_pos',
+        'crop',  # (x, y, width, height) or None
+    ),
+)
+
+PgsDisplaySet = collections.namedtuple(
+    'PgsDisplaySet',
+    (
+        'pts',
+        'bitmaps',
+    ),
+)
+
+PgsSubtitleEvent = collections.namedtuple(
+    'PgsSubtitleEvent',
+    (
+        'start_pts',
+        'end_pts',
+        'bitmaps',
+    ),
+)
+
+class PgsBitmap(collections.namedtuple(
+        'PgsBitmap',
+        (
+            'horizontal_pos',
+            'vertical_pos',
+            'width',
+            'height',
+            'data',  # 8-bit grayscale, row-major
+        ))):
+
+    __slots__ = ()
+
+    @property
+    def digest(self):
+        return hashlib.md5(struct.pack('!HH', self.width, self.height) + self.data).digest()
+
+    def to_pgm(self):
+        return b'P5\n%d %d\n255\n' % (self.width, self.height) + self.data
+
+    def to_png(self):
+        def chunk(chunk_type, chunk_data):
+            return struct.pack('!I', len(chunk_data)) + chunk_type + chunk_data \
+                + struct.pack('!I', zlib.crc32(chunk_type + chunk_data))
+        width = self.width
+        data = self.data
+        # Filter type 0 (None) on each scanline
+        raw = b''.join(b'\x00' + data[i:i + width]
+                       for i in range(0, len(data), width))
+        return b''.join([
+            b'\x89PNG\r\n\x1a\n',
+            chunk(b'IHDR', struct.pack('!IIBBBBB', width, self.height, 8, 0, 0, 0, 0)),
+            chunk(b'IDAT', zlib.compress(raw)),
+            chunk(b'IEND', b''),
+        ])
+
+    def save(self, file_name, image_format='png'):
+        if image_format == 'png':
+            data = self.to_png()
+        elif image_format in ('pgm', 'raw'):
+            data = self.to_pgm()
+        else:
+            raise ValueError(f'Unsupported image format {image_format!r}')
+        with open(file_name, 'wb') as fp:
+            fp.write(data)
+
+def _parse_composition_objects(pcs_segment):
+    data = pcs_segment.composition_objects_data
+    objects = []
+    offset = 0
+    for i in range(pcs_segment.composition_objects_count):
+        object_id, window_id, cropped_flag, horizontal_pos, vertical_pos = \
+            pgs_composition_object_st.unpack_from(data, offset)
+        offset += pgs_composition_object_st.size
+        crop = None
+        if cropped_flag & 0x40:
+            crop = pgs_composition_object_crop_st.unpack_from(data, offset)
+            offset += pgs_composition_object_crop_st.size
+        objects.append(PgsCompositionObject(
+            object_id=object_id,
+            window_id=window_id,
+            horizontal_pos=horizontal_pos,
+            vertical_pos=vertical_pos,
+            crop=crop,
+        ))
+    return objects
+
+def _palette_to_gray_table(palette_entries):
+    # Transparent entries are white; Opaque bright (text) entries are dark.
+    table = bytearray(b'\xff' * 256)
+    for entry in palette_entries:
+        intensity = entry.luminance * entry.transparency // 255
+        table[entry.palette_entry_id] = 255 - intensity
+    return bytes(table)
+
+def _crop_to_content(width, height, data, background=0xff, margin=0):
+    blank_row = bytes((background,)) * width
+    bg = bytes((background,))
+    rows = [data[y * width:(y + 1) * width] for y in range(height)]
+    top = 0
+    while top < height and rows[top] == blank_row:
+        top += 1
+    if top == height:
+        return None
+    bottom = height
+    while rows[bottom - 1] == blank_row:
+        bottom -= 1
+    rows = rows[top:bottom]
+    left = min(len(row) - len(row.lstrip(bg)) for row in rows)
+    right = max(len(row.rstrip(bg)) for row in rows)
+    margin_row = bytes((background,)) * (right - left + 2 * margin)
+    margin_col = bg * margin
+    out = [margin_row] * margin \
+        + [margin_col + row[left:right] + margin_col for row in rows] \
+        + [margin_row] * margin
+    return left, top, right - left + 2 * margin, bottom - top + 2 * margin, b''.join(out)
+
+def iter_pgs_display_sets(file_name, *, margin=10):
+    """Iterate the PgsDisplaySet of a .sup file.
+
+    Each composition object is decoded, palette-applied and cropped to its
+    visible content. Display sets that clear the screen have no bitmaps.
+    """
+    palettes = {}
+    objects = {}
+    pcs_segment = None
+    composition_objects = ()
+    with PgsSegmentReader(file_name) as reader:
+        for segment in reader.iter_segments():
+            segment_type = segment.segment_type
+            if segment_type is PgsSegmentTypeEnum.PCS:
+                pcs_segment = segment
+                composition_objects = _parse_composition_objects(segment)
+            elif segment_type is PgsSegmentTypeEnum.PDS:
+                palettes[segment.palette_id] = _palette_to_gray_table(segment.palette_entries)
+            elif segment_type is PgsSegmentTypeEnum.ODS:
+                if segment.sequence_flags & PgsOdsSequenceFlags.FirstInSequence:
+                    objects[segment.object_id] = (segment.width, segment.height, bytearray(segment.object_data))
+                else:
+                    # Continuation fragments only repeat the object ID, version and flags
+                    try:
+                        objects[segment.object_id][2].extend(segment.data[4:])
+                    except KeyError:
+                        log.warning('PGS ODS continuation without first fragment at offset %d', segment.offset)
+            elif segment_type is PgsSegmentTypeEnum.END:
+                if pcs_segment is None:
+                    continue
+                table = palettes.get(pcs_segment.palette_id)
+                bitmaps = []
+                for composition_object in composition_objects:
+                    try:
+                        width, height, rle_data = objects[composition_object.object_id]
+                    except KeyError:
+                        log.warning('PGS composition object %d not defined at pts %d', composition_object.object_id, pcs_segment.pts)
+                        continue
+                    if table is None:
+                        log.warning('PGS palette %d not defined at pts %d', pcs_segment.palette_id, pcs_segment.pts)
+                        continue
+                    pixels = rle_decode_into(rle_data, width, height)
+                    horizontal_pos = composition_object.horizontal_pos
+                    vertical_pos = composition_object.vertical_pos
+                    if composition_object.crop is not None:
+                        crop_x, crop_y, crop_width, crop_height = composition_object.crop
+                        crop_width = min(crop_width, width - crop_x)
+                        crop_height = min(crop_height, height - crop_y)
+                        pixels = b''.join(pixels[y * width + crop_x:y * width + crop_x + crop_width]
+                                          for y in range(crop_y, crop_y + crop_height))
+                        width, height = crop_width, crop_height
+                    cropped = _crop_to_content(width, height, bytes(pixels).translate(table), margin=margin)
+                    if cropped is None:
+                        continue
+                    left, top, width, height, data = cropped
+                    bitmaps.append(PgsBitmap(
+                        horizontal_pos=horizontal_pos + left,
+                        vertical_pos=vertical_pos + top,
+                        width=width,
+                        height=height,
+                        data=data,
+                    ))
+                bitmaps.sort(key=lambda bitmap: (bitmap.vertical_pos, bitmap.horizontal_pos))
+                yield PgsDisplaySet(pts=pcs_segment.pts, bitmaps=bitmaps)
+                pcs_segment = None
+
+def iter_pgs_subtitle_events(file_name, **kwargs):
+    """Iterate the PgsSubtitleEvent of a .sup file.
+
+    Events end when the next display set is shown.
+    """
+    event = None
+    for display_set in iter_pgs_display_sets(file_name, **kwargs):
+        if event is not None:
+            yield event._replace(end_pts=display_set.pts)
+            event = None
+        if display_set.bitmaps:
+            event = PgsSubtitleEvent(start_pts=display_set.pts, end_pts=None, bitmaps=display_set.bitmaps)
+    if event is not None:
+        # Last event never cleared; Show it for a few seconds.
+        yield event._replace(end_pts=event.start_pts + 5 * PGS_TIME_BASE)
+
+class TesseractOcrBackend(object):
+    """OCR backend using the tesseract command-line tool.
+
+    Any object with a compatible `ocr(image_file, *, language)` method can
+    be used as a backend.
+    """
+
+    image_format = 'png'
+
+    def __init__(self, psm=6):
+        self.psm = psm
+
+    def ocr(self, image_file, *, language=None):
+        from .tesseract import tesseract
+        return tesseract.ocr_image(image_file, language=language, psm=self.psm)
+
+def srt_timestamp(pts):
+    ms = pts * 1000 // PGS_TIME_BASE
+    s, ms = divmod(ms, 1000)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return '%02d:%02d:%02d,%03d' % (h, m, s, ms)
+
+def _clean_ocr_text(text):
+    lines = (line.strip() for line in text.replace('\f', '').splitlines())
+    return '\n'.join(line for line in lines if line)
+
+def pgs_ocr_to_srt(sup_file, srt_file, *, language=None, backend=None, jobs=None, work_dir=None):
+    """OCR the PGS subtitles of sup_file and write them to srt_file.
+
+    Identical bitmaps are recognized once; Recognition runs on `jobs`
+    parallel workers.
+    Returns the number of subtitle entries written.
+    """
+    if backend is None:
+        backend = TesseractOcrBackend()
+    image_format = getattr(backend, 'image_format', 'png')
+    image_ext = {'raw': 'pgm'}.get(image_format, image_format)
+    events = list(iter_pgs_subtitle_events(sup_file))
+
+    with tempfile.TemporaryDirectory(prefix='pgsocr-', dir=work_dir) as tmp_dir, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+
+        def ocr_bitmap(bitmap, image_file):
+            bitmap.save(image_file, image_format=image_format)
+            try:
+                return _clean_ocr_text(backend.ocr(image_file, language=language))
+            finally:
+                os.unlink(image_file)
+
+        futures = {}
+        for event in events:
+            for bitmap in event.bitmaps:
+                digest = bitmap.digest
+                if digest not in futures:
+                    image_file = Path(tmp_dir) / f'{len(futures):06d}.{image_ext}'
+                    futures[digest] = executor.submit(ocr_bitmap, bitmap, image_file)
+        log.debug('%s: %d events, %d unique bitmaps', sup_file, len(events), len(futures))
+
+        num = 0
+        with open(srt_file, 'w', encoding='utf-8') as fp:
+            for event in events:
+                text = '\n'.join(filter(None, (futures[bitmap.digest].result()
+                                               for bitmap in event.bitmaps)))
+                if not text:
+                    continue
+                num += 1
+                fp.write('%d\n%s --> %s\n%s\n\n' % (
+                    num,
+                    srt_timestamp(event.start_pts),
+                    srt_timestamp(event.end_pts),
+                    text))
+    return num
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+__all__ = [
+        'ProbeCache',
+        'probe_cache',
+        ]
+
+from pathlib import Path
+import collections
+import hashlib
+import json
+import os
+import stat
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+from .app import app
+
+
+class ProbeCache(object):
+    """Persistent cache of media probing tool outputs (ffprobe, mediainfo, ...)
+
+    Entries are keyed on the probed file's identity (path, size, mtime_ns,
+    device and inode; optionally its content hash) plus the tool name and
+    arguments so that any modification of the file invalidates its entries.
+
+    A small in-memory LRU sits in front of the on-disk store which lives under
+    `app.cache_dir`/probe and is kept under `max_entries` and `max_bytes` by
+    evicting the least recently used entries.
+    """
+
+    enabled = True
+    content_hash = False
+    max_entries = 20000
+    max_bytes = 256 * 1024 * 1024
+    memory_max_entries = 1024
+    evict_interval = 100
+
+    def __init__(self, cache_dir=None, *, enabled=None, content_hash=None,
+                 max_entries=None, max_bytes=None, memory_max_entries=None):
+        self._cache_dir = None if cache_dir is None else Path(cache_dir)
+        if enabled is not None:
+            self.enabled = enabled
+        if content_hash is not None:
+            self.content_hash = content_hash
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if memory_max_entries is not None:
+            self.memory_max_entries = memory_max_entries
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_evict = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache_dir(self):
+        cache_dir = self._cache_dir
+        if cache_dir is None:
+            app_cache_dir = app.cache_dir
+            if app_cache_dir is not None:
+                cache_dir = app_cache_dir / 'probe'
+        return cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, value):
+        self._cache_dir = None if value is None else Path(value)
+
+    def make_key(self, tool, file_name, args=None, *, content_hash=None):
+        """Return the cache key for `tool` run on `file_name` with `args`.
+
+        Returns None if the file cannot be identified (no name, not a regular
+        file, ...) in which case nothing should be cached.
+        Pass content_hash=False for keys of content hashes themselves.
+        """
+        if content_hash is None:
+            content_hash = self.content_hash
+        if not self.enabled or file_name is None:
+            return None
+        try:
+            file_name = Path(os.fspath(file_name)).resolve()
+            st = file_name.stat()
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key_parts = [
+            tool,
+            os.fspath(file_name),
+            st.st_size,
+            st.st_mtime_ns,
+            st.st_dev,
+            st.st_ino,
+            sorted((str(k), repr(v)) for k, v in (args or {}).items()),
+        ]
+        if content_hash:
+            from .file import file_hasher
+            key_parts.append(file_hasher.hash_file(file_name, ('md5',))['md5'])
+        return hashlib.sha1(repr(key_parts).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            return None
+        return cache_dir / key[:2] / (key + '.json')
+
+    def _memory_put(self, key, value):
+        # Assumes self._lock is held
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            try:
+                value = self._memory[key]
+            except KeyError:
+                pass
+            else:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+        entry_path = self._entry_path(key)
+        if entry_path is not None:
+            try:
+                with open(entry_path, 'r', encoding='utf-8') as fp:
+                    entry = json.load(fp)
+                value = entry['value']
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.debug('Discarding corrupt probe cache entry %s: %s', entry_path, e)
+                self._unlink(entry_path)
+            else:
+                try:
+                    # Recently used entries are evicted last
+                    os.utime(entry_path)
+                except OSError:
+                    pass
+                with self._lock:
+                    self._memory_put(key, value)
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if key is None:
+            return
+        with self._lock:
+            self._memory_put(key, value)
+        entry_path = self._entry_path(key)
+        if entry_path is None:
+            return
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = entry_path.with_name(f'{entry_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as fp:
+                json.dump({'value': value}, fp, ensure_ascii=False)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            log.debug('Failed to write probe cache entry %s: %s', entry_path, e)
+            return
+        with self._lock:
+            if self._puts_since_evict is not None:
+                self._puts_since_evict += 1
+                if self._puts_since_evict < self.evict_interval:
+                    return
+            self._puts_since_evict = 0
+        self.evict()
+
+    def cached(self, tool, file_name, func, args=None):
+        """Return `func()`, or its previously cached value for this file."""
+        key = self.make_key(tool, file_name, args)
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.put(key, value)
+        return value
+
+    def _iter_entries(self):
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            return
+        try:
+            subdirs = list(os.scandir(cache_dir))
+        except FileNotFoundError:
+            return
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, st.st_mtime_ns, st.st_size
+
+    def evict(self):
+        """Remove least recently used entries until the size caps are honored."""
+        entries = sorted(self._iter_entries(), key=lambda e: e[1])
+        num_entries = len(entries)
+        num_bytes = sum(e[2] for e in entries)
+        for path, _, size in entries:
+            if num_entries <= self.max_entries and num_bytes <= self.max_bytes:
+                break
+            self._unlink(path)
+            num_entries -= 1
+            num_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for path, _, _ in list(self._iter_entries()):
+            self._unlink(path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+probe_cache = ProbeCache()
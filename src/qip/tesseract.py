@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+__all__ = [
+        'tesseract',
+        ]
+
+import logging
+import subprocess
+log = logging.getLogger(__name__)
+
+from .exec import Executable, do_exec_cmd
+
+# Traineddata of the tesseract (tessdata) language models, by ISO 639-2 code
+traineddata_languages = frozenset((
+    'afr', 'amh', 'ara', 'asm', 'aze', 'bel', 'ben', 'bod', 'bos', 'bre',
+    'bul', 'cat', 'ceb', 'ces', 'chr', 'cos', 'cym', 'dan', 'deu', 'div',
+    'dzo', 'ell', 'eng', 'enm', 'epo', 'est', 'eus', 'fao', 'fas', 'fil',
+    'fin', 'fra', 'frm', 'fry', 'gla', 'gle', 'glg', 'grc', 'guj', 'hat',
+    'heb', 'hin', 'hrv', 'hun', 'hye', 'iku', 'ind', 'isl', 'ita', 'jav',
+    'jpn', 'kan', 'kat', 'kaz', 'khm', 'kir', 'kor', 'lao', 'lat', 'lav',
+    'lit', 'ltz', 'mal', 'mar', 'mkd', 'mlt', 'mon', 'mri', 'msa', 'mya',
+    'nep', 'nld', 'nor', 'oci', 'ori', 'pan', 'pol', 'por', 'pus', 'que',
+    'ron', 'rus', 'san', 'sin', 'slk', 'slv', 'snd', 'spa', 'sqi', 'srp',
+    'sun', 'swa', 'swe', 'syr', 'tam', 'tat', 'tel', 'tgk', 'tha', 'tir',
+    'ton', 'tur', 'uig', 'ukr', 'urd', 'uzb', 'vie', 'yid', 'yor',
+))
+
+traineddata_language_map = {
+    'zho': 'chi_sim+chi_tra',
+    'kur': 'kmr',
+    'nob': 'nor',
+    'nno': 'nor',
+    'tgl': 'fil',
+}
+
+
+class Tesseract(Executable):
+
+    name = 'tesseract'
+
+    run_func = staticmethod(do_exec_cmd)
+
+    encoding = 'utf-8'
+
+    @staticmethod
+    def traineddata_language(language):
+        """Return the tesseract -l argument for an ISO 639-2 language.
+
+        Returns None (default model) for undetermined or unsupported languages.
+        """
+        if language is None:
+            return None
+        code3 = getattr(language, 'code3', None)
+        if code3 is None:
+            from .isolang import isolang
+            try:
+                code3 = isolang(str(language)).code3
+            except ValueError:
+                return None
+        try:
+            return traineddata_language_map[code3]
+        except KeyError:
+            pass
+        if code3 in traineddata_languages:
+            return code3
+        return None
+
+    def ocr_image(self, image_file, *, language=None, psm=None, dry_run=False):
+        """Return the text recognized in image_file."""
+        args = [image_file, 'stdout']
+        if language:
+            args += ['-l', str(language)]
+        if psm is not None:
+            args += ['--psm', str(psm)]
+        d = self.run(*args,
+                     stderr=subprocess.DEVNULL,
+                     dry_run=dry_run)
+        return d.out
+
+tesseract = Tesseract()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+from qip import json
+from qip.app import app
+from qip.bin.bincuerip import BinCueBatch
+from qip.cdda import CDDA_BYTES_PER_SECTOR
+from qip.cdmeta import MetadataLookup
+from qip.mm import AlbumTags
+from qip.wav import WAV_HEADER_LEN, WavFile
+
+try:
+    import libdiscid
+except ImportError:
+    HAVE_LIBDISCID = False
+else:
+    HAVE_LIBDISCID = True
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+cue_sheet = '''\
+FILE "{name}.bin" BINARY
+  TRACK 01 AUDIO
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    INDEX 01 00:00:04
+'''
+
+
+class TagRecordingWavFile(WavFile):
+
+    tags_written = {}
+
+    def write_tags(self, *, tags=None, **kwargs):
+        self.tags_written[self.file_name.name] = tags
+
+
+class TagRecordingBinCueBatch(BinCueBatch):
+
+    def track_out_file(self, bin_file, track_no):
+        return TagRecordingWavFile(super().track_out_file(bin_file, track_no).file_name)
+
+
+class test_bincuerip(unittest.TestCase):
+
+    def test_batch_resume(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            for name in ('disc1', 'sub/disc2'):
+                cue_file = tmp_dir / f'{name}.cue'
+                cue_file.parent.mkdir(exist_ok=True)
+                cue_file.write_text(cue_sheet.format(name=cue_file.stem))
+                cue_file.with_suffix('.bin').write_bytes(
+                    b''.join(bytes((i,)) * CDDA_BYTES_PER_SECTOR for i in range(10)))
+
+            batch = BinCueBatch(format='wav', jobs=2, use_tags=False)
+            self.assertTrue(batch.run([tmp_dir]))
+            track2 = tmp_dir / 'sub/disc2-02.wav'
+            self.assertEqual(track2.stat().st_size, WAV_HEADER_LEN + 6 * CDDA_BYTES_PER_SECTOR)
+            self.assertEqual(batch.load_state(tmp_dir / 'sub/disc2.cue'),
+                             {'stage': 'done', 'tracks_done': [1, 2]})
+
+            # Interrupted after track 1
+            batch.save_state(tmp_dir / 'sub/disc2.cue', {'stage': 'rip', 'tracks_done': [1]})
+            track2.unlink()
+            (tmp_dir / 'sub/disc2-01.wav').write_bytes(b'not ripped again')
+            self.assertTrue(batch.run([tmp_dir]))
+            self.assertEqual(track2.stat().st_size, WAV_HEADER_LEN + 6 * CDDA_BYTES_PER_SECTOR)
+            self.assertEqual((tmp_dir / 'sub/disc2-01.wav').read_bytes(), b'not ripped again')
+            self.assertEqual(batch.load_state(tmp_dir / 'sub/disc2.cue')['stage'], 'done')
+
+    def make_disc(self, tmp_dir):
+        cue_file = tmp_dir / 'disc1.cue'
+        cue_file.write_text(cue_sheet.format(name=cue_file.stem))
+        cue_file.with_suffix('.bin').write_bytes(
+            b''.join(bytes((i,)) * CDDA_BYTES_PER_SECTOR for i in range(10)))
+        return cue_file
+
+    @unittest.skipUnless(HAVE_LIBDISCID, 'libdiscid not available')
+    def test_batch_no_metadata(self):
+        for k, v in {
+                'use_musicbrainz': False,
+                'use_cddb': False,
+                'musicbrainz_discid': None,
+                'cddb_discid': None,
+        }.items():
+            if not hasattr(app.args, k):
+                setattr(app.args, k, v)
+                self.addCleanup(delattr, app.args, k)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            cue_file = self.make_disc(tmp_dir)
+            batch = TagRecordingBinCueBatch(
+                format='wav', jobs=2,
+                lookup=MetadataLookup(store_dir=tmp_dir / 'metadata', offline=True))
+            TagRecordingWavFile.tags_written.clear()
+            self.assertTrue(batch.run([tmp_dir]))
+            # Ripped with placeholder tags which are not persisted
+            self.assertEqual(TagRecordingWavFile.tags_written['disc1-02.wav'].title, 'Track 2')
+            self.assertFalse(cue_file.with_suffix('.tags').exists())
+            self.assertEqual(batch.load_state(cue_file),
+                             {'stage': 'done', 'tracks_done': [1, 2], 'no_metadata': True})
+
+            # Still nothing found; Left as is.
+            TagRecordingWavFile.tags_written.clear()
+            self.assertTrue(batch.run([tmp_dir]))
+            self.assertEqual(TagRecordingWavFile.tags_written, {})
+            self.assertTrue(batch.load_state(cue_file)['no_metadata'])
+
+    def test_batch_retag(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            cue_file = self.make_disc(tmp_dir)
+            self.assertTrue(BinCueBatch(format='wav', jobs=2, use_tags=False).run([tmp_dir]))
+            # Ripped without metadata
+            batch = TagRecordingBinCueBatch(format='wav', jobs=2)
+            batch.save_state(cue_file, {'stage': 'done', 'tracks_done': [1, 2], 'no_metadata': True})
+
+            # Metadata now available; Ripped tracks are tagged again.
+            album_tags = AlbumTags()
+            album_tags.title = 'Album'
+            album_tags.tracks_tags[1].title = 'One'
+            album_tags.tracks_tags[2].title = 'Two'
+            json.JsonFile(cue_file.with_suffix('.tags')).write_json(album_tags)
+            TagRecordingWavFile.tags_written.clear()
+            self.assertTrue(batch.run([tmp_dir]))
+            self.assertEqual(TagRecordingWavFile.tags_written['disc1-02.wav'].title, 'Two')
+            self.assertEqual(batch.load_state(cue_file),
+                             {'stage': 'done', 'tracks_done': [1, 2]})
+            # Not ripped again
+            self.assertEqual((tmp_dir / 'disc1-02.wav').stat().st_size, WAV_HEADER_LEN + 6 * CDDA_BYTES_PER_SECTOR)
+
+if __name__ == '__main__':
+    unittest.main()
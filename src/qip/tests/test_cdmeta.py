@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import json
+import sys
+import tempfile
+import time
+
+from qip.cdmeta import MetadataLookup
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_cdmeta(unittest.TestCase):
+
+    def test_offline_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lookup = MetadataLookup(store_dir=tmp_dir, offline=True)
+            # Nothing found offline
+            self.assertIsNone(lookup.get_releases_by_discid('XzPS7vW.HPHsYemQh0HBUGr8vuU-'))
+            self.assertEqual(lookup.cddb_query([0x8f0ae30c, 12])[0], 202)
+            self.assertEqual(lookup.cddb_read('misc', '8f0ae30c')[0], 401)
+
+            lookup.save('mb-discid', 'XzPS7vW.HPHsYemQh0HBUGr8vuU-', {'disc': {'release-list': []}})
+            lookup.save('cddb-query', '8f0ae30c', (200, {'category': 'misc', 'disc_id': '8f0ae30c'}))
+            self.assertEqual(lookup.get_releases_by_discid('XzPS7vW.HPHsYemQh0HBUGr8vuU-'),
+                             {'disc': {'release-list': []}})
+            self.assertEqual(lookup.cddb_query([0x8f0ae30c, 12]),
+                             (200, {'category': 'misc', 'disc_id': '8f0ae30c'}))
+            # Not found (404) answers are stored too
+            lookup.save('mb-release', 'd4faf895-c0c0-45ab-a912-42e99672425f', None)
+            self.assertEqual(lookup.load('mb-release', 'd4faf895-c0c0-45ab-a912-42e99672425f'), (True, None))
+
+    def test_ttl(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lookup = MetadataLookup(store_dir=tmp_dir, ttls={'mb-discid': 60}, negative_ttl=10)
+            lookup.save('mb-discid', 'found', {'disc': {}})
+            lookup.save('mb-discid', 'not-found', None)
+            self.assertEqual(lookup.load('mb-discid', 'found'), (True, {'disc': {}}))
+            self.assertEqual(lookup.load('mb-discid', 'not-found'), (True, None))
+            # 30 seconds later: Only the negative answer expired
+            now = time.time() + 30
+            time_time, time.time = time.time, lambda: now
+            try:
+                self.assertEqual(lookup.load('mb-discid', 'found'), (True, {'disc': {}}))
+                self.assertEqual(lookup.load('mb-discid', 'not-found'), (False, None))
+                # Offline, expired entries are still used
+                lookup.offline = True
+                self.assertEqual(lookup.load('mb-discid', 'not-found'), (True, None))
+            finally:
+                time.time = time_time
+
+    def test_import_dump(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            lookup = MetadataLookup(store_dir=tmp_dir / 'cache', offline=True)
+
+            freedb_dir = tmp_dir / 'freedb'
+            (freedb_dir / 'misc').mkdir(parents=True)
+            (freedb_dir / 'misc' / '8f0ae30c').write_text('\n'.join([
+                '# xmcd',
+                '# Disc length: 2789 seconds',
+                'DISCID=8f0ae30c',
+                'DTITLE=Christina Aguilera / Christina Aguilera',
+                'TTITLE0=Genie in a Bottle',
+            ]))
+            self.assertEqual(lookup.import_dump(freedb_dir), 1)
+            query_status, query_info = lookup.cddb_query([0x8f0ae30c, 12])
+            self.assertEqual(query_status, 200)
+            self.assertEqual(query_info['category'], 'misc')
+            read_status, read_info = lookup.cddb_read('misc', '8f0ae30c')
+            self.assertEqual(read_status, 210)
+            self.assertEqual(read_info['TTITLE0'], 'Genie in a Bottle')
+            self.assertEqual(read_info['disc_len'], 2789)
+
+            mb_dump = tmp_dir / 'releases.jsonl'
+            mb_dump.write_text(json.dumps({'release': {
+                'id': 'd4faf895-c0c0-45ab-a912-42e99672425f',
+                'title': 'Christina Aguilera',
+                'medium-list': [{'position': '1', 'disc-list': [{'id': 'XzPS7vW.HPHsYemQh0HBUGr8vuU-'}]}],
+            }}) + '\n')
+            self.assertEqual(lookup.import_dump(mb_dump), 1)
+            d = lookup.get_releases_by_discid('XzPS7vW.HPHsYemQh0HBUGr8vuU-')
+            self.assertEqual([mbrel['id'] for mbrel in d['disc']['release-list']],
+                             ['d4faf895-c0c0-45ab-a912-42e99672425f'])
+            mbrel = lookup.get_release_by_id('d4faf895-c0c0-45ab-a912-42e99672425f')
+            self.assertEqual(mbrel['release']['title'], 'Christina Aguilera')
+
+            # Round trip
+            export_file = tmp_dir / 'export.jsonl'
+            self.assertEqual(lookup.export_dump(export_file), 3)
+            lookup2 = MetadataLookup(store_dir=tmp_dir / 'cache2', offline=True)
+            self.assertEqual(lookup2.import_dump(export_file), 3)
+            self.assertEqual(lookup2.cddb_read('misc', '8f0ae30c'), (read_status, read_info))
+            self.assertIsNotNone(lookup2.get_releases_by_discid('XzPS7vW.HPHsYemQh0HBUGr8vuU-'))
+
+if __name__ == '__main__':
+    unittest.main()
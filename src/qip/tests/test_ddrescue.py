@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+
+from qip.ddrescue import DdrescueMapFile, DdrescueMapFileError, DdrescueMapWatcher, Sblock
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+test_map = '''\
+# Mapfile. Created by GNU ddrescue version 1.23
+# Command line: ddrescue -b 2048 -n /dev/sr0 disc.iso disc.map
+# Start time:   2020-01-01 00:00:00
+# current_pos  current_status  current_pass
+0x00120000     ?               2
+#      pos        size  status
+0x00000000  0x00100000  +
+0x00100000  0x00000800  -
+0x00100800  0x00000800  -
+0x00101000  0x0001F000  *
+0x00120000  0x000E0000  ?
+0x00200000  0x00100000  +
+'''
+
+
+class test_ddrescue(unittest.TestCase):
+
+    def test_map_file(self):
+        map_file = DdrescueMapFile('disc.map')
+        map_file.load(io.StringIO(test_map))
+        self.assertEqual(map_file.current_pos, 0x120000)
+        self.assertIs(map_file.current_status, Sblock.Status.non_tried)
+        self.assertEqual(map_file.current_pass, 2)
+        self.assertEqual(len(map_file), 6)
+        self.assertEqual(map_file.tot_size, 0x300000)
+        self.assertFalse(map_file.is_finished())
+        self.assertEqual(map_file.count_sblocks('-'), 2)
+
+        stats = map_file.stats()
+        self.assertEqual(stats[Sblock.Status.finished], 0x200000)
+        self.assertEqual(stats[Sblock.Status.bad_sector], 0x1000)
+        self.assertEqual(stats[Sblock.Status.non_trimmed], 0x1F000)
+        self.assertEqual(stats[Sblock.Status.non_tried], 0xE0000)
+        self.assertEqual(stats['total'], 0x300000)
+
+        self.assertIsNone(map_file.find_index(0x300000))
+        self.assertEqual(map_file.find_index(0), 0)
+        self.assertEqual(map_file.find_index(0x100800), 2)
+        sb = map_file.sblock_at(0x100fff)
+        self.assertEqual((sb.pos, sb.size, sb.status), (0x100800, 0x800, Sblock.Status.bad_sector))
+
+        self.assertEqual(list(map_file.iter_remaining_areas()), [
+            (0x100000, 0x1000, Sblock.Status.bad_sector),
+            (0x101000, 0x1F000, Sblock.Status.non_trimmed),
+            (0x120000, 0xE0000, Sblock.Status.non_tried),
+        ])
+
+        map_file.compact_sblocks()
+        self.assertEqual(len(map_file), 5)
+        self.assertEqual([(sb.pos, sb.size, sb.status.value) for sb in map_file.sblocks][:2], [
+            (0x000000, 0x100000, '+'),
+            (0x100000, 0x001000, '-'),
+        ])
+        self.assertEqual(map_file.stats(), stats)
+
+    def test_map_file_errors(self):
+        map_file = DdrescueMapFile('disc.map')
+        with self.assertRaises(DdrescueMapFileError):
+            map_file.load(io.StringIO('0 ? 1\n0 0x800 +\n0x1000 0x800 +\n'))
+        with self.assertRaises(DdrescueMapFileError):
+            map_file.load(io.StringIO('0 ? 1\n0 0x800 X\n'))
+
+        # Gaps filled with the default status
+        map_file.load(io.StringIO('0 +\n0 0x800 +\n0x1000 0x800 +\n'), default_sblock_status='?')
+        self.assertEqual(map_file.current_pass, 1)
+        self.assertEqual(list(map_file.iter_areas('?')), [(0x800, 0x800, Sblock.Status.non_tried)])
+
+    def test_map_watcher_update(self):
+        rnd = random.Random(0)
+
+        def format_map(blocks, current_pass):
+            lines = ['# Mapfile. Created by GNU ddrescue version 1.23',
+                     '# current_pos  current_status  current_pass',
+                     '0x%08X     ?               %d' % (blocks[0][0], current_pass),
+                     '#      pos        size  status']
+            lines += ['0x%08X  0x%08X  %s' % block for block in blocks]
+            return ('\n'.join(lines) + '\n').encode('ascii')
+
+        # Random rescue of 200 non-tried sectors
+        sectors = ['?'] * 200
+        watcher = DdrescueMapWatcher('disc.map', sector_size=0x800)
+        for n in range(100):
+            for i in range(rnd.randrange(1, 10)):
+                pos = rnd.randrange(len(sectors))
+                sectors[pos:pos + rnd.randrange(1, 5)] = rnd.choice('+-*/')
+                del sectors[200:]
+            blocks = []
+            for i, ch in enumerate(sectors):
+                if blocks and blocks[-1][2] == ch:
+                    blocks[-1] = (blocks[-1][0], blocks[-1][1] + 0x800, ch)
+                else:
+                    blocks.append((i * 0x800, 0x800, ch))
+            data = format_map(blocks, 1 + n // 50)
+            watcher.update(data)
+            full = DdrescueMapFile('disc.map')
+            full.load(io.StringIO(data.decode('ascii')))
+            self.assertEqual(watcher.map_file.sblock_pos, full.sblock_pos)
+            self.assertEqual(watcher.map_file.sblock_size, full.sblock_size)
+            self.assertEqual(watcher.map_file.sblock_status, full.sblock_status)
+            self.assertEqual(watcher.stats(), full.stats())
+            self.assertEqual(watcher.map_file.current_pass, full.current_pass)
+        self.assertIsNone(watcher.update(data[:-10]))  # Incomplete
+        self.assertFalse(watcher.update(data))
+        progress = watcher.publish()
+        self.assertEqual(progress.rescued, sectors.count('+') * 0x800)
+        self.assertEqual(progress.bad_sectors, sectors.count('-'))
+        self.assertEqual(progress.current_pass, 2)
+
+    def test_map_watcher_thread(self):
+        for use_inotify in (True, False):
+            with self.subTest(use_inotify=use_inotify), \
+                    tempfile.TemporaryDirectory() as tmp_dir:
+                map_file = Path(tmp_dir) / 'disc.map'
+                map_file.write_text(test_map)
+                updated = threading.Event()
+                progresses = []
+
+                def callback(progress):
+                    progresses.append(progress)
+                    updated.set()
+
+                with DdrescueMapWatcher(map_file, use_inotify=use_inotify,
+                                        poll_interval=0.05, min_interval=0,
+                                        callbacks=[callback]) as watcher:
+                    self.assertTrue(updated.wait(5))
+                    updated.clear()
+                    map_file.write_text(test_map.replace(
+                        '0x00120000  0x000E0000  ?', '0x00120000  0x000E0000  +'))
+                    self.assertTrue(updated.wait(5))
+                self.assertEqual(progresses[0].rescued, 0x200000)
+                self.assertEqual(progresses[-1].rescued, 0x2E0000)
+                self.assertEqual(progresses[-1].bad_areas, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
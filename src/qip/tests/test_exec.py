@@ -13,7 +13,7 @@ import pexpect
 import subprocess
 import sys
 
-from qip.exec import Executable, spawn as _exec_spawn
+from qip.exec import Executable, LinePattern, OutputRecorder, PipeRecordThread, spawn as _exec_spawn
 
 import logging
 #logging.basicConfig(level=logging.DEBUG)
@@ -68,6 +68,22 @@ class Echo_out_err_spawn(Echo_out_err):
 echo_out_err_spawn = Echo_out_err_spawn()
 
 
+class Echo_out_err_line_spawn(Echo_out_err_spawn):
+
+    class spawn(Echo_out_err_spawn.spawn):
+
+        line_oriented = True
+
+        def get_pattern_dict(self):
+            pattern_dict = collections.OrderedDict([
+                (LinePattern(fr'^out{re_eol}', ('out',)), self.cb_line),
+                (LinePattern(fr'^err{re_eol}', ('err',)), self.cb_line),
+                (fr'[^\n]*?{re_eol}', self.unknown_line),
+                (pexpect.EOF, False),
+            ])
+            return pattern_dict
+
+
 class test_exec(unittest.TestCase):
 
     @property
@@ -100,6 +116,42 @@ class test_exec(unittest.TestCase):
             [b'err\r\n', b'out\r\n'],
         ))
 
+    def test_spawn_line_oriented(self):
+        out = Echo_out_err_line_spawn()()
+        self.assertIn(out.out, (
+            b'out\r\nerr\r\n',
+            b'err\r\nout\r\n',
+        ))
+        self.assertIn(out.spawn.lines, (
+            [b'out\r\n', b'err\r\n'],
+            [b'err\r\n', b'out\r\n'],
+        ))
+
+    def test_spawn_line_oriented_timeout(self):
+        script = ('import sys, time\n'
+                  'sys.stdout.write("par"); sys.stdout.flush()\n'
+                  'time.sleep(0.5)\n'
+                  'sys.stdout.write("tial\\n"); sys.stdout.flush()\n')
+        p = Echo_out_err_line_spawn.spawn(sys.executable, args=['-c', script])
+        pattern_dict = collections.OrderedDict([
+            (LinePattern(fr'^partial{re_eol}', ('partial',)), p.cb_line),
+            (pexpect.TIMEOUT, 'timeout'),
+            (pexpect.EOF, False),
+        ])
+        timeouts = []
+        with p:
+            for v in p.communicate(pattern_dict, timeout=0.1):
+                if v == 'timeout':
+                    timeouts.append(p.before)
+                    continue
+                if v is False:
+                    break
+                v(p.match.group(0))
+        self.assertTrue(timeouts)
+        self.assertEqual(timeouts[0], b'par')
+        # The line split across the timeout is still matched whole.
+        self.assertEqual(p.lines, [b'partial\r\n'])
+
     def test_spawn_text(self):
         echo_out_err_spawn = Echo_out_err_spawn(encoding='utf-8')
         out = echo_out_err_spawn()
@@ -137,5 +189,58 @@ class test_exec(unittest.TestCase):
         self.assertEqual(comp.stdout, 'out\n')
         self.assertEqual(comp.stderr, 'err\n')
 
+    def test_output_recorder(self):
+        spill_fp = io.BytesIO()
+        chunks = []
+        recorder = OutputRecorder(tail_limit=5, spill_file=spill_fp, callbacks=[chunks.append])
+        for chunk in (b'abc', b'def', b'ghij'):
+            recorder.write(chunk)
+        self.assertEqual(recorder.getvalue(), b'fghij')
+        self.assertTrue(recorder.truncated)
+        self.assertEqual(recorder.total_size, 10)
+        self.assertEqual(spill_fp.getvalue(), b'abcdefghij')
+        self.assertEqual(chunks, [b'abc', b'def', b'ghij'])
+
+        recorder = OutputRecorder(text=True)
+        recorder.write('abc')
+        recorder.write('def')
+        self.assertEqual(recorder.getvalue(), 'abcdef')
+        self.assertFalse(recorder.truncated)
+
+    def test_pipe_record_thread(self):
+        lines = []
+        thread = PipeRecordThread(text=True, tail_limit=8, target=lines.append)
+        thread.start()
+        thread.file_w.write('line1\nline2\nline3\n')
+        thread.file_w.close()
+        thread.join()
+        self.assertEqual(thread.output, '2\nline3\n')
+        self.assertEqual(lines, ['line1\n', 'line2\n', 'line3\n'])
+
+        thread = PipeRecordThread(full_output=True)
+        thread.start()
+        thread.file_w.write(b'x' * 100000)
+        thread.file_w.close()
+        thread.join()
+        self.assertEqual(thread.output, b'x' * 100000)
+
+    def test_pipe_record_thread_output_while_running(self):
+        thread = PipeRecordThread(full_output=True, blocksize=7)
+        thread.start()
+        data = bytes(range(256)) * 400
+        outputs = []
+        for i in range(0, len(data), 4096):
+            thread.file_w.write(data[i:i + 4096])
+            thread.file_w.flush()
+            outputs.append(thread.output)
+        thread.file_w.close()
+        thread.join()
+        # Snapshots taken while recording are all prefixes; Nothing lost.
+        for output in outputs:
+            self.assertEqual(output, data[:len(output)])
+        self.assertEqual(thread.output, data)
+        self.assertEqual(thread.recorder.total_size, len(data))
+
+
 if __name__ == '__main__':
     unittest.main()
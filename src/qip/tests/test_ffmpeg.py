@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import pexpect
+import subprocess
+import sys
+import tempfile
+
+from qip.ffmpeg import Ffmpeg, FfmpegPopenSpawn, FfmpegSpawn, FfmpegProgress, FfmpegProgressPipe
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_ffmpeg(unittest.TestCase):
+
+    def test_aggregate_cropdetect_results(self):
+        aggregate = Ffmpeg.aggregate_cropdetect_results
+        self.assertIsNone(aggregate([]))
+        # Majority
+        self.assertEqual(
+            aggregate([(720, 360, 0, 60)] * 5 + [(704, 300, 8, 90)] * 3),
+            (720, 360, 0, 60))
+        # Union, dark scene rejected
+        self.assertEqual(
+            aggregate([
+                (720, 360, 0, 60),
+                (716, 364, 2, 58),
+                (720, 356, 0, 62),
+                (200, 100, 260, 190),  # dark
+            ]),
+            (720, 364, 0, 58))
+        # Rounding outward
+        self.assertEqual(
+            aggregate([
+                (715, 360, 2, 60),
+                (714, 362, 3, 59),
+            ], cropdetect_round=4),
+            (716, 364, 2, 59))
+        # ... within the frame
+        self.assertEqual(
+            aggregate([
+                (720, 360, 0, 60),
+                (718, 362, 3, 59),
+            ], cropdetect_round=4, frame_width=720, frame_height=480),
+            (720, 364, 0, 59))
+
+    def test_spawn_line_dispatch(self):
+        output = (
+            "[info] Input #0, h264, from 'in.h264':\n"
+            "[info]     Stream #0:0: Video: h264 (High), yuv420p(progressive), 1920x1080 [SAR 1:1 DAR 16:9], 23.98 fps\n"
+            "frame=   39 fps=0.0 q=-0.0 size=    4266kB time=00:00:01.60 bitrate=21801.0kbits/s speed=6.98x\r"
+            "frame=   78 fps=0.0 q=-0.0 Lsize=    8266kB time=00:00:03.20 bitrate=21801.0kbits/s speed=6.98x\r\n"
+            "[h264 @ 0x55f98a7caa00] [warning] Something else\n"
+            "File 'out.mkv' already exists. Overwrite ? [y/N] ")
+        with tempfile.NamedTemporaryFile('w') as fp:
+            fp.write(output)
+            fp.flush()
+            p = FfmpegPopenSpawn(['cat', fp.name], stdout=subprocess.PIPE,
+                                 encoding='utf-8', errors='replace')
+            handlers = []
+            with p:
+                with self.assertRaises(FileExistsError):
+                    for v in p.communicate(p.get_pattern_dict()):
+                        handlers.append(getattr(v, '__name__', getattr(getattr(v, 'func', None), '__name__', v)))
+                        if p.after is pexpect.EOF:
+                            break
+                        v(p.match.group(0))
+        self.assertEqual(handlers, [
+            'start_file_info_section',
+            'start_stream_info_section',
+            'progress_line',
+            'progress_line',
+            'unknown_line',
+            'prompt_file_overwrite',
+        ])
+        self.assertEqual(p.streams_info['input'][0]['streams']['0:0']['width'], 1920)
+        self.assertEqual(p.progress_match.group('frame'), '78')
+
+    def test_progress_from_dict(self):
+        progress = FfmpegProgress.from_dict({
+            'frame': '78',
+            'fps': '23.98',
+            'total_size': 'N/A',
+            'out_time_us': '3200000',
+            'speed': '6.98x',
+            'progress': 'end',
+        })
+        self.assertEqual(progress.frame, 78)
+        self.assertIsNone(progress.total_size)
+        self.assertEqual(progress.out_time.seconds, 3.2)
+        self.assertEqual(progress.speed, 6.98)
+        self.assertTrue(progress.is_end)
+
+    def test_spawn_progress_pipe(self):
+        with FfmpegProgressPipe() as progress_channel:
+            script = (
+                'import os; os.write(%d, b"'
+                'frame=39\\nfps=0.0\\nout_time_us=1600000\\nprogress=continue\\n'
+                'frame=78\\nfps=12.5\\nout_time_us=3200000\\nspeed=6.98x\\nprogress=end\\n")'
+                % (progress_channel.write_fd,))
+            p = FfmpegSpawn(sys.executable, args=['-c', script],
+                            progress_channel=progress_channel,
+                            encoding='utf-8', errors='replace')
+            self.assertIsNone(progress_channel.write_fd)
+            with p:
+                for v in p.communicate(p.get_pattern_dict()):
+                    if p.after is pexpect.EOF:
+                        break
+        self.assertEqual(p.progress.frame, 78)
+        self.assertTrue(p.progress.is_end)
+        # No stats line with -nostats; out_time comes from the progress pipe.
+        self.assertIsNone(p.progress_match)
+        self.assertEqual(p.out_time.seconds, 3.2)
+
+    def test_spawn_progress_pipe_progress_bar(self):
+
+        class FakeProgressBar(object):
+
+            def __init__(self, lock):
+                self.lock = lock
+                self.calls = []
+                self.fps = 0
+
+            def goto(self, index):
+                self.calls.append(('goto', self.lock.locked()))
+
+            def finish(self):
+                self.calls.append(('finish', self.lock.locked()))
+
+        with FfmpegProgressPipe() as progress_channel:
+            script = (
+                'import os\n'
+                'for i in range(500): os.write(%d, b"frame=%%d\\nfps=25\\nprogress=continue\\n" %% (i,))\n'
+                % (progress_channel.write_fd,))
+            p = FfmpegSpawn(sys.executable, args=['-c', script],
+                            progress_channel=progress_channel,
+                            encoding='utf-8', errors='replace')
+            p.progress_bar_max = 500
+            p.progress_bar = progress_bar = FakeProgressBar(p.progress_lock)
+            with p:
+                for v in p.communicate(p.get_pattern_dict()):
+                    if p.after is pexpect.EOF:
+                        break
+        # Updates from the reader thread and finish() in __exit__ never overlap.
+        self.assertEqual(progress_bar.calls[-1], ('finish', True))
+        self.assertTrue(all(locked for call, locked in progress_bar.calls))
+        self.assertIsNone(p.progress_bar)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import contextlib
+import io
+import os
+import random
+import subprocess
+import sys
+import time
+import types
+
+from qip.ffmpeg import Ffprobe
+from qip.mm import MediaFile
+import qip.avprobe
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class FakeFfprobe(Ffprobe):
+
+    def probe(self, file, **kwargs):
+        time.sleep(random.random() * 0.01)
+        if file.startswith('bad'):
+            raise ValueError(file)
+        return {'file': file}
+
+
+class OverrideProbeFile(MediaFile):
+
+    def extract_ffprobe_dict(self, **kwargs):
+        return {'override': str(self), 'kwargs': kwargs}
+
+
+class FakeOutputFfprobe(Ffprobe):
+
+    def __init__(self, output):
+        super().__init__()
+        self.output = output
+
+    @contextlib.contextmanager
+    def popen(self, *args, **kwargs):
+        self.args = args
+        yield types.SimpleNamespace(stdout=io.StringIO(self.output), returncode=0)
+
+
+class test_ffprobe(unittest.TestCase):
+
+    def test_parse_json_output(self):
+        out = 'Some warning\r\n{\n  "streams": [],\n  "format": {"duration": "1.0"}\n}\n'
+        self.assertEqual(Ffprobe.parse_json_output(out),
+                         {'streams': [], 'format': {'duration': '1.0'}})
+        self.assertIsNone(Ffprobe.parse_json_output('No output\n'))
+
+    def test_probe_many(self):
+        fake_ffprobe = FakeFfprobe()
+        files = [f'file{i}' for i in range(20)]
+        files[7] = 'bad7'
+        results = list(fake_ffprobe.probe_many(files, jobs=4))
+        self.assertEqual([result.file for result in results], files)
+        for result in results:
+            with self.subTest(file=result.file):
+                if result.file == 'bad7':
+                    self.assertIsNone(result.ffprobe_dict)
+                    self.assertIsInstance(result.exception, ValueError)
+                else:
+                    self.assertEqual(result.ffprobe_dict, {'file': result.file})
+                    self.assertIsNone(result.exception)
+
+    def test_probe_many_override(self):
+        fake_ffprobe = FakeFfprobe()
+        files = ['file0', OverrideProbeFile('file1'), 'file2']
+        results = list(fake_ffprobe.probe_many(files, jobs=2, show_streams=True))
+        self.assertEqual([result.ffprobe_dict for result in results], [
+            {'file': 'file0'},
+            {'override': 'file1', 'kwargs': {'show_streams': True}},
+            {'file': 'file2'},
+        ])
+
+    def test_avprobe_helpers(self):
+        from fractions import Fraction
+        self.assertEqual(qip.avprobe._ratio_str(Fraction(30000, 1001)), '30000/1001')
+        self.assertEqual(qip.avprobe._ratio_str(Fraction(16, 9), ':'), '16:9')
+        self.assertIsNone(qip.avprobe._ratio_str(None))
+        self.assertEqual(qip.avprobe._time_str(90000, Fraction(1, 90000)), '1.000000')
+        av_stream = types.SimpleNamespace(disposition=0x1 | 0x40)
+        disposition = qip.avprobe._disposition_dict(av_stream)
+        self.assertEqual(disposition['default'], 1)
+        self.assertEqual(disposition['forced'], 1)
+        self.assertEqual(disposition['dub'], 0)
+
+    def test_av_probe_fallback(self):
+        ffprobe = Ffprobe()
+        # Requests PyAV can't reproduce always fall back to ffprobe
+        self.assertIsNone(ffprobe._av_probe(Path(__file__), show_frames=True))
+        self.assertIsNone(ffprobe._av_probe(None))
+        if not qip.avprobe.HAVE_AV:
+            self.assertIsNone(ffprobe._av_probe(Path(__file__)))
+
+    def test_av_probe_no_chapters_support(self):
+        ffprobe = Ffprobe()
+        saved = qip.avprobe.HAVE_AV, qip.avprobe.HAVE_AV_CHAPTERS, qip.avprobe.probe_dict
+        probed = []
+        def probe_dict(file_name, **kwargs):
+            probed.append(kwargs)
+            return {'streams': [], 'format': {}}
+        try:
+            qip.avprobe.HAVE_AV = True
+            qip.avprobe.HAVE_AV_CHAPTERS = False
+            qip.avprobe.probe_dict = probe_dict
+            # Chapters requested: ffprobe must be used
+            self.assertIsNone(ffprobe._av_probe(Path(__file__), show_chapters=True))
+            self.assertEqual(probed, [])
+            self.assertIsNotNone(ffprobe._av_probe(Path(__file__), show_chapters=False))
+        finally:
+            qip.avprobe.HAVE_AV, qip.avprobe.HAVE_AV_CHAPTERS, qip.avprobe.probe_dict = saved
+
+    def test_iter_frames_compact(self):
+        fake_ffprobe = FakeOutputFfprobe(
+            'pkt_pts=0|pkt_duration=1001|interlaced_frame=1|top_field_first=0\n'
+            '[mpeg2video @ 0x55610c7ca940] [error] ac-tex damaged at 8 2\n'
+            'pkt_pts=N/A|pkt_duration=1001|interlaced_frame=0|top_field_first=1\n')
+        entries = ('pkt_pts', 'pkt_duration', 'interlaced_frame', 'top_field_first', 'repeat_pict')
+        frames = list(fake_ffprobe.iter_frames('in.mpg', entries=entries, select_streams=0))
+        self.assertIn('frame=' + ','.join(entries), fake_ffprobe.args)
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(frames[0].pkt_pts, 0)
+        self.assertEqual(frames[0].pkt_duration, 1001)
+        self.assertIs(frames[0].interlaced_frame, True)
+        self.assertIs(frames[0].top_field_first, False)
+        self.assertIsNone(frames[0].repeat_pict)
+        self.assertIsNone(frames[1].pkt_pts)
+        self.assertFalse(hasattr(frames[1], '__dict__'))
+
+    def test_iter_frames_compact_error(self):
+        fake_ffprobe = FakeOutputFfprobe(
+            '[h264 @ 0x555cde19ca00] [error] Invalid NAL unit size\n')
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(fake_ffprobe.iter_frames('in.mkv', entries=('pkt_pts',)))
+
+if __name__ == '__main__':
+    unittest.main()
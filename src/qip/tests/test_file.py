@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import hashlib
+import io
+import os
+import sys
+import tempfile
+
+from qip.file import File, FileHasher, hashfile
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_file(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_hashfile(self):
+        data = os.urandom(100000)
+        md5, sha1 = hashfile(io.BytesIO(data), [hashlib.md5(), hashlib.sha1()], blocksize=4096)
+        self.assertEqual(md5.hexdigest(), hashlib.md5(data).hexdigest())
+        self.assertEqual(sha1.hexdigest(), hashlib.sha1(data).hexdigest())
+        self.assertEqual(hashfile(io.BytesIO(data), hashlib.md5()).hexdigest(),
+                         hashlib.md5(data).hexdigest())
+
+    def test_file_hasher(self):
+        file_name = self.tmp_dir / 'data.bin'
+        data = os.urandom(10000)
+        file_name.write_bytes(data)
+        hasher = FileHasher(blocksize=1000)
+        self.assertEqual(hasher.hash_file(file_name, ('md5', 'sha1')),
+                         {'md5': hashlib.md5(data).hexdigest(),
+                          'sha1': hashlib.sha1(data).hexdigest()})
+        # Memoized
+        hasher.blocksize = None
+        self.assertEqual(hasher.hash_file(file_name, ('sha1',)),
+                         {'sha1': hashlib.sha1(data).hexdigest()})
+        # Modified
+        hasher.blocksize = 1000
+        data = os.urandom(10001)
+        file_name.write_bytes(data)
+        self.assertEqual(hasher.hash_file(file_name, ('md5',)),
+                         {'md5': hashlib.md5(data).hexdigest()})
+
+        self.assertEqual(File(file_name).md5.hexdigest(), hashlib.md5(data).hexdigest())
+
+    def test_file_hasher_disk_cache(self):
+        # Content-hashed probe cache keys must not recurse into the hasher
+        from qip.probecache import probe_cache
+        file_name = self.tmp_dir / 'data.bin'
+        data = os.urandom(1000)
+        file_name.write_bytes(data)
+        saved = probe_cache.enabled, probe_cache.content_hash, probe_cache._cache_dir
+        try:
+            probe_cache.enabled = True
+            probe_cache.content_hash = True
+            probe_cache.cache_dir = self.tmp_dir / 'cache'
+            self.assertIsNotNone(probe_cache.make_key('ffprobe', file_name))
+            self.assertEqual(FileHasher(disk_cache=True).hash_file(file_name, ('sha1',)),
+                             {'sha1': hashlib.sha1(data).hexdigest()})
+            # From the disk cache
+            self.assertEqual(FileHasher(disk_cache=True).hash_file(file_name, ('sha1',), blocksize=None),
+                             {'sha1': hashlib.sha1(data).hexdigest()})
+        finally:
+            probe_cache.enabled, probe_cache.content_hash, probe_cache._cache_dir = saved
+
+    def test_hash_files(self):
+        file_names = []
+        for i in range(5):
+            file_name = self.tmp_dir / f'data{i}.bin'
+            file_name.write_bytes(bytes([i]) * 1000)
+            file_names.append(file_name)
+        file_names.insert(2, self.tmp_dir / 'missing.bin')
+        hasher = FileHasher(max_entries=3)
+        results = list(hasher.hash_files(file_names, jobs=3))
+        # Bounded memo
+        self.assertEqual(len(hasher._memory), 3)
+        self.assertEqual([file_name for file_name, digests, exception in results], file_names)
+        for file_name, digests, exception in results:
+            with self.subTest(file_name=file_name):
+                if file_name.name == 'missing.bin':
+                    self.assertIsInstance(exception, FileNotFoundError)
+                else:
+                    self.assertEqual(digests['md5'], hashlib.md5(file_name.read_bytes()).hexdigest())
+
+if __name__ == '__main__':
+    unittest.main()
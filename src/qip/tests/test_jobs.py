@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import asyncio
+import os
+import sys
+import threading
+import time
+import types
+
+from qip.exec import Executable
+import qip.exec
+from qip.jobs import JobScheduler
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class FakeExecutable(Executable):
+
+    name = None
+
+    def __init__(self, name):
+        self.name = name
+        self.running = 0
+        self.max_running = 0
+        self.order = []
+        self.lock = threading.Lock()
+        super().__init__()
+
+    def run(self, *args, delay=0.02):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.order.append(args)
+        time.sleep(delay)
+        with self.lock:
+            self.running -= 1
+        return types.SimpleNamespace(out=args)
+
+
+class ShExecutable(FakeExecutable):
+
+    def run(self, script):
+        return qip.exec.run(['sh', '-c', script], check=True)
+
+
+class test_jobs(unittest.TestCase):
+
+    def test_limits(self):
+        fake_ffmpeg = FakeExecutable('ffmpeg')
+        fake_ffprobe = FakeExecutable('ffprobe')
+
+        async def main(scheduler):
+            return await asyncio.gather(
+                *[scheduler.run(fake_ffmpeg, i) for i in range(6)],
+                *[scheduler.run(fake_ffprobe, i) for i in range(6)])
+
+        with JobScheduler({'ffmpeg': 2, 'ffprobe': 4}) as scheduler:
+            results = asyncio.run(main(scheduler))
+        self.assertEqual([result.out for result in results[:6]], [(i,) for i in range(6)])
+        self.assertEqual(fake_ffmpeg.max_running, 2)
+        self.assertLessEqual(fake_ffprobe.max_running, 4)
+        usage = scheduler.resource_usage()
+        self.assertEqual(usage.jobs, 12)
+        self.assertEqual(usage.by_key['ffmpeg'].jobs, 6)
+
+    def test_priority_and_cancel(self):
+        fake_makemkvcon = FakeExecutable('makemkvcon')
+
+        async def main(scheduler):
+            first = scheduler.submit(fake_makemkvcon, 'first', resource_id='/dev/sr0')
+            await asyncio.sleep(0)
+            low = scheduler.submit(fake_makemkvcon, 'low', priority=0, resource_id='/dev/sr0')
+            cancelled = scheduler.submit(fake_makemkvcon, 'cancelled', priority=5, resource_id='/dev/sr0')
+            high = scheduler.submit(fake_makemkvcon, 'high', priority=10, resource_id='/dev/sr0')
+            other_drive = scheduler.submit(fake_makemkvcon, 'other', resource_id='/dev/sr1')
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await scheduler.wait()
+            return cancelled
+
+        with JobScheduler() as scheduler:
+            cancelled = asyncio.run(main(scheduler))
+        self.assertTrue(cancelled.cancelled())
+        sr0_order = [args for args in fake_makemkvcon.order if args != ('other',)]
+        self.assertEqual(sr0_order, [('first',), ('high',), ('low',)])
+        self.assertIn(('other',), fake_makemkvcon.order)
+
+    def test_child_rusage(self):
+        fake_sh = ShExecutable('sh')
+        busy_script = 'i=0; while [ $i -lt 100000 ]; do i=$((i+1)); done'
+
+        async def main(scheduler):
+            # Overlapping jobs; Each only accounts for its own child.
+            await asyncio.gather(
+                scheduler.run(fake_sh, busy_script),
+                scheduler.run(fake_sh, 'sleep 0.2'))
+
+        with JobScheduler() as scheduler:
+            asyncio.run(main(scheduler))
+        busy_job, = [job for job in scheduler.jobs if job.args == (busy_script,)]
+        sleep_job, = [job for job in scheduler.jobs if job.args == ('sleep 0.2',)]
+        self.assertGreater(busy_job.cpu_user, sleep_job.cpu_user)
+        self.assertLess(sleep_job.cpu_user + sleep_job.cpu_system, 0.1)
+        self.assertGreater(busy_job.maxrss, 0)
+        self.assertGreater(sleep_job.maxrss, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import io
+import os
+import sys
+
+from qip.libdvdread import VobBlockReader
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class FakeDvdFile(object):
+    """Stand-in for libdvdread.dvd_file over in-memory blocks."""
+
+    block_size = 2048
+
+    def __init__(self, data, *, bad_block=None):
+        self.data = data
+        self.bad_block = bad_block
+        self.reads = []
+        self.closed = False
+
+    def FileSize(self):
+        return len(self.data) // self.block_size
+
+    def ReadBlocksInto(self, offset, buf):
+        count = min(len(buf) // self.block_size, self.FileSize() - offset)
+        if self.bad_block is not None and offset <= self.bad_block < offset + count:
+            # Short read up to the bad block
+            count = self.bad_block - offset
+        self.reads.append((offset, count))
+        pos = offset * self.block_size
+        n = count * self.block_size
+        memoryview(buf)[:n] = self.data[pos:pos + n]
+        return count
+
+    def close(self):
+        self.closed = True
+
+
+class test_libdvdread(unittest.TestCase):
+
+    data = bytes(range(256)) * 8 * 10  # 10 blocks
+
+    def test_vob_block_reader(self):
+        dvd_file = FakeDvdFile(self.data)
+        with VobBlockReader(dvd_file, batch_blocks=4) as fp:
+            self.assertEqual(fp.size, len(self.data))
+            self.assertEqual(fp.read(100), self.data[:100])
+            # Served from the 4-block buffer
+            self.assertEqual(fp.read(5000), self.data[100:5100])
+            self.assertEqual(dvd_file.reads, [(0, 4)])
+            # Block-aligned reads go straight to the caller's buffer
+            fp.seek(4 * 2048)
+            buf = bytearray(3 * 2048)
+            self.assertEqual(fp.readinto(buf), len(buf))
+            self.assertEqual(buf, self.data[4 * 2048:7 * 2048])
+            self.assertEqual(dvd_file.reads[-1], (4, 3))
+            self.assertEqual(fp.tell(), 7 * 2048)
+            fp.seek(-10, io.SEEK_END)
+            self.assertEqual(fp.read(), self.data[-10:])
+            self.assertEqual(fp.read(), b'')
+            fp.seek(1)
+            out = io.BytesIO()
+            self.assertEqual(fp.copy_to(out), len(self.data) - 1)
+            self.assertEqual(out.getvalue(), self.data[1:])
+        self.assertTrue(dvd_file.closed)
+
+    def test_vob_block_reader_bad_block(self):
+        dvd_file = FakeDvdFile(self.data, bad_block=6)
+        with VobBlockReader(dvd_file, batch_blocks=4) as fp:
+            self.assertEqual(fp.read(6 * 2048), self.data[:6 * 2048])
+            # No blocks read mid-file is an error, not EOF.
+            with self.assertRaises(OSError):
+                fp.read(1)
+            with self.assertRaises(OSError):
+                fp.read()
+
+
+if __name__ == '__main__':
+    unittest.main()
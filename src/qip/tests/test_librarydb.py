@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+from qip.librarydb import LibraryStateDB
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_librarydb(unittest.TestCase):
+
+    def test_state(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            media_file = tmp_dir / 'a.mp3'
+            media_file.write_bytes(b'ID3')
+            st = os.stat(media_file)
+            with LibraryStateDB(tmp_dir / 'library.db') as db:
+                self.assertIsNone(db.lookup(st))
+                db.record(st, path=media_file, tags='{"title": "A"}', type='normal',
+                          dst_path=tmp_dir / 'Artist/Album/01 A.mp3', options='o')
+
+            # Persistent; Moves keep the identity
+            moved_file = tmp_dir / 'b.mp3'
+            media_file.rename(moved_file)
+            with LibraryStateDB(tmp_dir / 'library.db') as db:
+                state = db.lookup(os.stat(moved_file))
+                self.assertEqual(state.path, os.fspath(media_file))
+                self.assertEqual(state.tags, '{"title": "A"}')
+                self.assertEqual(state.dst_path, os.fspath(tmp_dir / 'Artist/Album/01 A.mp3'))
+                db.seen(os.stat(moved_file), path=moved_file)
+                self.assertEqual(db.lookup(os.stat(moved_file)).path, os.fspath(moved_file))
+
+                # Modified files lose their identity and replace their old state
+                moved_file.write_bytes(b'ID3 modified')
+                st2 = os.stat(moved_file)
+                self.assertIsNone(db.lookup(st2))
+                db.record(st2, path=moved_file, type='normal')
+                self.assertEqual(len(db), 1)
+
+if __name__ == '__main__':
+    unittest.main()
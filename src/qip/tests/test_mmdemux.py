@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import sys
+import types
+
+from qip.bin.mmdemux import ffmpeg_extract_streams_args
+from qip.exec import list2cmdlist
+from qip.mm import MediaFile
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_mmdemux(unittest.TestCase):
+
+    def test_ffmpeg_extract_streams_args(self):
+        inputfile = MediaFile.new_by_file_name('title_t00.mkv')
+        streams = [
+            types.SimpleNamespace(index=0, is_still_image=False,
+                                  file=types.SimpleNamespace(ffmpeg_container_format='h264'),
+                                  path=Path('title_t00/video-0.h264')),
+            types.SimpleNamespace(index=1, is_still_image=False,
+                                  file=types.SimpleNamespace(ffmpeg_container_format='ac3'),
+                                  path=Path('title_t00/audio-1.ac3')),
+            types.SimpleNamespace(index=3, is_still_image=True,
+                                  file=types.SimpleNamespace(ffmpeg_container_format='image2'),
+                                  path=Path('title_t00/image-3.png')),
+        ]
+        # A single input demuxed once, one output per stream
+        self.assertEqual(list2cmdlist(ffmpeg_extract_streams_args(inputfile, streams)), [
+            '-i', 'title_t00.mkv',
+            '-start_at_zero',
+            '-map_metadata', '-1', '-map_chapters', '-1', '-map', '0:0',
+            '-codec', 'copy', '-f', 'h264', 'title_t00/video-0.h264',
+            '-map_metadata', '-1', '-map_chapters', '-1', '-map', '0:1',
+            '-codec', 'copy', '-f', 'ac3', 'title_t00/audio-1.ac3',
+            '-map_metadata', '-1', '-map_chapters', '-1', '-map', '0:3',
+            '-frames:v', '1', '-f', 'image2', 'title_t00/image-3.png',
+        ])
+        args = list2cmdlist(ffmpeg_extract_streams_args(inputfile, streams[:1], seek_video='00:01:00'))
+        self.assertEqual(args[:4], ['-ss', '00:01:00.00000000', '-i', 'title_t00.mkv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
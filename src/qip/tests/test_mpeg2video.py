@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import sys
+
+from qip.mpeg2video import Mpeg2PictureFlags, Mpeg2PictureFlagsParser
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+def sequence_extension(progressive_sequence):
+    return b'\x00\x00\x01\xb5' + bytes([0x14, 0x82 | (0x08 if progressive_sequence else 0), 0x00, 0x01, 0x00, 0x00])
+
+def picture(top_field_first, repeat_first_field, progressive_frame, picture_structure=3):
+    return b'\x00\x00\x01\x00' + b'\x00\x0f\xff\xf8' \
+        + b'\x00\x00\x01\xb5' + bytes([
+            0x8f, 0xff, 0xf0 | picture_structure,
+            (0x80 if top_field_first else 0) | (0x02 if repeat_first_field else 0),
+            0x80 if progressive_frame else 0,
+        ]) \
+        + b'\x00\x00\x01\x01' + b'\x12\x34'
+
+class test_mpeg2video(unittest.TestCase):
+
+    def test_interlaced(self):
+        parser = Mpeg2PictureFlagsParser()
+        self.assertEqual(
+            parser.parse(sequence_extension(False) + picture(True, False, False)),
+            Mpeg2PictureFlags(interlaced_frame=True, top_field_first=True, repeat_pict=0))
+        self.assertFalse(parser.progressive_sequence)
+        self.assertEqual(
+            parser.parse(picture(False, False, False)),
+            Mpeg2PictureFlags(interlaced_frame=True, top_field_first=False, repeat_pict=0))
+
+    def test_pulldown(self):
+        parser = Mpeg2PictureFlagsParser()
+        parser.parse(sequence_extension(False) + picture(True, True, True))
+        self.assertEqual(
+            parser.parse(picture(True, True, True)),
+            Mpeg2PictureFlags(interlaced_frame=False, top_field_first=True, repeat_pict=1))
+        self.assertEqual(
+            parser.parse(picture(False, False, True)),
+            Mpeg2PictureFlags(interlaced_frame=False, top_field_first=False, repeat_pict=0))
+
+    def test_progressive_sequence(self):
+        parser = Mpeg2PictureFlagsParser()
+        self.assertEqual(
+            parser.parse(sequence_extension(True) + picture(True, False, False)),
+            Mpeg2PictureFlags(interlaced_frame=False, top_field_first=True, repeat_pict=0))
+
+    def test_field_pictures(self):
+        top_field = lambda: picture(False, False, False, picture_structure=1)
+        bottom_field = lambda: picture(False, False, False, picture_structure=2)
+        parser = Mpeg2PictureFlagsParser()
+        parser.parse(sequence_extension(False))
+        # Both fields in the same packet
+        self.assertEqual(
+            parser.parse(top_field() + bottom_field()),
+            Mpeg2PictureFlags(interlaced_frame=True, top_field_first=True, repeat_pict=0))
+        self.assertEqual(
+            parser.parse(bottom_field() + top_field()),
+            Mpeg2PictureFlags(interlaced_frame=True, top_field_first=False, repeat_pict=0))
+        # One field per packet
+        self.assertEqual(
+            parser.parse(top_field()),
+            Mpeg2PictureFlags(interlaced_frame=True, top_field_first=True, repeat_pict=0))
+        self.assertIsNone(parser.parse(bottom_field()))
+        self.assertEqual(
+            parser.parse(bottom_field()),
+            Mpeg2PictureFlags(interlaced_frame=True, top_field_first=False, repeat_pict=0))
+        self.assertIsNone(parser.parse(top_field()))
+        # Followed by a frame picture
+        self.assertEqual(
+            parser.parse(picture(True, False, False)),
+            Mpeg2PictureFlags(interlaced_frame=True, top_field_first=True, repeat_pict=0))
+
+    def test_mpeg1(self):
+        parser = Mpeg2PictureFlagsParser()
+        self.assertEqual(
+            parser.parse(b'\x00\x00\x01\x00\x00\x0f\xff\xf8\x00\x00\x01\x01\x12'),
+            Mpeg2PictureFlags(interlaced_frame=False, top_field_first=False, repeat_pict=0))
+        self.assertIsNone(parser.parse(b'\x00\x00\x01\xb3\x12\x34'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import collections
+import os
+import sys
+import tempfile
+
+from qip.app import app
+from qip.bin.organize_media import iter_media_files
+from qip.librarydb import LibraryStateDB
+from qip.mm import MediaFile, TrackTags
+import qip.bin.organize_media
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_organize_media(unittest.TestCase):
+
+    def test_iter_media_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            for name in ('a/b/y.mp3', 'a/x.mp3', 'a/z.txt', 'a b/z.flac', 'w.mp3'):
+                (tmp_dir / name).parent.mkdir(parents=True, exist_ok=True)
+                (tmp_dir / name).touch()
+            # Loops are only visited once
+            (tmp_dir / 'a/loop').symlink_to('..')
+            media_files = list(iter_media_files(tmp_dir))
+            self.assertEqual(media_files, [
+                tmp_dir / 'a/b/y.mp3',
+                tmp_dir / 'a/x.mp3',
+                tmp_dir / 'a b/z.flac',
+                tmp_dir / 'w.mp3',
+            ])
+            # Same order as a sorted recursive glob
+            self.assertEqual(media_files, sorted(
+                path for path in tmp_dir.glob('**/*')
+                if path.suffix in ('.mp3', '.flac') and 'loop' not in path.parts))
+
+    def set_args(self, **kwargs):
+        for k, v in kwargs.items():
+            if hasattr(app.args, k):
+                self.addCleanup(setattr, app.args, k, getattr(app.args, k))
+            else:
+                self.addCleanup(delattr, app.args, k)
+            setattr(app.args, k, v)
+
+    def set_library_db(self, library_db):
+        self.addCleanup(setattr, qip.bin.organize_media, 'library_db', qip.bin.organize_media.library_db)
+        qip.bin.organize_media.library_db = library_db
+
+    def test_filter_library_files(self):
+        om = qip.bin.organize_media
+        self.set_args(library_mode=None, contenttype=None, media_library_app='plex',
+                      outputdir=None, suffix=None, ascii_compat=False,
+                      dry_run=False, file_op='move')
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                LibraryStateDB(Path(tmp_dir) / 'library.db') as library_db:
+            tmp_dir = Path(tmp_dir)
+            self.set_library_db(library_db)
+            options = om.organize_options_key()
+            for name in ('new.mp3', 'organized.mp3', 'moved.mp3', 'untagged.mp3'):
+                (tmp_dir / name).write_bytes(name.encode())
+            # Already at its destination
+            library_db.record(os.stat(tmp_dir / 'organized.mp3'),
+                              path=tmp_dir / 'organized.mp3',
+                              tags=om.encode_library_tags(TrackTags(title='Organized')),
+                              dst_path=tmp_dir / 'organized.mp3', options=options)
+            # Moved since; Its destination is gone
+            library_db.record(os.stat(tmp_dir / 'moved.mp3'),
+                              path=tmp_dir / 'old/moved.mp3',
+                              tags=om.encode_library_tags(TrackTags(title='Moved', artist='Artist')),
+                              dst_path=tmp_dir / 'Artist/Moved.mp3', options=options)
+            # Known, but tags were never recorded
+            library_db.record(os.stat(tmp_dir / 'untagged.mp3'),
+                              path=tmp_dir / 'untagged.mp3')
+
+            stats = collections.Counter()
+            inputfiles = list(om.filter_library_files(
+                sorted(tmp_dir.glob('*.mp3')), stats=stats))
+            self.assertEqual(stats, {'unchanged': 1})
+            moved, new, untagged = inputfiles
+            self.assertEqual(new, tmp_dir / 'new.mp3')
+            self.assertEqual(untagged, tmp_dir / 'untagged.mp3')
+            # Restored from its recorded tags; Not probed.
+            self.assertIsInstance(moved, MediaFile)
+            self.assertEqual(moved.file_name, tmp_dir / 'moved.mp3')
+            self.assertEqual(moved.tags.title, 'Moved')
+            self.assertEqual(moved.tags.artist, 'Artist')
+            self.assertEqual(moved.library_state.path, os.fspath(tmp_dir / 'old/moved.mp3'))
+
+            # Organized tags are recorded
+            def organize_media_file(inputfile, *, stats=None):
+                inputfile.tags.albumartist = inputfile.tags.artist
+                dst_file_name = tmp_dir / 'Artist/Moved.mp3'
+                dst_file_name.parent.mkdir()
+                os.rename(inputfile.file_name, dst_file_name)
+                return dst_file_name
+            self.addCleanup(setattr, om, 'organize_media_file', om.organize_media_file)
+            om.organize_media_file = organize_media_file
+            self.assertEqual(om.organize_library_file(moved), tmp_dir / 'Artist/Moved.mp3')
+            state = library_db.lookup(os.stat(tmp_dir / 'Artist/Moved.mp3'))
+            self.assertEqual(TrackTags.json_loads(state.tags).albumartist, 'Artist')
+            self.assertEqual(state.dst_path, os.fspath(tmp_dir / 'Artist/Moved.mp3'))
+
+            # Now skipped
+            stats = collections.Counter()
+            self.assertEqual(list(om.filter_library_files([tmp_dir / 'Artist/Moved.mp3'], stats=stats)), [])
+            self.assertEqual(stats, {'unchanged': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
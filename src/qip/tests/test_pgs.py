@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import struct
+import sys
+import tempfile
+
+from qip.pgs import rle_decode, rle_decode_into, ods_is_blank, pgs_segment_to_YCbCr_palette
+from qip.pgs import PgsSegmentReader, PgsFile, pgs_iter_segments
+from qip.pgsocr import iter_pgs_subtitle_events, pgs_ocr_to_srt
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+def rle_encode_line(pixels):
+    out = bytearray()
+    i = 0
+    while i < len(pixels):
+        entry = pixels[i]
+        n = 1
+        while i + n < len(pixels) and pixels[i + n] == entry and n < 0x3fff:
+            n += 1
+        if entry and n < 3:
+            out += bytes([entry]) * n
+        elif entry == 0:
+            out += bytes([0, n]) if n < 64 else bytes([0, 0x40 | (n >> 8), n & 0xff])
+        else:
+            out += bytes([0, 0x80 | n, entry]) if n < 64 else bytes([0, 0xc0 | (n >> 8), n & 0xff, entry])
+        i += n
+    return bytes(out + b'\x00\x00')
+
+def pgs_segment(pts, segment_type, data):
+    return struct.pack('!2sIIBH', b'PG', pts, pts, segment_type, len(data)) + data
+
+def pgs_display_set(pts, rle_data, width, height):
+    return b''.join([
+        pgs_segment(pts, 0x16, struct.pack('!HHBHBBBB', 1920, 1080, 0x10, 1, 0x80, 0, 0, 1) + b'\x00\x00\x00\x00\x00\x10\x00\x20'),
+        pgs_segment(pts, 0x17, struct.pack('!BBHHHH', 1, 0, 16, 32, width, height)),
+        pgs_segment(pts, 0x14, struct.pack('!BB', 0, 0) + struct.pack('!BBBBB', 1, 16, 128, 128, 255) + struct.pack('!BBBBB', 5, 235, 128, 128, 255)),
+        pgs_segment(pts, 0x15, struct.pack('!HBBBBBHH', 0, 0, 0xc0, 0, 0, len(rle_data) + 4, width, height) + rle_data),
+        pgs_segment(pts, 0x80, b''),
+    ])
+
+def pgs_clear_display_set(pts):
+    return b''.join([
+        pgs_segment(pts, 0x16, struct.pack('!HHBHBBBB', 1920, 1080, 0x10, 2, 0x00, 0, 0, 0)),
+        pgs_segment(pts, 0x80, b''),
+    ])
+
+class FakeOcrBackend(object):
+
+    image_format = 'pgm'
+
+    def __init__(self):
+        self.images = []
+
+    def ocr(self, image_file, *, language=None):
+        self.images.append(Path(image_file).read_bytes())
+        return f'Line {len(self.images)}\n\f'
+
+class test_pgs(unittest.TestCase):
+
+    width, height = 300, 4
+    lines = [
+        [0] * 300,
+        [0] * 10 + [5] * 200 + [7, 8] + [0] * 88,
+        [3] * 300,
+        [0] * 150 + [1] + [0] * 149,
+    ]
+
+    def test_rle_decode_into(self):
+        rle_data = b''.join(rle_encode_line(line) for line in self.lines)
+        expected = bytes(e for line in self.lines for e in line)
+        self.assertEqual(bytes(rle_decode_into(rle_data, self.width, self.height)), expected)
+        self.assertEqual(bytes(rle_decode(rle_data, self.width, self.height)), expected)
+        out = bytearray(b'\xff' * (self.width * self.height))
+        self.assertIs(rle_decode_into(rle_data, self.width, self.height, out=out), out)
+        self.assertEqual(bytes(out), expected)
+
+    def test_ods_is_blank(self):
+        palette = pgs_segment_to_YCbCr_palette(pgs_segment=None)
+        blank = b''.join(rle_encode_line([0] * 300) for i in range(4))
+        self.assertTrue(ods_is_blank(blank, palette, height=4))
+        self.assertTrue(ods_is_blank(b''))
+        rle_data = b''.join(rle_encode_line(line) for line in self.lines)
+        self.assertFalse(ods_is_blank(rle_data, height=4))
+        # All entries map to the same default color
+        self.assertTrue(ods_is_blank(rle_data, palette, height=4))
+
+    def test_segment_reader(self):
+        rle_data = b''.join(rle_encode_line(line) for line in self.lines)
+        sup_data = b''.join(pgs_display_set(pts, rle_data, self.width, self.height)
+                            for pts in (90000, 180000, 270000))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sup_file = Path(tmp_dir) / 'test.sup'
+            sup_file.write_bytes(sup_data)
+            with open(sup_file, 'rb') as fp:
+                expected_segments = list(pgs_iter_segments(fp))
+            with PgsSegmentReader(sup_file) as reader:
+                segments = list(reader)
+                self.assertEqual(len(segments), len(expected_segments))
+                for segment, expected_segment in zip(segments, expected_segments):
+                    with self.subTest(offset=segment.offset):
+                        self.assertIs(segment.segment_type, expected_segment.segment_type)
+                        for attr in vars(expected_segment):
+                            value = getattr(segment, attr)
+                            if isinstance(value, memoryview):
+                                value = bytes(value)
+                            elif attr in ('palette_entries', 'window_entries'):
+                                value = [vars(e) for e in getattr(expected_segment, attr)]
+                                self.assertEqual([e._asdict() for e in getattr(segment, attr)], value)
+                                continue
+                            self.assertEqual(value, getattr(expected_segment, attr))
+                self.assertEqual(
+                    pgs_segment_to_YCbCr_palette(segments[2]),
+                    pgs_segment_to_YCbCr_palette(expected_segments[2]))
+                ptss, offsets = reader.pts_index
+                self.assertEqual(list(ptss), [90000, 180000, 270000])
+                self.assertEqual(reader.find_display_set_offset(200000), offsets[1])
+                self.assertIsNone(reader.find_display_set_offset(100))
+                self.assertEqual(next(reader.iter_segments_from_pts(270000)).pts, 270000)
+                del segments, segment
+            self.assertEqual(
+                sum(not ods_is_blank(segment.object_data)
+                    for segment in PgsFile(sup_file).iter_pgs_segments()
+                    if segment.segment_type is PgsFile.SegmentType.ODS),
+                3)
+
+    def test_segment_reader_invalid(self):
+        rle_data = b''.join(rle_encode_line(line) for line in self.lines)
+        pcs = pgs_segment(90000, 0x16, struct.pack('!HHBHBBBB', 1920, 1080, 0x10, 1, 0x80, 0, 0, 1) + b'\x00\x00\x00\x00\x00\x10\x00\x20')
+        wds = pgs_segment(90000, 0x17, struct.pack('!BBHHHH', 1, 0, 16, 32, self.width, self.height))
+        ods = pgs_segment(90000, 0x15, struct.pack('!HBBBBBHH', 0, 0, 0xc0, 0, 0, len(rle_data) + 4, self.width, self.height) + rle_data)
+        end = pgs_segment(90000, 0x80, b'')
+        bad_ods = pgs_segment(90000, 0x15, struct.pack('!HBBBBBHH', 0, 0, 0xc0, 0, 0, len(rle_data) + 5, self.width, self.height) + rle_data)
+        bad_wds = pgs_segment(90000, 0x17, struct.pack('!BBHHHH', 2, 0, 16, 32, self.width, self.height))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sup_file = Path(tmp_dir) / 'test.sup'
+            sup_file.write_bytes(pcs + wds + ods + end)
+            with PgsSegmentReader(sup_file) as reader:
+                self.assertEqual(len(list(reader)), 4)
+            for bad, segments in (('ODS', (pcs, wds, bad_ods, end)),
+                                  ('WDS', (pcs, bad_wds, ods, end))):
+                with self.subTest(bad=bad):
+                    sup_file.write_bytes(b''.join(segments))
+                    with PgsSegmentReader(sup_file) as reader:
+                        with self.assertRaises(ValueError):
+                            list(reader)
+
+    def test_ocr_to_srt(self):
+        rle_data = b''.join(rle_encode_line(line) for line in self.lines)
+        sup_data = b''.join([
+            pgs_display_set(90000, rle_data, self.width, self.height),
+            pgs_display_set(180000, rle_data, self.width, self.height),
+            pgs_clear_display_set(270000),
+        ])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sup_file = Path(tmp_dir) / 'test.sup'
+            sup_file.write_bytes(sup_data)
+            events = list(iter_pgs_subtitle_events(sup_file, margin=0))
+            self.assertEqual([(event.start_pts, event.end_pts) for event in events],
+                             [(90000, 180000), (180000, 270000)])
+            bitmap = events[0].bitmaps[0]
+            # Cropped to the visible content of lines 1 to 3
+            self.assertEqual((bitmap.width, bitmap.height), (200, 3))
+            self.assertEqual((bitmap.horizontal_pos, bitmap.vertical_pos), (16 + 10, 32 + 1))
+            self.assertEqual(bitmap.data[:200], bytes([255 - 235]) * 200)
+            srt_file = Path(tmp_dir) / 'test.srt'
+            backend = FakeOcrBackend()
+            self.assertEqual(pgs_ocr_to_srt(sup_file, srt_file, backend=backend, jobs=2), 2)
+            # Identical bitmaps are recognized once
+            self.assertEqual(len(backend.images), 1)
+            self.assertTrue(backend.images[0].startswith(b'P5\n220 23\n255\n'))
+            self.assertEqual(srt_file.read_text(),
+                             '1\n00:00:01,000 --> 00:00:02,000\nLine 1\n\n'
+                             '2\n00:00:02,000 --> 00:00:03,000\nLine 1\n\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+from qip.probecache import ProbeCache
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_probecache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_hit_and_invalidate(self):
+        media_file = self.tmp_dir / 'media.bin'
+        media_file.write_bytes(b'abc')
+        cache = ProbeCache(self.tmp_dir / 'cache')
+
+        calls = []
+        def probe():
+            calls.append(1)
+            return f'probe#{len(calls)}'
+
+        self.assertEqual(cache.cached('ffprobe', media_file, probe), 'probe#1')
+        self.assertEqual(cache.cached('ffprobe', media_file, probe), 'probe#1')
+        self.assertEqual(len(calls), 1)
+
+        # Different tool arguments are different entries
+        self.assertEqual(cache.cached('ffprobe', media_file, probe, args={'show_frames': True}), 'probe#2')
+
+        # Persistent across instances
+        cache2 = ProbeCache(self.tmp_dir / 'cache')
+        self.assertEqual(cache2.cached('ffprobe', media_file, probe), 'probe#1')
+        self.assertEqual(len(calls), 2)
+
+        # Modifying the file invalidates the entry
+        media_file.write_bytes(b'abcd')
+        self.assertEqual(cache2.cached('ffprobe', media_file, probe), 'probe#3')
+
+    def test_no_file(self):
+        cache = ProbeCache(self.tmp_dir / 'cache')
+        self.assertIsNone(cache.make_key('ffprobe', None))
+        self.assertIsNone(cache.make_key('ffprobe', self.tmp_dir / 'missing'))
+        self.assertIsNone(cache.make_key('ffprobe', self.tmp_dir))
+
+    def test_evict(self):
+        cache = ProbeCache(self.tmp_dir / 'cache', max_entries=3)
+        cache.evict_interval = 1
+        for i in range(6):
+            media_file = self.tmp_dir / f'media{i}.bin'
+            media_file.write_bytes(b'x' * i)
+            cache.put(cache.make_key('ffprobe', media_file), str(i))
+            os.utime(cache._entry_path(cache.make_key('ffprobe', media_file)),
+                     ns=(i * 1000000000, i * 1000000000))
+        cache.evict()
+        self.assertEqual(len(list(cache._iter_entries())), 3)
+        cache2 = ProbeCache(self.tmp_dir / 'cache')
+        self.assertIsNone(cache2.get(cache2.make_key('ffprobe', self.tmp_dir / 'media0.bin')))
+        self.assertEqual(cache2.get(cache2.make_key('ffprobe', self.tmp_dir / 'media5.bin')), '5')
+
+if __name__ == '__main__':
+    unittest.main()
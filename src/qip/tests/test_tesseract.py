@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import os
+import sys
+
+from qip.isolang import isolang
+from qip.tesseract import tesseract
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+class test_tesseract(unittest.TestCase):
+
+    def test_traineddata_language(self):
+        traineddata_language = tesseract.traineddata_language
+        self.assertEqual(traineddata_language(isolang('eng')), 'eng')
+        self.assertEqual(traineddata_language(isolang('fre')), 'fra')
+        self.assertEqual(traineddata_language('ger'), 'deu')
+        self.assertEqual(traineddata_language('fr'), 'fra')
+        self.assertEqual(traineddata_language(isolang('chi')), 'chi_sim+chi_tra')
+        self.assertEqual(traineddata_language('zho'), 'chi_sim+chi_tra')
+        self.assertIsNone(traineddata_language(isolang('und')))
+        self.assertIsNone(traineddata_language('zxx'))
+        self.assertIsNone(traineddata_language('xyz'))
+        self.assertIsNone(traineddata_language(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
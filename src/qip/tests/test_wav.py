@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+
+import unittest
+
+from pathlib import Path
+import io
+import os
+import sys
+import tempfile
+import types
+
+from qip.cdda import MSF, CDDA_BYTES_PER_SECTOR
+from qip.file import BinaryFile
+from qip.wav import WavFile, WAV_HEADER_LEN, copy_byte_range, rip_cue_tracks
+
+import logging
+#logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+import reprlib
+reprlib.aRepr.maxdict = 100
+
+test_dir = Path(__file__).parent.absolute()
+
+
+def cue_track(begin, length):
+    return types.SimpleNamespace(
+        begin=MSF(begin),
+        length=MSF(length),
+        file=None,
+    )
+
+
+class test_wav(unittest.TestCase):
+
+    def test_copy_byte_range(self):
+        data = bytes(range(256)) * 64
+        with tempfile.TemporaryFile() as src_fp, tempfile.TemporaryFile() as dst_fp:
+            src_fp.write(data)
+            src_fp.flush()
+            dst_fp.write(b'hdr')
+            self.assertEqual(copy_byte_range(src_fp, dst_fp, 100, 1000), 1000)
+            dst_fp.write(b'end')
+            # Short copy at EOF
+            self.assertEqual(copy_byte_range(src_fp, dst_fp, len(data) - 10, 100), 10)
+            dst_fp.seek(0)
+            self.assertEqual(dst_fp.read(), b'hdr' + data[100:1100] + b'end' + data[-10:])
+        dst_fp = io.BytesIO()
+        self.assertEqual(copy_byte_range(io.BytesIO(data), dst_fp, 5, 10, chunk_size=3), 10)
+        self.assertEqual(dst_fp.getvalue(), data[5:15])
+
+    def test_rip_cue_tracks(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            bin_data = b''.join(bytes((i,)) * CDDA_BYTES_PER_SECTOR for i in range(10))
+            bin_file = BinaryFile(tmp_dir / 'disc.bin')
+            (tmp_dir / 'disc.bin').write_bytes(bin_data)
+            tracks = [
+                (WavFile(tmp_dir / 'disc-01.wav'), cue_track(0, 4), None),
+                (WavFile(tmp_dir / 'disc-02.wav'), cue_track(4, 6), None),
+            ]
+            rip_cue_tracks(tracks, bin_file=bin_file, yes=True)
+            for out_file, track, _ in tracks:
+                wav_data = out_file.file_name.read_bytes()
+                self.assertEqual(len(wav_data), WAV_HEADER_LEN + track.length.bytes)
+                self.assertEqual(wav_data[:4], b'RIFF')
+                self.assertEqual(wav_data[WAV_HEADER_LEN:],
+                                 bin_data[track.begin.bytes:track.begin.bytes + track.length.bytes])
+
+if __name__ == '__main__':
+    unittest.main()
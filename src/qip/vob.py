@@ -11,7 +11,6 @@ __all__ = (
 
 from pathlib import Path
 import errno
-import io
 import logging
 import os
 log = logging.getLogger(__name__)
@@ -47,7 +46,7 @@ class VobFile(MultiFile, Mpeg2MovieFile):
         if file_name is None and dvd_reader is not None and vts is not None:
             file_name = '{dvd_reader.device}:/VIDEO_TS/{pat}'.format(
                 dvd_reader=dvd_reader,
-                pat=self.get_vob_file_name_pattern(title=vtx, menu=menu))
+                pat=self.get_vob_file_name_pattern(title=vts, menu=menu))
         elif file_name is not None and dvd_reader is None and vts is None:
             pass
         else:
@@ -79,37 +78,35 @@ class VobFile(MultiFile, Mpeg2MovieFile):
         assert encoding is None
         return True
 
+    def open_stream(self, *, batch_blocks=None):
+        """Open the VOB through libdvdread as a raw libdvdread.VobBlockReader stream.
+
+        The title VOBs (VTS_xx_1.VOB, VTS_xx_2.VOB, ...) are read as a single
+        stream straight from the disc or ISO image.
+        """
+        if not self.dvd_reader:
+            raise ValueError(f'{self}: Stream mode requires a dvd_reader')
+        dvd_file = self.dvd_reader.OpenFile(
+            self.vts or 0,
+            libdvdread.DVD_READ_MENU_VOBS if self.is_menu else libdvdread.DVD_READ_TITLE_VOBS)
+        return libdvdread.VobBlockReader(dvd_file, batch_blocks=batch_blocks)
+
     def open_index(self, file_index):
         if not self.dvd_reader:
             return super().open_index(file_index=file_index)
         if self.fp and self.file_index == file_index:
             return
-        if self.is_menu:
-            assert file_index == 0
-            title = 0
-        else:
-            title = self.file_index + 1
-        libdvdread.DVDOpenFile(
-            self.dvd_reader,
-            title,
-            libdvdread.DVD_READ_MENU_VOBS if self.is_menu else libdvdread.DVD_READ_TITLE_VOBS,
-        )
-        try:
-            file_name = self.file_names[file_index]
-        except IndexError:
+        if file_index != 0:
+            # libdvdread reads all the title VOBs as a single file
             raise FileNotFoundError(errno.ENOENT,
                                     os.strerror(errno.ENOENT),
                                     f'File w/ index {file_index}')
-        new_file = BinaryFile(file_name)
-        new_file.open_mode = self.open_mode
-        new_file.open_encoding = self.open_encoding
-        new_file.fp = new_file.open()
+        new_fp = self.open_stream()
         try:
             if self.fp:
                 self.close()
         finally:
-            self.file_index, self.fp = file_index, new_file.fp
-            new_file.fp = None
+            self.file_index, self.fp = file_index, new_fp
 
     def get_multifile_file_name(self, n):
         self.assert_file_name_defined()
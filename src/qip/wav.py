@@ -3,12 +3,17 @@
 
 __all__ = (
     'WavFile',
+    'rip_cue_tracks',
 )
 
+import concurrent.futures
+import contextlib
+import os
 import struct
 import logging
 log = logging.getLogger(__name__)
 
+from .file import BinaryFile
 from .mm import AudioType
 from .mm import SoundFile
 from .propex import propex
@@ -36,7 +41,29 @@ class WavFile(SoundFile):
             AudioType.pcm_s16le,
         )))
 
-    def rip_cue_track(self, cue_track, bin_file=None, tags=None, fp=None, yes=False):
+    def write_cue_track_header(self, fp, cue_track):
+        fp.write(
+            struct.pack('<4sL4s4sLHHLLHH4sL',
+                        # RIFF header
+                        b'RIFF',
+                        # length of file, starting from WAVE
+                        cue_track.length.bytes + WAV_DATA_HLEN + WAV_FORMAT_HLEN + 4,
+                        b'WAVE',
+                        # FORMAT header
+                        b'fmt ',
+                        0x10,  # length of FORMAT header
+                        0x01,  # constant
+                        cdda.CDDA_CHANNELS,          # channels
+                        cdda.CDDA_SAMPLE_RATE,       # sample rate
+                        cdda.CDDA_BYTES_PER_SECOND,  # bytes per second
+                        cdda.CDDA_BYTES_PER_SAMPLE,  # bytes per sample
+                        cdda.CDDA_SAMPLE_BITS,       # bits per channel
+                        # DATA header
+                        b'data',
+                        cue_track.length.bytes,
+                        ))
+
+    def rip_cue_track(self, cue_track, bin_file=None, tags=None, fp=None, yes=False, bin_fp=None):
         if bin_file is None:
             bin_file = BinaryFile(cue_track.file.name)
         if fp is None:
@@ -44,34 +71,19 @@ class WavFile(SoundFile):
             # assert fp.tell() == 0
 
         if fp is None:
-            with self.open('w' if app.args.yes else 'x') as fp:
-                self.rip_cue_track(cue_track=cue_track, bin_file=bin_file, tags=None, fp=fp)
+            with self.open('w' if yes else 'x') as fp:
+                self.rip_cue_track(cue_track=cue_track, bin_file=bin_file, tags=None, fp=fp, bin_fp=bin_fp)
         else:
             assert tags is None, 'Cannot write tags if fp is not closed!'
-            fp.write(
-                struct.pack('<4sL4s4sLHHLLHH4sL',
-                            # RIFF header
-                            b'RIFF',
-                            # length of file, starting from WAVE
-                            cue_track.length.bytes + WAV_DATA_HLEN + WAV_FORMAT_HLEN + 4,
-                            b'WAVE',
-                            # FORMAT header
-                            b'fmt ',
-                            0x10,  # length of FORMAT header
-                            0x01,  # constant
-                            cdda.CDDA_CHANNELS,          # channels
-                            cdda.CDDA_SAMPLE_RATE,       # sample rate
-                            cdda.CDDA_BYTES_PER_SECOND,  # bytes per second
-                            cdda.CDDA_BYTES_PER_SAMPLE,  # bytes per sample
-                            cdda.CDDA_SAMPLE_BITS,       # bits per channel
-                            # DATA header
-                            b'data',
-                            cue_track.length.bytes,
-                            ))
-            with bin_file.open('r') as binfp:
-                binfp.seek(cue_track.begin.bytes)
-                for _ in range(cue_track.length.frames):
-                    fp.write(binfp.read(cdda.CDDA_BYTES_PER_SECTOR))
+            self.write_cue_track_header(fp, cue_track)
+            if bin_fp is None:
+                with bin_file.open('r') as bin_fp:
+                    copied = copy_byte_range(bin_fp, fp, cue_track.begin.bytes, cue_track.length.bytes)
+            else:
+                copied = copy_byte_range(bin_fp, fp, cue_track.begin.bytes, cue_track.length.bytes)
+            if copied != cue_track.length.bytes:
+                log.warning('%s: Short read at offset %d (%d of %d bytes)',
+                            bin_file, cue_track.begin.bytes, copied, cue_track.length.bytes)
 
         if tags is not None:
             self.write_tags(tags=tags)
@@ -81,3 +93,108 @@ class WavFile(SoundFile):
         return mm.id3v2
 
 WavFile._build_extension_to_class_map()
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def _fileno(fp):
+    try:
+        return fp.fileno()
+    except (AttributeError, OSError, ValueError):
+        # io.UnsupportedOperation is an OSError and ValueError
+        return None
+
+def _kernel_copy(src_fd, dst_fd, offset, length):
+    copy_funcs = []
+    if hasattr(os, 'copy_file_range'):
+        copy_funcs.append(lambda offset, count: os.copy_file_range(src_fd, dst_fd, count, offset))
+    if hasattr(os, 'sendfile'):
+        copy_funcs.append(lambda offset, count: os.sendfile(dst_fd, src_fd, offset, count))
+    for copy_func in copy_funcs:
+        copied = 0
+        try:
+            while copied < length:
+                n = copy_func(offset + copied, min(length - copied, 0x40000000))
+                if not n:
+                    break  # EOF
+                copied += n
+        except OSError:
+            if copied:
+                raise
+            # Not supported for these files (EXDEV, EINVAL, ENOSYS, ...)
+            continue
+        return copied
+    return None
+
+def copy_byte_range(src_fp, dst_fp, offset, length, chunk_size=COPY_CHUNK_SIZE):
+    """Copy length bytes of src_fp starting at offset to the current position
+    of dst_fp.
+
+    The position of src_fp is not used so the same src_fp can be shared
+    between threads. The copy is done in-kernel (os.copy_file_range or
+    os.sendfile) when possible, or else in large chunks.
+    Returns the number of bytes copied (less than length at EOF).
+    """
+    src_fd = _fileno(src_fp)
+    dst_fd = _fileno(dst_fp)
+    if src_fd is not None and dst_fd is not None and length:
+        dst_fp.flush()
+        dst_pos = os.lseek(dst_fd, 0, os.SEEK_CUR)
+        copied = _kernel_copy(src_fd, dst_fd, offset, length)
+        if copied is not None:
+            # Keep the buffered file object's position in sync
+            dst_fp.seek(dst_pos + copied)
+            return copied
+    if src_fd is not None:
+        read = lambda count: os.pread(src_fd, count, offset + copied)
+    else:
+        src_fp.seek(offset)
+        read = src_fp.read
+    copied = 0
+    while copied < length:
+        data = read(min(length - copied, chunk_size))
+        if not data:
+            break  # EOF
+        dst_fp.write(data)
+        copied += len(data)
+    return copied
+
+def rip_cue_tracks(tracks, *, bin_file, jobs=None, yes=False, executor=None, track_done=None):
+    """Rip many tracks of the same BIN file.
+
+    tracks is an iterable of (out_file, cue_track, tags) tuples; bin_file is
+    opened only once. WAV tracks are copied directly while tracks that need
+    encoding (FLAC, M4A, ...) are ripped on `jobs` parallel workers, or on
+    the given executor.
+    track_done(out_file, cue_track) is called as each track completes.
+    """
+    tracks = list(tracks)
+    with bin_file.open('r') as bin_fp:
+        encoded_tracks = []
+        for out_file, cue_track, tags in tracks:
+            if isinstance(out_file, WavFile):
+                out_file.rip_cue_track(cue_track, bin_file=bin_file, tags=tags, yes=yes, bin_fp=bin_fp)
+                if track_done is not None:
+                    track_done(out_file, cue_track)
+            else:
+                encoded_tracks.append((out_file, cue_track, tags))
+        if encoded_tracks:
+            with contextlib.ExitStack() as exit_stack:
+                if executor is None:
+                    executor = exit_stack.enter_context(
+                        concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()))
+                futures = {}
+                for out_file, cue_track, tags in encoded_tracks:
+                    future = executor.submit(out_file.rip_cue_track, cue_track,
+                                             bin_file=bin_file, tags=tags, yes=yes, bin_fp=bin_fp)
+                    futures[future] = (out_file, cue_track)
+                # Let all tracks complete before bin_fp is closed
+                first_exception = None
+                for future in concurrent.futures.as_completed(futures):
+                    exception = future.exception()
+                    if exception is not None:
+                        log.error('%s: %s', futures[future][0], exception)
+                        first_exception = first_exception or exception
+                    elif track_done is not None:
+                        track_done(*futures[future])
+                if first_exception is not None:
+                    raise first_exception